@@ -11,10 +11,10 @@ from datetime import datetime, timedelta
 from typing import Any
 
 from config import ADMIN_IDS
-from db_models import Database
-from premium import premium_channel_link_verifiable, premium_link_needs_bind
+from db_models import get_db
+from premium import premium_channel_link_verifiable, premium_link_needs_bind, invalidate_premium_channels
 
-db = Database()
+db = get_db()
 ADMIN_PASSWORD = "123"
 
 
@@ -185,11 +185,11 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
         raw = (text or "").strip()
         if raw.startswith("@"):
             uname = raw[1:].strip()
-            row = db.cursor.execute("SELECT user_id FROM users WHERE username = ?", (uname,)).fetchone()
-            if not row:
+            found_id = db.find_user_id_by_username(uname)
+            if found_id is None:
                 await update.message.reply_text("❌ Користувача не знайдено. Введіть ID або @username.")
                 return True
-            target_id = int(row["user_id"])
+            target_id = int(found_id)
         else:
             try:
                 target_id = int(raw)
@@ -271,8 +271,8 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
             token = token.strip()
             if token.startswith("@"):
                 uname = token[1:]
-                row = db.cursor.execute("SELECT user_id FROM users WHERE username = ?", (uname,)).fetchone()
-                return int(row["user_id"]) if row else None
+                found_id = db.find_user_id_by_username(uname)
+                return int(found_id) if found_id is not None else None
             try:
                 return int(token)
             except Exception:
@@ -334,9 +334,9 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
         user_id = None
         if raw.startswith("@"):
             uname = raw[1:].strip()
-            row = db.cursor.execute("SELECT user_id FROM users WHERE username = ?", (uname,)).fetchone()
-            if row:
-                user_id = int(row["user_id"])
+            found_id = db.find_user_id_by_username(uname)
+            if found_id is not None:
+                user_id = int(found_id)
         else:
             try:
                 user_id = int(raw)
@@ -488,7 +488,8 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return True
 
         db.cursor.execute("DELETE FROM premium_channels WHERE id = ?", (cid,))
-        db.conn.commit()
+        db.commit()
+        invalidate_premium_channels()
         await update.message.reply_text("✅ Канал видалено (якщо існував).")
         return True
 
@@ -523,7 +524,8 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "UPDATE premium_channels SET link = ? WHERE id = ?",
             (new_link, cid),
         )
-        db.conn.commit()
+        db.commit()
+        invalidate_premium_channels()
         if cur.rowcount == 0:
             await update.message.reply_text(
                 f"❌ Запису з id={cid} немає. Відкрийте «🔗 Канали Premium» і подивіться список id."
@@ -593,7 +595,8 @@ async def handle_admin_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
             (link, title),
         )
         new_row_id = int(db.cursor.execute("SELECT last_insert_rowid()").fetchone()[0])
-        db.conn.commit()
+        db.commit()
+        invalidate_premium_channels()
 
         ud["admin_premium_awaiting_title"] = False
         ud.pop("admin_premium_pending_link", None)
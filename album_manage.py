@@ -1,9 +1,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db_models import Database
+from db_models import Database, get_db, get_async_db
 import helpers
 
-db = Database()
+db = get_db()
+adb = get_async_db()
 
 # ========== ВИДАЛЕННЯ ФАЙЛІВ ==========
 
@@ -205,7 +206,7 @@ async def handle_delete_confirmation(update: Update, context: ContextTypes.DEFAU
     
     if update.message.text.strip() == album['name']:
         # Назва співпадає - видаляємо
-        db.delete_album(album_id)
+        await adb.write(Database.delete_album, album_id)
         
         context.user_data['awaiting_album_name_confirm'] = False
         context.user_data.pop('deleting_album', None)
@@ -1,29 +1,24 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import ContextTypes
-from db_models import Database
+import asyncio
+import contextvars
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from telegram import (
+    Update, Message, Chat, User, InlineKeyboardButton, InlineKeyboardMarkup,
+    InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio,
+)
+from telegram.ext import CallbackContext, ContextTypes
+from db_models import get_db
+from keyboards import ALBUM_KEYBOARD
 import helpers
 
 # Глобальний об'єкт БД
-db = Database()
+db = get_db()
 
-# Повна заміна у Файлі 3
-async def send_file_by_type(update: Update, context: ContextTypes.DEFAULT_TYPE, file_data, index=None):
-    """Надсилання файлу за його типом із врахуванням налаштувань відображення"""
-    user_id = update.effective_user.id
-    
-    # Перетворюємо об'єкт БД на звичайний словник для безпечного доступу до ключів
-    try:
-        f_dict = dict(file_data)
-    except Exception:
-        f_dict = file_data
-        
-    file_id = f_dict.get('telegram_file_id')
-    file_type = f_dict.get('file_type')
-    
-    # Отримуємо налаштування користувача
-    settings = helpers.get_user_display_settings(db, user_id)
-    
-    # Формуємо підпис (caption)
+def file_caption(f_dict, index, settings):
+    """Підпис файлу (номер та / або дата) згідно з налаштуваннями відображення"""
     caption_parts = []
     if settings.get('show_number') and index is not None:
         caption_parts.append(f"📄 Файл #{index}")
@@ -38,7 +33,29 @@ async def send_file_by_type(update: Update, context: ContextTypes.DEFAULT_TYPE,
             caption_parts.append(f"📅 {date_str}")
         
     # З'єднуємо частини підпису
-    caption = " | ".join(caption_parts) if caption_parts else None
+    return " | ".join(caption_parts) if caption_parts else None
+
+# Повна заміна у Файлі 3
+async def send_file_by_type(update: Update, context: ContextTypes.DEFAULT_TYPE, file_data, index=None, settings=None):
+    """
+    Надсилання файлу за його типом із врахуванням налаштувань відображення.
+    При надсиланні багатьох файлів settings варто отримати один раз і передавати сюди.
+    """
+    
+    # Перетворюємо об'єкт БД на звичайний словник для безпечного доступу до ключів
+    try:
+        f_dict = dict(file_data)
+    except Exception:
+        f_dict = file_data
+        
+    file_id = f_dict.get('telegram_file_id')
+    file_type = f_dict.get('file_type')
+    
+    # Отримуємо налаштування користувача (якщо не передали)
+    if settings is None:
+        settings = helpers.get_user_display_settings(db, update.effective_user.id)
+    
+    caption = file_caption(f_dict, index, settings)
     
     try:
         if file_type == 'photo':
@@ -57,6 +74,430 @@ async def send_file_by_type(update: Update, context: ContextTypes.DEFAULT_TYPE,
     except Exception as e:
         await update.message.reply_text(f"❌ Помилка надсилання: {e}")
 
+# ========== ПАКЕТНЕ НАДСИЛАННЯ (sendMediaGroup) ==========
+
+# Скільки елементів Telegram приймає в одному sendMediaGroup
+MEDIA_GROUP_LIMIT = 10
+
+# Які типи можна змішувати в одній групі; voice та circle групи не підтримують
+_MEDIA_GROUP_KIND = {'photo': 'visual', 'video': 'visual', 'document': 'document', 'audio': 'audio'}
+_INPUT_MEDIA = {'photo': InputMediaPhoto, 'video': InputMediaVideo, 'document': InputMediaDocument, 'audio': InputMediaAudio}
+
+
+def _media_groups(items):
+    """
+    Розбити [(index, f_dict)] на послідовні пакети: сумісні файли підряд — до MEDIA_GROUP_LIMIT
+    в пакеті, несумісні (voice, circle) — окремими пакетами по одному.
+    """
+    batch, batch_kind = [], None
+    for item in items:
+        kind = _MEDIA_GROUP_KIND.get(item[1].get('file_type'))
+        if batch and (kind is None or kind != batch_kind or len(batch) >= MEDIA_GROUP_LIMIT):
+            yield batch
+            batch = []
+        batch.append(item)
+        batch_kind = kind
+        if kind is None:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ========== СЕРВЕРНЕ КОПІЮВАННЯ (copyMessages) ==========
+
+# Скільки повідомлень Telegram копіює одним copyMessages
+COPY_MESSAGES_LIMIT = 100
+
+
+def _copy_runs(items):
+    """
+    Розбити [(index, f_dict)] на послідовні пакети: файли з оригінальним повідомленням
+    з одного чату зі зростаючими id (вимога copyMessages) — до COPY_MESSAGES_LIMIT в пакеті;
+    файли без оригіналу — окремими пакетами для звичайного надсилання.
+    Повертає (can_copy, batch).
+    """
+    batch, batch_copy = [], None
+    for item in items:
+        f_dict = item[1]
+        can_copy = bool(f_dict.get('origin_chat_id') and f_dict.get('origin_message_id'))
+        if batch and (
+            can_copy != batch_copy
+            or (can_copy and (
+                len(batch) >= COPY_MESSAGES_LIMIT
+                or f_dict['origin_chat_id'] != batch[-1][1]['origin_chat_id']
+                or f_dict['origin_message_id'] <= batch[-1][1]['origin_message_id']
+            ))
+        ):
+            yield batch_copy, batch
+            batch = []
+        batch.append(item)
+        batch_copy = can_copy
+    if batch:
+        yield batch_copy, batch
+
+
+async def _copy_batch(update, context, batch, send_single, settings, missing):
+    """
+    Скопіювати пакет одним copyMessages. Якщо частини оригіналів уже немає (Telegram
+    мовчки їх пропускає) — прибрати часткову копію і ділити пакет навпіл; відсутній
+    файл надсилається за file_id на своєму місці, а його file_id потрапляє в missing.
+    """
+    chat_id = update.effective_chat.id
+    try:
+        copied = await context.bot.copy_messages(
+            chat_id=chat_id,
+            from_chat_id=batch[0][1]['origin_chat_id'],
+            message_ids=[f_dict['origin_message_id'] for _, f_dict in batch],
+            # Підпис автора оригіналу не показуємо — як і при надсиланні за file_id
+            remove_caption=True,
+        )
+    except Exception as e:
+        # Помилка запиту не означає, що оригіналів немає — просто надсилаємо за file_id
+        print(f"❌ Помилка copy_messages, надсилаю за file_id: {e}")
+        await _send_batches(update, context, batch, settings, send_single)
+        return
+
+    if len(copied) == len(batch):
+        return
+    if copied:
+        try:
+            await context.bot.delete_messages(chat_id=chat_id, message_ids=[m.message_id for m in copied])
+        except Exception as e:
+            print(f"❌ Не вдалося прибрати часткову копію: {e}")
+
+    if not copied:
+        # Жоден оригінал не скопіювався — весь пакет за file_id
+        missing.extend(f_dict['file_id'] for _, f_dict in batch)
+        await _send_batches(update, context, batch, settings, send_single)
+        return
+    middle = len(batch) // 2
+    await _copy_batch(update, context, batch[:middle], send_single, settings, missing)
+    await _copy_batch(update, context, batch[middle:], send_single, settings, missing)
+
+
+async def _send_batches(update, context, items, settings, send_single):
+    """Надіслати за file_id: альбомами (group_media) або по одному"""
+    if not settings.get('group_media', True):
+        for index, f_dict in items:
+            await send_single(update, context, f_dict, index=index, settings=settings)
+        return
+
+    for batch in _media_groups(items):
+        if len(batch) > 1:
+            media = [
+                _INPUT_MEDIA[f_dict['file_type']](
+                    media=f_dict['telegram_file_id'], caption=file_caption(f_dict, index, settings)
+                )
+                for index, f_dict in batch
+            ]
+            try:
+                await context.bot.send_media_group(chat_id=update.effective_chat.id, media=media)
+                continue
+            except Exception as e:
+                print(f"❌ Помилка send_media_group, надсилаю по одному: {e}")
+        for index, f_dict in batch:
+            await send_single(update, context, f_dict, index=index, settings=settings)
+
+
+async def send_files(update: Update, context: ContextTypes.DEFAULT_TYPE, files, settings=None, start_index=None, send_single=None):
+    """
+    Надіслати кілька файлів. Номер кожного — його ordinal (або start_index + зсув).
+    Без підписів (номер і дата вимкнені) файли з відомим оригінальним повідомленням
+    копіюються на сервері Telegram через copy_messages пакетами до 100.
+    Решта: якщо увімкнено group_media (за замовчуванням) — сумісні файли йдуть
+    альбомами через send_media_group, інакше / при помилці — по одному через send_single.
+    """
+    if settings is None:
+        settings = helpers.get_user_display_settings(db, update.effective_user.id)
+    send_single = send_single or send_file_by_type
+
+    items = []
+    for offset, file in enumerate(files):
+        f_dict = dict(file)
+        index = f_dict.get('ordinal')
+        if index is None and start_index is not None:
+            index = start_index + offset
+        items.append((index, f_dict))
+
+    # copy_messages не вміє задавати власний підпис кожному файлу, а дописувати підписи
+    # окремим edit_message_caption на кожен файл — це знову запит на файл. Тому з номером
+    # чи датою (за замовчуванням увімкнені обидва) копіювання не використовується:
+    # воно працює лише для тих, хто вимкнув обидва підписи в налаштуваннях.
+    if settings.get('show_number') or settings.get('show_date'):
+        await _send_batches(update, context, items, settings, send_single)
+        return
+
+    missing = []
+    for can_copy, batch in _copy_runs(items):
+        if can_copy:
+            await _copy_batch(update, context, batch, send_single, settings, missing)
+        else:
+            await _send_batches(update, context, batch, settings, send_single)
+    if missing:
+        try:
+            db.clear_file_origins(missing)
+        except Exception as e:
+            print(f"❌ Помилка очищення оригіналів: {e}")
+
+# ========== ФОНОВІ ЗАВДАННЯ НАДСИЛАННЯ ==========
+# Кожне завдання записане в send_jobs зі списком file_id і контрольною точкою
+# (скільки з них доставлено), тож після перезапуску бота надсилання продовжується з неї.
+
+# Скільки файлів надсилати між перевірками скасування
+SEND_JOB_CHUNK = 20
+# Контрольну точку пишемо в БД не рідше, ніж раз на стільки доставлених файлів
+SEND_JOB_CHECKPOINT_EVERY = 100
+# Повідомлення з прогресом редагуємо не частіше, ніж раз на стільки секунд
+PROGRESS_EDIT_INTERVAL = 5
+# Скільки завдань користувача може чекати в черзі (крім того, що виконується)
+SEND_JOB_QUEUE_LIMIT = 2
+
+# Надсилання одного файлу за назвою (назва зберігається в send_jobs.sender);
+# shared_albums додає сюди 'shared'
+SENDERS = {'album': send_file_by_type}
+
+
+class SendJob:
+    """Одне пакетне надсилання: файли, прогрес, контрольна точка і кнопка скасування"""
+
+    def __init__(self, job_id, update, context, files, title, settings, sender='album',
+                 start_index=None, done_text=None, done_markup=None, message=None, sent=0):
+        self.job_id = job_id
+        self.update = update
+        self.context = context
+        self.user_id = update.effective_user.id
+        self.chat_id = update.effective_chat.id
+        self.files = [dict(f) for f in files]
+        self.title = title
+        self.settings = settings
+        self.send_single = SENDERS[sender]
+        self.start_index = start_index
+        self.done_text = done_text
+        self.done_markup = done_markup
+        self.message = message
+        # files — ще не надіслані файли; sent — скільки зі списку завдання доставлено до перезапуску
+        self.resumed = sent
+        self.sent = sent
+        self.started = False
+        self.cancelled = False
+        self._last_edit = 0.0
+
+    def _cancel_markup(self):
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("⛔ Скасувати", callback_data=f"sendjob_cancel_{self.job_id}")
+        ]])
+
+    async def show(self, text, with_cancel=True):
+        """Створити або відредагувати повідомлення з прогресом"""
+        markup = self._cancel_markup() if with_cancel else None
+        self._last_edit = time.monotonic()
+        try:
+            if self.message is None:
+                self.message = await self.context.bot.send_message(chat_id=self.chat_id, text=text, reply_markup=markup)
+            else:
+                await self.message.edit_text(text, reply_markup=markup)
+        except Exception as e:
+            print(f"❌ Помилка оновлення прогресу: {e}")
+
+    def _checkpoint(self):
+        message_id = self.message.message_id if self.message is not None else None
+        db.checkpoint_send_job(self.job_id, self.sent, message_id)
+
+    async def run(self):
+        self.started = True
+        total = self.resumed + len(self.files)
+        if self.sent:
+            await self.show(f"{self.title}\n🔄 Продовжую після перезапуску: {self.sent} / {total}")
+        else:
+            await self.show(f"{self.title}\n▶️ 0 / {total}")
+        self._checkpoint()
+        checkpointed = self.sent
+
+        for offset in range(0, len(self.files), SEND_JOB_CHUNK):
+            if self.cancelled:
+                break
+            chunk = self.files[offset:offset + SEND_JOB_CHUNK]
+            await send_files(
+                self.update, self.context, chunk, settings=self.settings,
+                start_index=self.start_index + offset if self.start_index is not None else None,
+                send_single=self.send_single
+            )
+            self.sent += len(chunk)
+            if self.sent - checkpointed >= SEND_JOB_CHECKPOINT_EVERY:
+                self._checkpoint()
+                checkpointed = self.sent
+            if self.sent < total and time.monotonic() - self._last_edit >= PROGRESS_EDIT_INTERVAL:
+                await self.show(f"{self.title}\n▶️ {self.sent} / {total}")
+
+        db.finish_send_job(self.job_id)
+        if self.cancelled:
+            await self.show(f"⛔ Надсилання скасовано: надіслано {self.sent} з {total}.", with_cancel=False)
+            return
+        await self.show(f"{self.title}\n✅ {total} / {total}", with_cancel=False)
+        if self.done_text:
+            await self.context.bot.send_message(chat_id=self.chat_id, text=self.done_text, reply_markup=self.done_markup)
+
+
+class SendJobRunner:
+    """
+    Фонові пакетні надсилання: обробник лише ставить завдання в чергу і повертається.
+    На користувача — одне активне завдання і до queue_limit у черзі.
+    """
+
+    def __init__(self, queue_limit=SEND_JOB_QUEUE_LIMIT):
+        self.queue_limit = queue_limit
+        self._queues = {}   # user_id -> deque[SendJob]
+        self._running = {}  # user_id -> SendJob
+        self._tasks = {}    # user_id -> asyncio.Task
+        self._jobs = {}     # job_id -> SendJob
+
+    async def submit(self, update, context, files, title, settings=None, sender='album', start_index=None,
+                     done_text="✅ Готово!", done_markup=None, message=None):
+        """
+        Поставити надсилання в чергу; None — якщо черга користувача заповнена.
+        files — файли одного альбому в порядку надсилання.
+        """
+        user_id = update.effective_user.id
+        active = len(self._queues.get(user_id, ())) + (user_id in self._running)
+        if active > self.queue_limit:
+            await update.effective_message.reply_text(
+                "⏳ У вас уже є активне надсилання і повна черга. Дочекайтесь завершення або скасуйте."
+            )
+            return None
+
+        if settings is None:
+            settings = helpers.get_user_display_settings(db, user_id)
+        job_id = db.create_send_job(
+            user_id, update.effective_chat.id, files[0]['album_id'], [f['file_id'] for f in files],
+            sender=sender, title=title, done_text=done_text, start_index=start_index
+        )
+        job = SendJob(
+            job_id, update, context, files, title, settings, sender=sender, start_index=start_index,
+            done_text=done_text, done_markup=done_markup, message=message
+        )
+        if active:
+            await job.show(f"{title}\n🕒 У черзі: {active}-е після поточного")
+        self.enqueue(job)
+        return job
+
+    def enqueue(self, job):
+        """Додати завдання до черги користувача (без перевірки ліміту — для відновлених)"""
+        self._jobs[job.job_id] = job
+        self._queues.setdefault(job.user_id, deque()).append(job)
+        if job.user_id not in self._tasks:
+            # Завдання живе довше за обробник, тому запускається поза його unit of work
+            self._tasks[job.user_id] = contextvars.Context().run(asyncio.create_task, self._drain(job.user_id))
+
+    async def _drain(self, user_id):
+        queue = self._queues[user_id]
+        try:
+            while queue:
+                job = queue.popleft()
+                self._running[user_id] = job
+                try:
+                    await job.run()
+                except Exception as e:
+                    # Помилка (не зупинка бота) — не відновлюємо, щоб не повторювати її після перезапуску
+                    print(f"❌ Помилка фонового надсилання: {e}")
+                    db.finish_send_job(job.job_id)
+                    await job.show(f"❌ Помилка надсилання: {e}", with_cancel=False)
+                finally:
+                    self._running.pop(user_id, None)
+                    self._jobs.pop(job.job_id, None)
+        finally:
+            self._tasks.pop(user_id, None)
+            self._queues.pop(user_id, None)
+
+    def cancel(self, job_id, user_id):
+        """Скасувати завдання користувача; повертає SendJob або None"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        job.cancelled = True
+        queue = self._queues.get(user_id)
+        if queue and job in queue:
+            queue.remove(job)
+            self._jobs.pop(job_id, None)
+            db.finish_send_job(job_id)
+        return job
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "queued": sum(len(q) for q in self._queues.values()),
+        }
+
+
+send_jobs = SendJobRunner()
+
+
+async def handle_send_job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка «⛔ Скасувати» під прогресом надсилання"""
+    query = update.callback_query
+    job_id = int(query.data.split('_')[2])
+    job = send_jobs.cancel(job_id, update.effective_user.id)
+    if job is None:
+        await query.answer("Це надсилання вже завершено.")
+        return
+    await query.answer("⛔ Скасовую...")
+    if not job.started:
+        await job.show("⛔ Надсилання скасовано.", with_cancel=False)
+
+
+def _chat_update(bot, chat_id, user_id):
+    """
+    Update без вхідного повідомлення — для відновлених завдань: відповіді
+    (update.message.reply_*) йдуть у чат chat_id. Надсилання бувають лише в особистих
+    чатах, тож тип чату — private (reply_* тоді не цитує повідомлення).
+    """
+    message = Message(
+        message_id=0,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type=Chat.PRIVATE),
+        from_user=User(id=user_id, first_name="", is_bot=False),
+    )
+    message.set_bot(bot)
+    return Update(update_id=0, message=message)
+
+
+async def resume_send_jobs(application):
+    """Після перезапуску продовжити незавершені надсилання з контрольних точок"""
+    resumed = 0
+    for row in db.get_unfinished_send_jobs():
+        try:
+            sent = row['sent_count']
+            start_index = row['start_index']
+            # Недоставлені файли зі списку; видалені після старту просто пропускаються
+            files = db.get_files_by_ids(json.loads(row['file_ids'])[sent:])
+            if start_index is not None:
+                # Номер = start_index + місце у списку завдання, а не позиція в альбомі
+                files = [{k: v for k, v in dict(f).items() if k != 'ordinal'} for f in files]
+                start_index += sent
+            if not files or row['sender'] not in SENDERS:
+                # Альбом видалено або файлів уже немає
+                db.finish_send_job(row['job_id'])
+                continue
+
+            update = _chat_update(application.bot, row['chat_id'], row['user_id'])
+            message = None
+            if row['progress_message_id']:
+                message = Message(message_id=row['progress_message_id'], date=update.message.date, chat=update.message.chat)
+                message.set_bot(application.bot)
+            job = SendJob(
+                row['job_id'], update, CallbackContext(application), files, row['title'],
+                helpers.get_user_display_settings(db, row['user_id']), sender=row['sender'],
+                start_index=start_index, done_text=row['done_text'], message=message, sent=sent
+            )
+            send_jobs.enqueue(job)
+            resumed += 1
+        except Exception as e:
+            print(f"❌ Не вдалося відновити надсилання #{row['job_id']}: {e}")
+            db.finish_send_job(row['job_id'])
+    if resumed:
+        print(f"🔄 Відновлено незавершених надсилань: {resumed}")
+
+
 # ========== НАДІСЛАТИ ВСІ ФАЙЛИ ==========
 
 async def send_all_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -77,17 +518,14 @@ async def send_all_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    await query.edit_message_text(f"📤 Надсилаю всі {len(files)} файлів з альбому '{album['name']}'...")
-    
-    # Замість: for file in files: await send_file_by_type(update, context, file)
-    # Замість: for file in files: await send_file_by_type(update, context, file)
-    for idx, file in enumerate(files, 1):
-        await send_file_by_type(update, context, file, index=idx)
-
+    # Надсилання йде у фоні; повідомлення меню стає повідомленням з прогресом
     keyboard = [[InlineKeyboardButton("◀️ До альбому", callback_data=f"open_album_{album_id}")]]
-    await query.message.reply_text(
-        "✅ Готово!",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+    await send_jobs.submit(
+        update, context, files,
+        f"📤 Надсилаю всі {len(files)} файлів з альбому '{album['name']}'...",
+        start_index=1,
+        done_markup=InlineKeyboardMarkup(keyboard),
+        message=query.message
     )
 
 # ========== НАДІСЛАТИ ОСТАННІ ==========
@@ -127,36 +565,22 @@ async def handle_recent_count(update: Update, context: ContextTypes.DEFAULT_TYPE
             return True
         
         album_id = context.user_data.get('send_recent_album')
-        all_files = db.get_album_files(album_id)
-        
-        if not all_files:
-            await update.message.reply_text("📭 В альбомі немає файлів.")
-        else:
-            total_count = len(all_files)
-            # Вираховуємо, з якого індексу починаються "останні" файли
-            start_index = max(0, total_count - count)
-            files_to_send = all_files[start_index:]
-            
-            album = db.get_album(album_id)
-            await update.message.reply_text(f"📤 Надсилаю останні {len(files_to_send)} файлів з альбому '{album['name']}'...")
-            
-            # ВИПРАВЛЕНО: передаємо реальний індекс файлу в альбомі (починаючи з start_index + 1)
-            for i, file in enumerate(files_to_send, start=start_index + 1):
-                await send_file_by_type(update, context, file, index=i)
+        # Беремо з БД лише потрібне вікно; кожен рядок уже має свій номер в альбомі
+        files_to_send = db.get_last_files(album_id, count)
         
         # Очищаємо стан
         context.user_data['awaiting_recent_count'] = False
         context.user_data.pop('send_recent_album', None)
         
-        album_keyboard = ReplyKeyboardMarkup([
-            [KeyboardButton("📤 Надіслати весь альбом")],
-            [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-            [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-            [KeyboardButton("⋯ Додаткові дії")],
-            [KeyboardButton("◀️ Вийти з альбому")]
-        ], resize_keyboard=True)
-        
-        await update.message.reply_text("✅ Готово!", reply_markup=album_keyboard)
+        if not files_to_send:
+            await update.message.reply_text("📭 В альбомі немає файлів.", reply_markup=ALBUM_KEYBOARD)
+        else:
+            album = db.get_album(album_id)
+            await send_jobs.submit(
+                update, context, files_to_send,
+                f"📤 Надсилаю останні {len(files_to_send)} файлів з альбому '{album['name']}'...",
+                done_markup=ALBUM_KEYBOARD
+            )
         return True
         
     except ValueError:
@@ -174,8 +598,8 @@ async def send_by_date_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     context.user_data['send_date_album'] = album_id
     
     await query.edit_message_text(
-        "📅 Введіть дату у форматі РРРР-ММ-ДД\n"
-        "Наприклад: 2024-01-31",
+        "📅 Введіть дату у форматі РРРР-ММ-ДД або проміжок РРРР-ММ-ДД - РРРР-ММ-ДД\n"
+        "Наприклад: 2024-01-31 або 2024-01-01 - 2024-01-31",
         reply_markup=InlineKeyboardMarkup([[
             InlineKeyboardButton("◀️ Назад", callback_data=f"open_album_{album_id}")
         ]])
@@ -191,51 +615,38 @@ async def handle_date_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.user_data.get('awaiting_date'):
         return False
     
-    date_str = update.message.text
     album_id = context.user_data.get('send_date_album')
     
     if not album_id:
         return False
     
     try:
-        from datetime import datetime
-        # Перевіряємо формат дати
-        datetime.strptime(date_str, '%Y-%m-%d')
+        # Дата або проміжок дат (РРРР-ММ-ДД - РРРР-ММ-ДД)
+        date_from, date_to = helpers.parse_date_range(update.message.text)
+        date_str = helpers.date_range_label(date_from, date_to)
         
-        files = db.get_files_by_date(album_id, date_str)
+        files = db.get_files_by_date(album_id, date_from, date_to)
         album = db.get_album(album_id)
         
-        if not files:
-            await update.message.reply_text(f"📭 Немає файлів за {date_str}")
-        else:
-            await update.message.reply_text(f"📤 Надсилаю {len(files)} файлів за {date_str} з альбому '{album['name']}'...")
-            
-            # ВИПРАВЛЕНО: Додано enumerate для передачі номера файлу
-            for idx, file in enumerate(files, 1):
-                await send_file_by_type(update, context, file, index=idx)
-        
         # Очищаємо стан
         context.user_data['awaiting_date'] = False
         context.user_data.pop('send_date_album', None)
         
-        # Повертаємо клавіатуру альбому
-        album_keyboard = ReplyKeyboardMarkup([
-            [KeyboardButton("📤 Надіслати весь альбом")],
-            [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-            [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-            [KeyboardButton("⋯ Додаткові дії")],
-            [KeyboardButton("◀️ Вийти з альбому")]
-        ], resize_keyboard=True)
-        
-        await update.message.reply_text(
-            "✅ Готово!",
-            reply_markup=album_keyboard
-        )
+        if not files:
+            # Повертаємо клавіатуру альбому
+            await update.message.reply_text(f"📭 Немає файлів за {date_str}", reply_markup=ALBUM_KEYBOARD)
+        else:
+            # Номер файлу — його позиція в усьому альбомі
+            await send_jobs.submit(
+                update, context, files,
+                f"📤 Надсилаю {len(files)} файлів за {date_str} з альбому '{album['name']}'...",
+                done_markup=ALBUM_KEYBOARD
+            )
         return True
         
     except ValueError:
         await update.message.reply_text(
-            "❌ Невірний формат. Введіть дату як РРРР-ММ-ДД\n"
+            "❌ Невірний формат. Введіть дату як РРРР-ММ-ДД або РРРР-ММ-ДД - РРРР-ММ-ДД\n"
             "Наприклад: 2024-01-31"
         )
         return True
@@ -253,33 +664,20 @@ async def handle_first_count(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return True
         
         album_id = context.user_data.get('send_first_album')
-        all_files = db.get_album_files(album_id)
-        
-        # Беремо перші файли з початку масиву
-        files = all_files[:count] if all_files else []
+        files = db.get_first_files(album_id, count)
         album = db.get_album(album_id)
         
-        if not files:
-            await update.message.reply_text("📭 В альбомі немає файлів.")
-        else:
-            await update.message.reply_text(f"📤 Надсилаю перші {len(files)} файлів з альбому '{album['name']}'...")
-            
-            # ВИПРАВЛЕНО: Додано enumerate
-            for idx, file in enumerate(files, 1):
-                await send_file_by_type(update, context, file, index=idx)
-        
         context.user_data['awaiting_first_count'] = False
         context.user_data.pop('send_first_album', None)
         
-        album_keyboard = ReplyKeyboardMarkup([
-            [KeyboardButton("📤 Надіслати весь альбом")],
-            [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-            [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-            [KeyboardButton("⋯ Додаткові дії")],
-            [KeyboardButton("◀️ Вийти з альбому")]
-        ], resize_keyboard=True)
-        
-        await update.message.reply_text("✅ Готово!", reply_markup=album_keyboard)
+        if not files:
+            await update.message.reply_text("📭 В альбомі немає файлів.", reply_markup=ALBUM_KEYBOARD)
+        else:
+            await send_jobs.submit(
+                update, context, files,
+                f"📤 Надсилаю перші {len(files)} файлів з альбому '{album['name']}'...",
+                done_markup=ALBUM_KEYBOARD
+            )
         return True
     except ValueError:
         await update.message.reply_text("❌ Будь ласка, введіть число:")
@@ -302,8 +700,7 @@ async def handle_range_input_normal(update: Update, context: ContextTypes.DEFAUL
             return True
         
         album_id = context.user_data.get('send_range_album')
-        all_files = db.get_album_files(album_id)
-        total_files = len(all_files) if all_files else 0
+        total_files = db.count_album_files(album_id)
         
         if start > total_files:
             await update.message.reply_text(f"❌ Початкове число більше загальної кількості ({total_files})")
@@ -312,27 +709,17 @@ async def handle_range_input_normal(update: Update, context: ContextTypes.DEFAUL
             end = total_files
             await update.message.reply_text(f"⚠️ Кінцеве число скориговано до {total_files}")
             
-        files = all_files[start-1:end]
+        files = db.get_files_range(album_id, start, end)
         album = db.get_album(album_id)
         
-        await update.message.reply_text(f"📤 Надсилаю файли з {start} по {end} з альбому '{album['name']}'...")
-        
-        # ВИПРАВЛЕНО: Додано enumerate, старт з потрібного номера
-        for idx, file in enumerate(files, start=start):
-            await send_file_by_type(update, context, file, index=idx)
-            
         context.user_data['awaiting_range'] = False
         context.user_data.pop('send_range_album', None)
         
-        album_keyboard = ReplyKeyboardMarkup([
-            [KeyboardButton("📤 Надіслати весь альбом")],
-            [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-            [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-            [KeyboardButton("⋯ Додаткові дії")],
-            [KeyboardButton("◀️ Вийти з альбому")]
-        ], resize_keyboard=True)
-        
-        await update.message.reply_text("✅ Готово!", reply_markup=album_keyboard)
+        await send_jobs.submit(
+            update, context, files,
+            f"📤 Надсилаю файли з {start} по {end} з альбому '{album['name']}'...",
+            done_markup=ALBUM_KEYBOARD
+        )
         return True
     except ValueError:
         await update.message.reply_text("❌ Невірний формат. Введіть числа через дефіс:")
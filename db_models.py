@@ -1,186 +1,842 @@
 import sqlite3
 import json
-from datetime import datetime
+import array
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from config import DATABASE_NAME
+from cache import LRUCache
+import migrations
+
+# Скільки мс SQLite чекає на зняття блокування, перш ніж кинути "database is locked"
+BUSY_TIMEOUT_MS = 5000
+# Кількість потоків-читачів для AsyncDatabase
+READER_THREADS = 3
+# Черга прийому файлів: скільки мс накопичувати записи і максимальний розмір пакета
+INGEST_FLUSH_MS = 20
+INGEST_BATCH_LIMIT = 200
+# Звірка лічильників: скільки альбомів/папок перевіряти за один прохід і як часто (сек)
+RECONCILE_BATCH = 200
+RECONCILE_INTERVAL_S = 60
+# Як часто (сек) знімати прострочені Premium
+PREMIUM_EXPIRY_INTERVAL_S = 60
+# Скільки рядків albums тримати в LRU-кеші get_album
+ALBUM_CACHE_SIZE = 1024
+# Скільки спільних альбомів/папок тримати в кеші прав доступу
+ACL_CACHE_SIZE = 2048
+# Скільки файлів сумарно тримати в індексах відкритих альбомів
+ALBUM_INDEX_MAX_FILES = 200_000
+
+
+class ConnectionManager:
+    """
+    Єдиний на процес власник підключень до SQLite.
+    Налаштовує WAL та busy_timeout; кожен потік (event loop, потік-письменник)
+    отримує власне підключення — одне sqlite3-підключення ніколи не використовується
+    з двох потоків одночасно, а записи різних потоків серіалізує блокування SQLite.
+    """
+
+    def __init__(self, path: str = DATABASE_NAME, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections = []
+        self._idle = []
+        self._setup = []
+        self._lock = threading.Lock()
+
+    def open_connection(self) -> sqlite3.Connection:
+        """Відкрити нове підключення з усіма потрібними PRAGMA"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row  # Дозволяє звертатись по назві колонок
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # Включаємо підтримку зовнішніх ключів
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def open_write_connection(self) -> sqlite3.Connection:
+        """Нове підключення для записів: з налаштуваннями add_setup, закривається в close()"""
+        conn = self.open_connection()
+        with self._lock:
+            for setup in self._setup:
+                setup(conn)
+            self._connections.append(conn)
+        return conn
+
+    def add_setup(self, setup):
+        """Зареєструвати setup(conn) для кожного підключення на запис (і вже відкритих теж)"""
+        with self._lock:
+            self._setup.append(setup)
+            for conn in self._connections:
+                setup(conn)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Підключення поточного потоку (відкривається ліниво при першому зверненні)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.open_write_connection()
+        return conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """Новий курсор на одну операцію"""
+        return self.conn.cursor()
+
+    def acquire(self) -> sqlite3.Connection:
+        """Підключення з пулу (для unit of work); повертається через release()"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.open_write_connection()
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self):
+        with self._lock:
+            self._idle.clear()
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def _day_bounds(date_from: str, date_to: str | None = None) -> tuple[str, str]:
+    """
+    Напіввідкритий інтервал [00:00 date_from, 00:00 дня після date_to) у форматі CURRENT_TIMESTAMP.
+    Умова `col >= ? AND col < ?` йде по індексу, на відміну від DATE(col) = DATE(?).
+    """
+    start = datetime.strptime(date_from, "%Y-%m-%d")
+    end = datetime.strptime(date_to or date_from, "%Y-%m-%d") + timedelta(days=1)
+    return start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class PremiumIndex:
+    """
+    Premium-статуси в пам'яті: user_id -> термін дії (epoch, int; None — безстроково)
+    та мін-купа найближчих закінчень. Завантажується з users при старті,
+    далі оновлюється з set_premium / remove_premium.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._heap = []  # (epoch, user_id); застарілі записи пропускаються ліниво
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_epoch(premium_until):
+        """'YYYY-MM-DD HH:MM:SS' -> epoch; ValueError для пошкодженої дати"""
+        return int(datetime.strptime(premium_until, "%Y-%m-%d %H:%M:%S").timestamp())
+
+    def load(self, conn: sqlite3.Connection):
+        """Перечитати всі активні Premium з БД"""
+        rows = conn.execute("SELECT user_id, premium_until FROM users WHERE is_premium = 1").fetchall()
+        expiry = {}
+        for row in rows:
+            if not row["premium_until"]:
+                expiry[row["user_id"]] = None
+                continue
+            try:
+                expiry[row["user_id"]] = self._to_epoch(row["premium_until"])
+            except (TypeError, ValueError):
+                # пошкоджена дата — преміум вважаємо неактивним (як і раніше)
+                continue
+        heap = [(epoch, uid) for uid, epoch in expiry.items() if epoch is not None]
+        heapq.heapify(heap)
+        with self._lock:
+            self._expiry, self._heap, self._loaded = expiry, heap, True
+
+    def ensure_loaded(self, conn: sqlite3.Connection):
+        if not self._loaded:
+            self.load(conn)
+
+    def invalidate(self):
+        """Позначити індекс застарілим (напр. після rollback) — перечитається при наступній перевірці"""
+        self._loaded = False
+
+    def set(self, user_id, premium_until=None):
+        try:
+            epoch = self._to_epoch(premium_until) if premium_until else None
+        except (TypeError, ValueError):
+            self.discard(user_id)
+            return
+        with self._lock:
+            self._expiry[user_id] = epoch
+            if epoch is not None:
+                heapq.heappush(self._heap, (epoch, user_id))
+
+    def discard(self, user_id):
+        with self._lock:
+            self._expiry.pop(user_id, None)
+
+    def is_active(self, user_id, now=None):
+        """Чи є в користувача чинний Premium (лише пошук у словнику)"""
+        if user_id not in self._expiry:
+            return False
+        epoch = self._expiry.get(user_id)
+        return epoch is None or epoch >= (now if now is not None else time.time())
+
+    def active_user_ids(self, now=None):
+        now = now if now is not None else time.time()
+        return [uid for uid, epoch in list(self._expiry.items()) if epoch is None or epoch >= now]
+
+    def pop_expired(self, now=None):
+        """Забрати з купи користувачів, у яких Premium уже закінчився"""
+        now = now if now is not None else time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] < now:
+                epoch, uid = heapq.heappop(self._heap)
+                if self._expiry.get(uid, -1) == epoch:
+                    expired.append(uid)
+        return expired
+
+
+_premium_index = PremiumIndex()
+
+
+def get_premium_index() -> PremiumIndex:
+    """Індекс Premium-статусів на весь процес"""
+    return _premium_index
+
+
+def normalize_username(username):
+    """'@Some_Name ' -> 'some_name' (None, якщо username немає)"""
+    if not username:
+        return None
+    username = str(username).strip().lstrip("@").strip().lower()
+    return username or None
+
+
+class UsernameDirectory:
+    """
+    Довідник користувачів у пам'яті: username (нижній регістр) -> user_id
+    та останні відомі (username, first_name, last_name) кожного user_id,
+    щоб писати в БД лише тоді, коли щось змінилось.
+    """
 
-class Database:
     def __init__(self):
-        self.conn = None
-        self.cursor = None
-        self.connect()
+        self._by_username = {}
+        self._names = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self, conn: sqlite3.Connection):
+        rows = conn.execute("SELECT user_id, username, first_name, last_name FROM users").fetchall()
+        by_username, names = {}, {}
+        for row in rows:
+            names[row["user_id"]] = (row["username"], row["first_name"], row["last_name"])
+            key = normalize_username(row["username"])
+            if key:
+                by_username[key] = row["user_id"]
+        with self._lock:
+            self._by_username, self._names, self._loaded = by_username, names, True
+
+    def ensure_loaded(self, conn: sqlite3.Connection):
+        if not self._loaded:
+            self.load(conn)
+
+    def invalidate(self):
+        self._loaded = False
+
+    def lookup(self, username):
+        return self._by_username.get(normalize_username(username))
+
+    def known_names(self, user_id):
+        return self._names.get(user_id)
+
+    def put(self, user_id, username, first_name, last_name, registered=True):
+        """Запам'ятати імена; registered=False — користувача немає в users (лише не перевіряти щоразу)"""
+        with self._lock:
+            old = self._names.get(user_id)
+            old_key = normalize_username(old[0]) if old else None
+            if old_key and self._by_username.get(old_key) == user_id:
+                del self._by_username[old_key]
+            self._names[user_id] = (username, first_name, last_name)
+            key = normalize_username(username)
+            if registered and key:
+                self._by_username[key] = user_id
+
+
+_username_directory = UsernameDirectory()
+
+
+# Кеш рядків albums (get_album). Кожен метод Database, що змінює альбом або його файли,
+# викидає запис через _evict_album (одразу і ще раз після commit unit of work);
+# після rollback кеш очищається повністю.
+_album_cache = LRUCache(ALBUM_CACHE_SIZE)
+
+
+def album_cache_stats() -> dict:
+    """Статистика кешу альбомів (hits / misses / hit_rate / size)"""
+    return _album_cache.stats()
+
+
+def _drop_album(album_id):
+    try:
+        _album_cache.pop(int(album_id))
+    except (TypeError, ValueError):
+        pass
+
+
+def _evict_album(album_id):
+    _drop_album(album_id)
+    _on_commit(_drop_album, album_id)
+
+
+# ========== ІНДЕКС ФАЙЛІВ ВІДКРИТИХ АЛЬБОМІВ ==========
+
+FILE_TYPES = ('photo', 'video', 'document', 'audio', 'voice', 'circle')
+_FILE_TYPE_CODES = {name: code for code, name in enumerate(FILE_TYPES)}
+
+
+_EPOCH = datetime(1970, 1, 1)
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _timestamp_seconds(value) -> int:
+    """added_at (формат CURRENT_TIMESTAMP) -> секунди від епохи; -1 — невідомо"""
+    try:
+        return int((datetime.strptime(str(value)[:19], _TIMESTAMP_FORMAT) - _EPOCH).total_seconds())
+    except ValueError:
+        return -1
+
+
+class AlbumFileIndex:
+    """
+    Компактний список файлів альбому в порядку position: паралельні масиви
+    file_id, коду типу, розміру, автора, часу додавання (секунди від епохи)
+    та оригінального повідомлення (чат / id, 0 — невідомо) замість sqlite3.Row.
+    telegram_file_id та file_name — рядки, тому зберігаються кортежами.
+    """
+
+    __slots__ = ("album_id", "file_ids", "type_codes", "added_at", "telegram_ids", "file_names",
+                 "file_sizes", "added_by", "origin_chats", "origin_messages")
+
+    def __init__(self, album_id, rows):
+        self.album_id = album_id
+        self.file_ids = array.array('q')
+        self.type_codes = array.array('b')
+        self.added_at = array.array('q')
+        self.file_sizes = array.array('q')
+        self.added_by = array.array('q')
+        self.origin_chats = array.array('q')
+        self.origin_messages = array.array('q')
+        telegram_ids = []
+        file_names = []
+        for row in rows:
+            self.file_ids.append(row['file_id'])
+            self.type_codes.append(_FILE_TYPE_CODES.get(row['file_type'], -1))
+            self.added_at.append(_timestamp_seconds(row['added_at']) if row['added_at'] else -1)
+            self.file_sizes.append(-1 if row['file_size'] is None else row['file_size'])
+            self.added_by.append(row['added_by'] or 0)
+            self.origin_chats.append(row['origin_chat_id'] or 0)
+            self.origin_messages.append(row['origin_message_id'] or 0)
+            telegram_ids.append(row['telegram_file_id'])
+            file_names.append(row['file_name'])
+        self.telegram_ids = tuple(telegram_ids)
+        self.file_names = tuple(file_names)
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def row(self, i) -> dict:
+        """Файл з індексом i (з 0) у вигляді словника з усіма колонками рядка files"""
+        code = self.type_codes[i]
+        added_at = self.added_at[i]
+        file_size = self.file_sizes[i]
+        return {
+            'file_id': self.file_ids[i],
+            'album_id': self.album_id,
+            'telegram_file_id': self.telegram_ids[i],
+            'file_type': FILE_TYPES[code] if code >= 0 else None,
+            'file_name': self.file_names[i],
+            'file_size': file_size if file_size >= 0 else None,
+            'added_at': (_EPOCH + timedelta(seconds=added_at)).strftime(_TIMESTAMP_FORMAT) if added_at >= 0 else None,
+            'added_by': self.added_by[i] or None,
+            'position': i + 1,
+            'ordinal': i + 1,
+            'origin_chat_id': self.origin_chats[i] or None,
+            'origin_message_id': self.origin_messages[i] or None,
+        }
+
+    def rows(self, start: int, end: int) -> list:
+        """Файли з номерами start..end включно (нумерація з 1)"""
+        start, end = max(start, 1), min(end, len(self))
+        return [self.row(i) for i in range(start - 1, end)]
+
+    def rows_by_days(self, day_from: int, day_to: int) -> list:
+        """Файли, додані з дня day_from по day_to включно (date.toordinal)"""
+        lo = (day_from - _EPOCH.toordinal()) * 86400
+        hi = (day_to + 1 - _EPOCH.toordinal()) * 86400
+        return [self.row(i) for i, added_at in enumerate(self.added_at) if lo <= added_at < hi]
+
+
+class AlbumIndexCache:
+    """
+    Індекси відкритих альбомів (album_id -> AlbumFileIndex) з LRU-витісненням.
+    Ліміт — сумарна кількість файлів у всіх індексах, а не кількість альбомів.
+    """
+
+    def __init__(self, max_files: int):
+        self.max_files = max_files
+        self._data = OrderedDict()
+        self._files = 0
+        # Зростає при кожному pop/clear: індекс, побудований до інвалідації, не потрапить у кеш
+        self.generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, album_id):
+        with self._lock:
+            index = self._data.get(album_id)
+            if index is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(album_id)
+            self.hits += 1
+            return index
+
+    def put(self, index: AlbumFileIndex, generation: int):
+        if len(index) > self.max_files:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            old = self._data.pop(index.album_id, None)
+            if old is not None:
+                self._files -= len(old)
+            self._data[index.album_id] = index
+            self._files += len(index)
+            while self._files > self.max_files:
+                _, evicted = self._data.popitem(last=False)
+                self._files -= len(evicted)
+
+    def pop(self, album_id):
+        with self._lock:
+            self.generation += 1
+            old = self._data.pop(album_id, None)
+            if old is not None:
+                self._files -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._files = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "albums": len(self._data),
+            "files": self._files,
+            "max_files": self.max_files,
+        }
+
+
+# Індекс будується при відкритті альбому (open_album_index); завантаження та видалення
+# файлів викидають його через _evict_album_files, rollback — очищає повністю.
+_album_index_cache = AlbumIndexCache(ALBUM_INDEX_MAX_FILES)
+
+
+def album_index_stats() -> dict:
+    return _album_index_cache.stats()
+
+
+def _drop_album_files(album_id):
+    try:
+        _album_index_cache.pop(int(album_id))
+    except (TypeError, ValueError):
+        pass
+
+
+def _evict_album_files(album_id):
+    _drop_album_files(album_id)
+    _on_commit(_drop_album_files, album_id)
+
+
+# ========== ВЕРСІЇ СПИСКІВ КОРИСТУВАЧА ==========
+
+class ListVersions:
+    """
+    user_id -> лічильник змін, що впливають на його списки (альбоми, спільні альбоми, нотатки).
+    Лічильник збільшують TEMP-тригери підключення (див. _install_list_version_triggers),
+    тож його враховують і прямі SQL-запити з обробників.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        if user_id is None:
+            return
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._pending.add(user_id)
+
+    def settle(self):
+        """
+        Після commit ще раз збільшити версії змінених користувачів: те, що читачі
+        встигли відрендерити зі старого знімка БД між тригером і commit, стає неактуальним.
+        """
+        with self._lock:
+            for user_id in self._pending:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._pending.clear()
+
+
+_list_versions = ListVersions()
+
+# Зміни лічильників файлів/записів теж доходять сюди: їх оновлюють тригери на albums / note_folders
+_LIST_VERSION_TRIGGERS = [
+    (table, event, body)
+    for table, members, key in (
+        ("albums", "shared_albums", "album_id"),
+        ("note_folders", "shared_note_folders", "folder_id"),
+    )
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+    for body in [
+        f"SELECT bump_list_version({row}.user_id); "
+        f"SELECT bump_list_version(user_id) FROM {members} WHERE {key} = {row}.{key};"
+    ]
+] + [
+    (members, event, f"SELECT bump_list_version({row}.user_id);")
+    for members in ("shared_albums", "shared_note_folders")
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+]
+
+
+def _install_list_version_triggers(conn: sqlite3.Connection):
+    """TEMP-тригери живуть лише в цьому підключенні, тому функцію bump_list_version не треба мати в БД"""
+    conn.create_function("bump_list_version", 1, _list_versions.bump)
+    for table, event, body in _LIST_VERSION_TRIGGERS:
+        conn.execute(
+            f"CREATE TEMP TRIGGER IF NOT EXISTS trg_listver_{table}_{event.lower()} "
+            f"AFTER {event} ON main.{table} BEGIN {body} END"
+        )
+
+
+# ========== ПРАВА ДОСТУПУ (спільні альбоми та папки нотаток) ==========
+
+# Можливості ролі — бітова маска
+CAN_VIEW = 1
+CAN_UPLOAD = 2
+CAN_DELETE = 4
+CAN_MANAGE = 8
+CAN_OWN = 16
+
+ROLE_CAPS = {
+    "viewer": CAN_VIEW,
+    "contributor": CAN_VIEW | CAN_UPLOAD,
+    "editor": CAN_VIEW | CAN_UPLOAD | CAN_DELETE,
+    "admin": CAN_VIEW | CAN_UPLOAD | CAN_DELETE | CAN_MANAGE,
+    "owner": CAN_VIEW | CAN_UPLOAD | CAN_DELETE | CAN_MANAGE | CAN_OWN,
+}
+_CAPS_ROLE = {caps: role for role, caps in ROLE_CAPS.items()}
+
+# Таблиця учасників і колонка контейнера для кожного виду
+_ACL_TABLES = {
+    "album": ("shared_albums", "album_id"),
+    "note": ("shared_note_folders", "folder_id"),
+}
+
+# (вид, id контейнера) -> {user_id: маска}. Учасників одного контейнера читаємо одним запитом.
+_acl_cache = LRUCache(ACL_CACHE_SIZE)
+
+
+def role_from_caps(caps: int):
+    """Назва ролі за маскою (None — немає доступу)"""
+    return _CAPS_ROLE.get(caps)
+
+
+def acl_cache_stats() -> dict:
+    """Статистика кешу прав доступу"""
+    return _acl_cache.stats()
+
+
+# ========== UNIT OF WORK ==========
+
+# Додаткові кеші поза цим модулем, які треба скинути після rollback unit of work
+_rollback_hooks = []
+
+
+def on_rollback(hook):
+    """Зареєструвати функцію без аргументів, що викликається після rollback unit of work"""
+    _rollback_hooks.append(hook)
+    return hook
+
+
+def _reset_caches():
+    """Після rollback кеші могли побачити відкочені зміни — перечитаємо з БД"""
+    _premium_index.invalidate()
+    _album_cache.clear()
+    _album_index_cache.clear()
+    _acl_cache.clear()
+    _username_directory.invalidate()
+    for hook in _rollback_hooks:
+        hook()
+
+
+def _current_owner():
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+class _UnitOfWork:
+    """
+    Транзакція одного апдейта на власному підключенні з пулу менеджера:
+    rollback одного апдейта не зачіпає записів інших, а фонові записи
+    (потік-письменник, інші задачі) не фіксують її посередині.
+    """
+
+    __slots__ = ("conn", "owner", "_after_commit")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        # Задачі, створені з обробника, успадковують контекст, але не його транзакцію
+        self.owner = _current_owner()
+        self._after_commit = []
+
+    def after_commit(self, hook, *args):
+        self._after_commit.append((hook, args))
+
+    def commit(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+        _list_versions.settle()
+        hooks, self._after_commit = self._after_commit, []
+        for hook, args in hooks:
+            hook(*args)
+
+    def rollback(self):
+        self.conn.rollback()
+        self._after_commit.clear()
+        _reset_caches()
+
+
+_current_uow: contextvars.ContextVar = contextvars.ContextVar("db_unit_of_work", default=None)
+
+
+def _active_uow():
+    """Unit of work поточної asyncio-задачі (None — поза ним)"""
+    uow = _current_uow.get()
+    if uow is not None and uow.owner is _current_owner():
+        return uow
+    return None
+
+
+def _on_commit(hook, *args):
+    """
+    Повторити інвалідацію hook(*args) після commit відкритого unit of work:
+    до commit потоки-читачі ще бачать старі рядки і можуть знову покласти їх у кеш.
+    Поза unit of work commit уже відбувся — нічого не робимо.
+    """
+    uow = _active_uow()
+    if uow is not None:
+        uow.after_commit(hook, *args)
+
+
+def flush_unit_of_work():
+    """
+    Зафіксувати вже зроблені записи поточного unit of work.
+    Викликається перед мережевими запитами та іншими очікуваннями: транзакція
+    не повинна лишатись відкритою, поки задача віддала керування event loop.
+    """
+    uow = _active_uow()
+    if uow is not None:
+        uow.commit()
+
+
+_manager: ConnectionManager | None = None
+_db = None
+_async_db = None
+_ingest_queue = None
+_init_lock = threading.Lock()
+
+
+def get_connection_manager() -> ConnectionManager:
+    """Менеджер підключення на весь процес"""
+    global _manager
+    if _manager is None:
+        with _init_lock:
+            if _manager is None:
+                _manager = ConnectionManager()
+    return _manager
+
+
+def get_db():
+    """
+    Спільний екземпляр Database для всіх модулів.
+    Таблиці створюються один раз — при першому виклику.
+    """
+    global _db
+    if _db is None:
+        manager = get_connection_manager()
+        with _init_lock:
+            if _db is None:
+                _db = Database(manager)
+    return _db
+
+
+def get_async_db():
+    """Спільний асинхронний фасад (AsyncDatabase) над get_db()"""
+    global _async_db
+    if _async_db is None:
+        db = get_db()
+        with _init_lock:
+            if _async_db is None:
+                _async_db = AsyncDatabase(db)
+    return _async_db
+
+
+def get_ingest_queue():
+    """Спільна черга прийому файлів (FileIngestQueue) над get_async_db()"""
+    global _ingest_queue
+    if _ingest_queue is None:
+        adb = get_async_db()
+        with _init_lock:
+            if _ingest_queue is None:
+                _ingest_queue = FileIngestQueue(adb)
+    return _ingest_queue
+
+
+class Database:
+    def __init__(self, manager: ConnectionManager | None = None):
+        self.manager = manager or get_connection_manager()
         self.create_tables()
+        # TEMP-тригери потрібні в кожному підключенні, що пише (після міграцій — таблиці вже є)
+        self.manager.add_setup(_install_list_version_triggers)
+        _premium_index.load(self.conn)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Підключення unit of work поточної задачі або підключення потоку"""
+        uow = _active_uow()
+        return uow.conn if uow is not None else self.manager.conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Кожне звернення повертає новий курсор (одна операція — один курсор)"""
+        return self.conn.cursor()
+
+    def close(self):
+        """Закрити підключення"""
+        self.manager.close()
     
-    def connect(self):
-        """Підключення до SQLite БД"""
-        self.conn = sqlite3.connect(DATABASE_NAME, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row  # Дозволяє звертатись по назві колонок
-        self.cursor = self.conn.cursor()
-        # Включаємо підтримку зовнішніх ключів
-        self.cursor.execute("PRAGMA foreign_keys = ON")
-    
-    def create_tables(self):
-        """Створення всіх таблиць та оновлення структури"""
-        
-        # 1. Створюємо основну таблицю користувачів (повна структура)
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_premium BOOLEAN DEFAULT 0,
-                premium_until TIMESTAMP,
-                privacy_settings TEXT DEFAULT '{"allow_invites": "all", "allow_add_to_shared": true, "allow_add_to_shared_notes": true}',
-                display_settings TEXT DEFAULT '{"show_number": true, "show_date": true}',
-                is_blocked BOOLEAN DEFAULT 0
-            )
-        ''')
+    def commit(self):
+        """Commit, якщо зараз не відкритий unit of work (тоді commit буде в кінці апдейта)"""
+        if _active_uow() is None:
+            self.conn.commit()
+            _list_versions.settle()
 
-        # ПЕРЕВІРКА: чи є колонка display_settings (якщо база стара)
-        self.cursor.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in self.cursor.fetchall()]
-        if 'display_settings' not in columns:
-            self.cursor.execute('ALTER TABLE users ADD COLUMN display_settings TEXT DEFAULT \'{"show_number": true, "show_date": true}\'')
+    @contextlib.contextmanager
+    def _atomic(self):
+        """
+        Записи одного методу, що сам перехоплює свої помилки: при винятку відкочуються
+        лише вони. Поза unit of work — rollback транзакції, в unit of work — SAVEPOINT,
+        щоб не втратити попередні записи апдейта.
+        """
+        conn = self.conn
+        if _active_uow() is None:
+            try:
+                yield
+            except BaseException:
+                conn.rollback()
+                raise
+            return
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT db_method")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK TO db_method")
+            conn.execute("RELEASE db_method")
+            raise
+        conn.execute("RELEASE db_method")
 
-        # 2. Таблиця альбомів
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS albums (
-                album_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_archived BOOLEAN DEFAULT 0,
-                is_shared BOOLEAN DEFAULT 0,
-                files_count INTEGER DEFAULT 0,
-                last_file_added TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # 3. Таблиця файлів
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                file_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                album_id INTEGER NOT NULL,
-                telegram_file_id TEXT NOT NULL,
-                file_type TEXT CHECK(file_type IN ('photo', 'video', 'document', 'audio', 'voice', 'circle')),
-                file_name TEXT,
-                file_size INTEGER,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                added_by INTEGER,
-                FOREIGN KEY (album_id) REFERENCES albums (album_id) ON DELETE CASCADE,
-                FOREIGN KEY (added_by) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # 4. Таблиця спільних альбомів
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shared_albums (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                album_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                access_level TEXT CHECK(access_level IN ('owner', 'admin', 'editor', 'contributor', 'viewer')),
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (album_id) REFERENCES albums (album_id) ON DELETE CASCADE,
-                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
-                UNIQUE(album_id, user_id)
-            )
-        ''')
+    @contextlib.contextmanager
+    def unit_of_work(self):
+        """
+        Транзакція апдейта у власному підключенні. commit() всередині блоку не фіксують,
+        але це не один commit на апдейт: незафіксовані записи фіксуються перед кожним
+        запитом до Telegram (main: rate_limiter.before_request = flush_unit_of_work),
+        перед викликами AsyncDatabase і чергою прийому та при виході з блоку.
+        Атомарні лише записи між двома такими точками; виняток відкочує тільки їх.
+        Вкладені блоки працюють у транзакції зовнішнього; їхній виняток теж відкочує
+        її незафіксовану частину.
+        """
+        uow = _active_uow()
+        if uow is not None:
+            try:
+                yield self
+            except BaseException:
+                uow.rollback()
+                raise
+            return
 
-        # 5. Таблиця каналів для Premium
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS premium_channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                link TEXT NOT NULL,
-                title TEXT
-            )
-        ''')
-        self.cursor.execute("PRAGMA table_info(premium_channels)")
-        _pc_cols = [column[1] for column in self.cursor.fetchall()]
-        if "telegram_chat_id" not in _pc_cols:
-            self.cursor.execute(
-                "ALTER TABLE premium_channels ADD COLUMN telegram_chat_id INTEGER"
-            )
-        
-        # 6. Решта таблиць (нотатки, преміум, логи)
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS notes (note_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, title TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_shared BOOLEAN DEFAULT 0, FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE)')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS shared_notes (id INTEGER PRIMARY KEY AUTOINCREMENT, note_id INTEGER NOT NULL, user_id INTEGER NOT NULL, access_level TEXT CHECK(access_level IN ("view", "edit")) DEFAULT "view", added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (note_id) REFERENCES notes (note_id) ON DELETE CASCADE, FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE, UNIQUE(note_id, user_id))')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS premium_subscriptions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, subscription_type TEXT CHECK(subscription_type IN ("channel", "paid", "manual")), channel_id TEXT, granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, expires_at TIMESTAMP, is_active BOOLEAN DEFAULT 1, FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE)')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS premium_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                event_type TEXT CHECK(event_type IN ("grant_paid", "grant_channel", "grant_manual", "remove")) NOT NULL,
-                subscription_type TEXT,
-                channel_id TEXT,
-                event_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS premium_channel_clicks (
-                user_id INTEGER NOT NULL,
-                channel_id INTEGER NOT NULL,
-                clicked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, channel_id),
-                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bot_chat_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER NOT NULL,
-                chat_type TEXT NOT NULL,
-                event_type TEXT CHECK(event_type IN ("added", "removed")) NOT NULL,
-                event_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bot_chats (
-                chat_id INTEGER PRIMARY KEY,
-                chat_type TEXT NOT NULL,
-                is_active BOOLEAN DEFAULT 1,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS broadcasts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                admin_id INTEGER NOT NULL,
-                target_mode TEXT NOT NULL,
-                source_chat_id INTEGER NOT NULL,
-                source_message_id INTEGER NOT NULL,
-                content_key TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                broadcast_id INTEGER NOT NULL,
-                target_chat_id INTEGER NOT NULL,
-                target_message_id INTEGER NOT NULL,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS archive_log (id INTEGER PRIMARY KEY AUTOINCREMENT, album_id INTEGER, user_id INTEGER, action TEXT CHECK(action IN ("archive", "unarchive")), action_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (album_id) REFERENCES albums (album_id), FOREIGN KEY (user_id) REFERENCES users (user_id))')
-        
-        self.conn.commit()
+        uow = _UnitOfWork(self.manager.acquire())
+        token = _current_uow.set(uow)
+        try:
+            yield self
+        except BaseException:
+            uow.rollback()
+            raise
+        else:
+            uow.commit()
+        finally:
+            _current_uow.reset(token)
+            self.manager.release(uow.conn)
+
+    def list_version(self, user_id) -> int:
+        """Версія списків користувача (ключ кешу відрендерених екранів, без звернення до БД)"""
+        return _list_versions.get(user_id)
+
+    def create_tables(self):
+        """Створення всіх таблиць та оновлення структури (через версійні міграції)"""
+        migrations.migrate(self.conn)
 
     def log_bot_chat_event(self, chat_id: int, chat_type: str, event_type: str):
         """Логує подію додавання/видалення бота та оновлює поточний стан чату."""
+        cur = self.cursor
         if event_type not in ("added", "removed"):
             return
-        self.cursor.execute(
+        cur.execute(
             '''
             INSERT INTO bot_chat_events (chat_id, chat_type, event_type, event_at)
             VALUES (?, ?, ?, CURRENT_TIMESTAMP)
             ''',
             (chat_id, chat_type, event_type),
         )
-        self.cursor.execute(
+        cur.execute(
             '''
             INSERT INTO bot_chats (chat_id, chat_type, is_active, added_at, updated_at)
             VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
@@ -191,47 +847,101 @@ class Database:
             ''',
             (chat_id, chat_type, 1 if event_type == "added" else 0),
         )
-        self.conn.commit()
+        self.commit()
 
     def create_broadcast(self, admin_id: int, target_mode: str, source_chat_id: int, source_message_id: int, content_key: str | None):
-        self.cursor.execute(
+        cur = self.cursor
+        cur.execute(
             '''
             INSERT INTO broadcasts (admin_id, target_mode, source_chat_id, source_message_id, content_key, created_at)
             VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
             ''',
             (admin_id, target_mode, source_chat_id, source_message_id, content_key),
         )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self.commit()
+        return cur.lastrowid
 
     def add_broadcast_delivery(self, broadcast_id: int, target_chat_id: int, target_message_id: int):
-        self.cursor.execute(
+        cur = self.cursor
+        cur.execute(
             '''
             INSERT INTO broadcast_deliveries (broadcast_id, target_chat_id, target_message_id, sent_at)
             VALUES (?, ?, ?, CURRENT_TIMESTAMP)
             ''',
             (broadcast_id, target_chat_id, target_message_id),
         )
-        self.conn.commit()
+        self.commit()
     
     # ========== МЕТОДИ ДЛЯ РОБОТИ З КОРИСТУВАЧАМИ ==========
     
     def register_user(self, user_id, username, first_name, last_name):
-        """Реєстрація нового користувача"""
+        """Реєстрація нового користувача (для наявного — оновлення username та імені)"""
+        cur = self.cursor
         try:
-            self.cursor.execute('''
-                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, registered_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (user_id, username, first_name, last_name))
-            self.conn.commit()
+            cur.execute('''
+                INSERT INTO users (user_id, username, username_lower, first_name, last_name, registered_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    username_lower = excluded.username_lower,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name
+            ''', (user_id, username, normalize_username(username), first_name, last_name))
+            self.commit()
+            _username_directory.put(user_id, username, first_name, last_name)
             return True
         except Exception as e:
             print(f"Помилка реєстрації: {e}")
             return False
+
+    def refresh_user(self, user_id, username, first_name, last_name):
+        """
+        Оновити username/ім'я з effective_user вхідного апдейту.
+        Пише в БД лише якщо дані змінились; незареєстрованих користувачів не створює.
+        """
+        _username_directory.ensure_loaded(self.conn)
+        if _username_directory.known_names(user_id) == (username, first_name, last_name):
+            return False
+        cur = self.cursor
+        cur.execute(
+            "UPDATE users SET username = ?, username_lower = ?, first_name = ?, last_name = ? WHERE user_id = ?",
+            (username, normalize_username(username), first_name, last_name, user_id),
+        )
+        registered = cur.rowcount > 0
+        if registered:
+            self.commit()
+        _username_directory.put(user_id, username, first_name, last_name, registered=registered)
+        return registered
+
+    def find_user_id_by_username(self, username):
+        """user_id за @username (без урахування регістру) або None"""
+        key = normalize_username(username)
+        if not key:
+            return None
+        _username_directory.ensure_loaded(self.conn)
+        user_id = _username_directory.lookup(key)
+        if user_id is not None:
+            return user_id
+        # Запасний шлях — індексований пошук (напр. користувача додали повз довідник)
+        cur = self.cursor
+        row = cur.execute(
+            "SELECT user_id, username, first_name, last_name FROM users WHERE username_lower = ?",
+            (key,)
+        ).fetchone()
+        if not row:
+            return None
+        _username_directory.put(row["user_id"], row["username"], row["first_name"], row["last_name"])
+        return row["user_id"]
+
+    def get_user_by_username(self, username):
+        """Рядок users за @username (без урахування регістру) або None"""
+        user_id = self.find_user_id_by_username(username)
+        return self.get_user(user_id) if user_id is not None else None
     
     def get_user(self, user_id):
         """Отримати дані користувача"""
-        return self.cursor.execute(
+        cur = self.cursor
+        return cur.execute(
             "SELECT * FROM users WHERE user_id = ?", 
             (user_id,)
         ).fetchone()
@@ -240,159 +950,205 @@ class Database:
     
     def create_album(self, user_id, name):
         """Створення нового альбому"""
-        self.cursor.execute('''
+        cur = self.cursor
+        cur.execute('''
             INSERT INTO albums (user_id, name, created_at)
             VALUES (?, ?, CURRENT_TIMESTAMP)
         ''', (user_id, name))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self.commit()
+        return cur.lastrowid
     
     def get_user_albums(self, user_id, include_archived=False):
         """Отримати список особистих (НЕ спільних) альбомів користувача"""
+        cur = self.cursor
         query = "SELECT * FROM albums WHERE user_id = ? AND is_shared = 0"
         if not include_archived:
             query += " AND is_archived = 0"
         query += " ORDER BY created_at DESC"
         
-        return self.cursor.execute(query, (user_id,)).fetchall()
+        return cur.execute(query, (user_id,)).fetchall()
 
     # ========== ЛІЧИЛЬНИКИ ДЛЯ ЛІМІТІВ ==========
 
+    def get_usage(self, user_id):
+        """
+        Лічильники для безкоштовних лімітів (рядок user_usage, веде тригер):
+        albums, shared_albums, note_folders, shared_note_folders — лише не архівовані.
+        """
+        cur = self.cursor
+        row = cur.execute("SELECT * FROM user_usage WHERE user_id = ?", (user_id,)).fetchone()
+        if row:
+            return dict(row)
+        return {"user_id": user_id, "albums": 0, "shared_albums": 0, "note_folders": 0, "shared_note_folders": 0}
+
+    def reconcile_usage(self, user_id=None):
+        """Перерахувати user_usage з нуля (одного користувача або всіх) — команда для ремонту"""
+        cur = self.cursor
+        if user_id is None:
+            cur.execute(migrations.RECOUNT_USAGE_SQL.format(where="1"))
+        else:
+            cur.execute(migrations.RECOUNT_USAGE_SQL.format(where="u.user_id = ?"), (user_id,))
+        self.commit()
+        return cur.rowcount
+
     def count_personal_albums(self, user_id, include_archived: bool = False) -> int:
         """Кількість персональних (не спільних) альбомів користувача."""
-        query = "SELECT COUNT(*) FROM albums WHERE user_id = ? AND is_shared = 0"
-        params = [user_id]
         if not include_archived:
-            query += " AND is_archived = 0"
-        return self.cursor.execute(query, tuple(params)).fetchone()[0]
+            return self.get_usage(user_id)["albums"]
+        # Разом з архівними — лічильника в user_usage немає, рахуємо по albums
+        return self.cursor.execute(
+            "SELECT COUNT(*) FROM albums WHERE user_id = ? AND is_shared = 0", (user_id,)
+        ).fetchone()[0]
 
     def count_owned_shared_albums(self, user_id, include_archived: bool = False) -> int:
         """
         Кількість спільних альбомів, де користувач є власником (owner).
         В БД власник зберігається в `albums.user_id`, а `is_shared=1`.
         """
-        query = "SELECT COUNT(*) FROM albums WHERE user_id = ? AND is_shared = 1"
-        params = [user_id]
         if not include_archived:
-            query += " AND is_archived = 0"
-        return self.cursor.execute(query, tuple(params)).fetchone()[0]
+            return self.get_usage(user_id)["shared_albums"]
+        # Разом з архівними — лічильника в user_usage немає, рахуємо по albums
+        return self.cursor.execute(
+            "SELECT COUNT(*) FROM albums WHERE user_id = ? AND is_shared = 1", (user_id,)
+        ).fetchone()[0]
 
     def make_album_shared(self, album_id: int, owner_id: int):
         """Перетворити особистий альбом на спільний (власник додається автоматично)"""
+        cur = self.cursor
         try:
-            album_id = int(album_id)
-            owner_id = int(owner_id)
+            with self._atomic():
+                album_id = int(album_id)
+                owner_id = int(owner_id)
 
-            album = self.cursor.execute(
-                "SELECT album_id, user_id, is_shared FROM albums WHERE album_id = ?",
-                (album_id,)
-            ).fetchone()
+                album = cur.execute(
+                    "SELECT album_id, user_id, is_shared FROM albums WHERE album_id = ?",
+                    (album_id,)
+                ).fetchone()
 
-            if not album:
-                return False, "not_found"
-            if int(album["user_id"]) != owner_id:
-                return False, "not_owner"
+                if not album:
+                    return False, "not_found"
+                if int(album["user_id"]) != owner_id:
+                    return False, "not_owner"
 
-            # Якщо вже спільний — просто гарантуємо запис власника в shared_albums
-            self.cursor.execute(
-                "UPDATE albums SET is_shared = 1 WHERE album_id = ?",
-                (album_id,)
-            )
-            self.cursor.execute(
-                """
-                INSERT OR IGNORE INTO shared_albums (album_id, user_id, access_level, added_at)
-                VALUES (?, ?, 'owner', CURRENT_TIMESTAMP)
-                """,
-                (album_id, owner_id)
-            )
-            self.conn.commit()
-            return True, "ok"
+                # Якщо вже спільний — просто гарантуємо запис власника в shared_albums
+                cur.execute(
+                    "UPDATE albums SET is_shared = 1 WHERE album_id = ?",
+                    (album_id,)
+                )
+                cur.execute(
+                    """
+                    INSERT OR IGNORE INTO shared_albums (album_id, user_id, access_level, added_at)
+                    VALUES (?, ?, 'owner', CURRENT_TIMESTAMP)
+                    """,
+                    (album_id, owner_id)
+                )
+                self.commit()
+                return True, "ok"
         except Exception as e:
             print(f"❌ Помилка make_album_shared({album_id}): {e}")
-            self.conn.rollback()
             return False, "db_error"
+        finally:
+            _evict_album(album_id)
+            self.invalidate_album_acl(album_id)
 
     def make_album_personal_if_solo(self, album_id: int, user_id: int):
         """Перенести спільний альбом у звичайні, якщо учасник лише один (цей user_id)"""
+        cur = self.cursor
         try:
-            album_id = int(album_id)
-            user_id = int(user_id)
+            with self._atomic():
+                album_id = int(album_id)
+                user_id = int(user_id)
 
-            album = self.cursor.execute(
-                "SELECT album_id, user_id, is_shared FROM albums WHERE album_id = ?",
-                (album_id,)
-            ).fetchone()
-            if not album:
-                return False, "not_found"
+                album = cur.execute(
+                    "SELECT album_id, user_id, is_shared FROM albums WHERE album_id = ?",
+                    (album_id,)
+                ).fetchone()
+                if not album:
+                    return False, "not_found"
 
-            # Перевіряємо учасників
-            members = self.cursor.execute(
-                "SELECT user_id, access_level FROM shared_albums WHERE album_id = ?",
-                (album_id,)
-            ).fetchall()
+                # Перевіряємо учасників
+                members = cur.execute(
+                    "SELECT user_id, access_level FROM shared_albums WHERE album_id = ?",
+                    (album_id,)
+                ).fetchall()
 
-            if not members:
-                # Нема записів — просто робимо альбом не-спільним
-                self.cursor.execute("UPDATE albums SET is_shared = 0 WHERE album_id = ?", (album_id,))
-                self.conn.commit()
-                return True, "ok"
+                if not members:
+                    # Нема записів — просто робимо альбом не-спільним
+                    cur.execute("UPDATE albums SET is_shared = 0 WHERE album_id = ?", (album_id,))
+                    self.commit()
+                    return True, "ok"
 
-            if len(members) != 1 or int(members[0]["user_id"]) != user_id:
-                return False, "has_members"
+                if len(members) != 1 or int(members[0]["user_id"]) != user_id:
+                    return False, "has_members"
 
-            # Додаткова перевірка: тільки owner може переносити
-            if members[0]["access_level"] != "owner":
-                return False, "not_owner"
+                # Додаткова перевірка: тільки owner може переносити
+                if members[0]["access_level"] != "owner":
+                    return False, "not_owner"
 
-            # Переносимо: вимикаємо shared і чистимо таблицю учасників
-            self.cursor.execute("UPDATE albums SET is_shared = 0 WHERE album_id = ?", (album_id,))
-            self.cursor.execute("DELETE FROM shared_albums WHERE album_id = ?", (album_id,))
-            self.conn.commit()
-            return True, "ok"
+                # Переносимо: вимикаємо shared і чистимо таблицю учасників
+                cur.execute("UPDATE albums SET is_shared = 0 WHERE album_id = ?", (album_id,))
+                cur.execute("DELETE FROM shared_albums WHERE album_id = ?", (album_id,))
+                self.commit()
+                return True, "ok"
         except Exception as e:
             print(f"❌ Помилка make_album_personal_if_solo({album_id}): {e}")
-            self.conn.rollback()
             return False, "db_error"
+        finally:
+            _evict_album(album_id)
+            self.invalidate_album_acl(album_id)
     
     def get_album(self, album_id):
-        """Отримати дані альбому"""
-        return self.cursor.execute(
+        """Отримати дані альбому (через LRU-кеш)"""
+        album_id = int(album_id)
+        album = _album_cache.get(album_id)
+        if album is not None:
+            return album
+        cur = self.cursor
+        album = cur.execute(
             "SELECT * FROM albums WHERE album_id = ?", 
             (album_id,)
         ).fetchone()
+        if album is not None:
+            _album_cache.put(album_id, album)
+        return album
     
     def archive_album(self, album_id, user_id):
         """Архівувати альбом"""
-        self.cursor.execute(
+        cur = self.cursor
+        cur.execute(
             "UPDATE albums SET is_archived = 1 WHERE album_id = ?",
             (album_id,)
         )
         # Логуємо архівацію
-        self.cursor.execute('''
+        cur.execute('''
             INSERT INTO archive_log (album_id, user_id, action)
             VALUES (?, ?, 'archive')
         ''', (album_id, user_id))
-        self.conn.commit()
+        self.commit()
+        _evict_album(album_id)
     
     def unarchive_album(self, album_id, user_id):
         """Розархівувати альбом"""
-        self.cursor.execute(
+        cur = self.cursor
+        cur.execute(
             "UPDATE albums SET is_archived = 0 WHERE album_id = ?",
             (album_id,)
         )  
         # Логуємо розархівацію
-        self.cursor.execute('''
+        cur.execute('''
         INSERT INTO archive_log (album_id, user_id, action)
         VALUES (?, ?, 'unarchive')
         ''', (album_id, user_id))
-        self.conn.commit()
+        self.commit()
+        _evict_album(album_id)
 
 
 # === МЕТОДИ ДЛЯ СПІЛЬНИХ АЛЬБОМІВ ===
 
     def get_shared_albums_for_user(self, user_id):
         """Отримати всі альбоми, до яких користувач має доступ (крім власних)"""
-        return self.cursor.execute('''
+        cur = self.cursor
+        return cur.execute('''
             SELECT a.*, sa.role FROM albums a
             JOIN shared_albums sa ON a.album_id = sa.album_id
             WHERE sa.user_id = ? AND a.user_id != ?
@@ -400,26 +1156,72 @@ class Database:
 
     def create_shared_album(self, user_id, name):
         """Створення спільного альбому (власник додається автоматично)"""
+        cur = self.cursor
         album_id = self.create_album(user_id, name)
-        self.cursor.execute("UPDATE albums SET is_shared = 1 WHERE album_id = ?", (album_id,))
-        self.cursor.execute('''
+        cur.execute("UPDATE albums SET is_shared = 1 WHERE album_id = ?", (album_id,))
+        cur.execute('''
             INSERT INTO shared_albums (album_id, user_id, role)
             VALUES (?, ?, 'owner')
         ''', (album_id, user_id))
-        self.conn.commit()
+        self.commit()
+        _evict_album(album_id)
+        self.invalidate_album_acl(album_id)
         return album_id
 
     def get_user_role(self, user_id, album_id):
         """Отримати роль користувача в альбомі"""
-        result = self.cursor.execute(
-            "SELECT role FROM shared_albums WHERE user_id = ? AND album_id = ?",
-            (user_id, album_id)
-        ).fetchone()
-        return result['role'] if result else None
+        return self.get_album_access(album_id, user_id)
+
+    def _container_acl(self, kind, container_id):
+        """Усі учасники контейнера {user_id: маска} — з кешу або одним запитом"""
+        if container_id is None:
+            # Альбом / папку ще не вибрано — прав немає
+            return {}
+        key = (kind, int(container_id))
+        members = _acl_cache.get(key)
+        if members is None:
+            table, column = _ACL_TABLES[kind]
+            cur = self.cursor
+            rows = cur.execute(
+                f"SELECT user_id, access_level FROM {table} WHERE {column} = ?",
+                (key[1],)
+            ).fetchall()
+            members = {row['user_id']: ROLE_CAPS.get(row['access_level'], CAN_VIEW) for row in rows}
+            _acl_cache.put(key, members)
+        return members
+
+    def album_caps(self, album_id, user_id) -> int:
+        """Маска можливостей користувача в спільному альбомі (0 — не учасник)"""
+        return self._container_acl("album", album_id).get(int(user_id), 0)
+
+    def get_album_access(self, album_id, user_id):
+        """Роль користувача в спільному альбомі або None"""
+        return role_from_caps(self.album_caps(album_id, user_id))
+
+    def note_folder_caps(self, folder_id, user_id) -> int:
+        """Маска можливостей користувача в спільній папці нотаток (0 — не учасник)"""
+        return self._container_acl("note", folder_id).get(int(user_id), 0)
+
+    def get_note_folder_access(self, folder_id, user_id):
+        """Роль користувача в спільній папці нотаток або None"""
+        return role_from_caps(self.note_folder_caps(folder_id, user_id))
+
+    def invalidate_album_acl(self, album_id):
+        """Скинути кеш прав альбому — після будь-якої зміни учасників"""
+        if album_id is not None:
+            _acl_cache.pop(("album", int(album_id)))
+            _on_commit(_acl_cache.pop, ("album", int(album_id)))
+
+    def invalidate_note_acl(self, folder_id):
+        """Скинути кеш прав папки нотаток — після будь-якої зміни учасників"""
+        if folder_id is not None:
+            _acl_cache.pop(("note", int(folder_id)))
+            _on_commit(_acl_cache.pop, ("note", int(folder_id)))
 
     def get_album_members(self, album_id):
         """Список учасників з іменами"""
-        return self.cursor.execute('''
+        cur = self.cursor
+        return cur.execute('''
             SELECT u.user_id, u.username, u.first_name, sa.role, sa.added_at 
             FROM shared_albums sa
             JOIN users u ON sa.user_id = u.user_id
@@ -427,16 +1229,20 @@ class Database:
         ''', (album_id,)).fetchall()
 
     def add_member(self, album_id, user_id, role='author'):
-        self.cursor.execute('''
+        cur = self.cursor
+        cur.execute('''
             INSERT OR REPLACE INTO shared_albums (album_id, user_id, role)
             VALUES (?, ?, ?)
         ''', (album_id, user_id, role))
-        self.conn.commit()
+        self.commit()
+        self.invalidate_album_acl(album_id)
 
     def update_role(self, album_id, user_id, new_role):
-        self.cursor.execute("UPDATE shared_albums SET role = ? WHERE album_id = ? AND user_id = ?", 
+        cur = self.cursor
+        cur.execute("UPDATE shared_albums SET role = ? WHERE album_id = ? AND user_id = ?", 
                            (new_role, album_id, user_id))
-        self.conn.commit()
+        self.commit()
+        self.invalidate_album_acl(album_id)
 
 
 
@@ -444,33 +1250,38 @@ class Database:
 
     def delete_album(self, album_id):
         """Видалити альбом з усіма файлами та зв'язками"""
+        cur = self.cursor
         try:
-            album_id = int(album_id) # Гарантуємо, що це число
+            with self._atomic():
+                album_id = int(album_id) # Гарантуємо, що це число
             
-            # 1. Видаляємо всі файли альбому
-            self.cursor.execute("DELETE FROM files WHERE album_id = ?", (album_id,))
+                # 1. Видаляємо всі файли альбому
+                cur.execute("DELETE FROM files WHERE album_id = ?", (album_id,))
             
-            # 2. Видаляємо лог архівації (якщо альбом колись архівувався)
-            try:
-                self.cursor.execute("DELETE FROM archive_log WHERE album_id = ?", (album_id,))
-            except:
-                pass 
+                # 2. Видаляємо лог архівації (якщо альбом колись архівувався)
+                try:
+                    cur.execute("DELETE FROM archive_log WHERE album_id = ?", (album_id,))
+                except:
+                    pass 
                 
-            # 3. Видаляємо зі спільних альбомів (якщо вони є у твоїй структурі)
-            try:
-                self.cursor.execute("DELETE FROM shared_albums WHERE album_id = ?", (album_id,))
-            except:
-                pass
+                # 3. Видаляємо зі спільних альбомів (якщо вони є у твоїй структурі)
+                try:
+                    cur.execute("DELETE FROM shared_albums WHERE album_id = ?", (album_id,))
+                except:
+                    pass
                 
-            # 4. Видаляємо сам альбом
-            self.cursor.execute("DELETE FROM albums WHERE album_id = ?", (album_id,))
+                # 4. Видаляємо сам альбом
+                cur.execute("DELETE FROM albums WHERE album_id = ?", (album_id,))
             
-            self.conn.commit()
-            return True
+                self.commit()
+                return True
         except Exception as e:
             print(f"❌ Помилка БД при видаленні альбому {album_id}: {e}")
-            self.conn.rollback()
             return False
+        finally:
+            _evict_album(album_id)
+            _evict_album_files(album_id)
+            self.invalidate_album_acl(album_id)
 
     # ============================================
     
@@ -479,67 +1290,388 @@ class Database:
     
     # ========== МЕТОДИ ДЛЯ РОБОТИ З ФАЙЛАМИ ==========
     
-    def add_file(self, album_id, telegram_file_id, file_type, file_name=None, file_size=None, added_by=None):
-        """Додати файл до альбому (зберігаємо тільки file_id!)"""
-        self.cursor.execute('''
-            INSERT INTO files (album_id, telegram_file_id, file_type, file_name, file_size, added_by)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (album_id, telegram_file_id, file_type, file_name, file_size, added_by))
-        
-        # Оновлюємо лічильник файлів в альбомі
-        self.cursor.execute('''
-            UPDATE albums 
-            SET files_count = files_count + 1,
-                last_file_added = CURRENT_TIMESTAMP
-            WHERE album_id = ?
-        ''', (album_id,))
-        
-        self.conn.commit()
-        return self.cursor.lastrowid
+    def add_file(self, album_id, telegram_file_id, file_type, file_name=None, file_size=None, added_by=None,
+                 origin_chat_id=None, origin_message_id=None):
+        """Додати файл до альбому (file_id та, якщо відомо, оригінальне повідомлення для copy_messages)"""
+        cur = self.cursor
+        # Позиція = наступний номер в альбомі (пошук MAX по індексу album_id, position)
+        cur.execute('''
+            INSERT INTO files (album_id, telegram_file_id, file_type, file_name, file_size, added_by,
+                               origin_chat_id, origin_message_id, position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM files WHERE album_id = ?))
+        ''', (album_id, telegram_file_id, file_type, file_name, file_size, added_by,
+              origin_chat_id, origin_message_id, album_id))
+        # files_count та last_file_added оновлює тригер trg_files_count_insert
+        self.commit()
+        _evict_album(album_id)
+        _evict_album_files(album_id)
+        return cur.lastrowid
+    
+    def add_files(self, records):
+        """
+        Пакетне додавання файлів однією транзакцією.
+        records — список кортежів (album_id, telegram_file_id, file_type, file_name, file_size, added_by,
+        origin_chat_id, origin_message_id).
+        Повертає список file_id у тому ж порядку; None — для записів, які не вдалося зберегти.
+        """
+        if not records:
+            return []
+        try:
+            with self._atomic():
+                ids = self._insert_files(records)
+                self.commit()
+            return ids
+        except sqlite3.Error as e:
+            print(f"Помилка пакетного додавання файлів, зберігаю по одному: {e}")
+        finally:
+            for album_id in {record[0] for record in records}:
+                _evict_album(album_id)
+                _evict_album_files(album_id)
+
+        # Один поганий запис (напр. видалений альбом) не повинен губити весь пакет
+        results = []
+        for record in records:
+            try:
+                with self._atomic():
+                    results.append(self._insert_files([record])[0])
+                    self.commit()
+            except sqlite3.Error as e:
+                print(f"Помилка додавання файлу в альбом {record[0]}: {e}")
+                results.append(None)
+        for album_id in {record[0] for record in records}:
+            _evict_album(album_id)
+            _evict_album_files(album_id)
+        return results
+
+    def _insert_files(self, records):
+        """executemany для файлів (без commit); лічильники оновлюють тригери"""
+        cur = self.cursor
+        next_position = {}
+        counts = {}
+        rows = []
+        for record in records:
+            album_id = record[0]
+            if album_id not in next_position:
+                next_position[album_id] = cur.execute(
+                    "SELECT COALESCE(MAX(position), 0) FROM files WHERE album_id = ?", (album_id,)
+                ).fetchone()[0]
+            next_position[album_id] += 1
+            counts[album_id] = counts.get(album_id, 0) + 1
+            # старі 6-елементні записи — без оригінального повідомлення
+            origin = (tuple(record[6:8]) + (None, None))[:2]
+            rows.append(tuple(record[:6]) + origin + (next_position[album_id],))
+
+        cur.executemany('''
+            INSERT INTO files (album_id, telegram_file_id, file_type, file_name, file_size, added_by,
+                               origin_chat_id, origin_message_id, position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+        # file_id нових записів знаходимо за (album_id, position)
+        ids = {}
+        for album_id, count in counts.items():
+            last = next_position[album_id]
+            for row in cur.execute(
+                "SELECT file_id, position FROM files WHERE album_id = ? AND position > ? AND position <= ?",
+                (album_id, last - count, last),
+            ):
+                ids[(album_id, row['position'])] = row['file_id']
+        return [ids[(row[0], row[-1])] for row in rows]
     
     def get_album_files(self, album_id, limit=None, order='ASC'):
         """Отримати файли з альбому
         order: 'ASC' - від найстаріших до найновіших (хронологічно)
            'DESC' - від найновіших до найстаріших
         """
-        query = "SELECT * FROM files WHERE album_id = ? ORDER BY added_at " + order
+        index = self._album_index(album_id)
+        if index is not None:
+            rows = index.rows(1, len(index))
+            if order == 'DESC':
+                rows.reverse()
+            return rows[:limit] if limit else rows
+        cur = self.cursor
+        query = f"SELECT * FROM files WHERE album_id = ? ORDER BY position {order}"
         if limit:
             query += f" LIMIT {limit}"
     
-        return self.cursor.execute(query, (album_id,)).fetchall()
+        return cur.execute(query, (album_id,)).fetchall()
+
+    # ========== ВІКНА ФАЙЛІВ (перші / останні / проміжок) ==========
+    # Номер файлу в альбомі зберігається в files.position (з 1, без пропусків),
+    # тому кожне вікно — це пошук по індексу (album_id, position).
+    # Кожен рядок також має колонку `ordinal` (= position).
+    # Якщо альбом відкрито (open_album_index), вікна нарізаються з індексу в пам'яті.
+
+    def open_album_index(self, album_id):
+        """Побудувати (або взяти з кешу) індекс файлів альбому — викликається при відкритті альбому"""
+        album_id = int(album_id)
+        index = _album_index_cache.get(album_id)
+        if index is None:
+            generation = _album_index_cache.generation
+            rows = self.cursor.execute(
+                "SELECT file_id, telegram_file_id, file_type, file_name, file_size, added_at, added_by, "
+                "origin_chat_id, origin_message_id FROM files WHERE album_id = ? ORDER BY position",
+                (album_id,)
+            ).fetchall()
+            index = AlbumFileIndex(album_id, rows)
+            _album_index_cache.put(index, generation)
+        return index
+
+    def _album_index(self, album_id):
+        """Індекс альбому, якщо він уже в кеші (сам не будує)"""
+        try:
+            return _album_index_cache.get(int(album_id))
+        except (TypeError, ValueError):
+            return None
+
+    def count_album_files(self, album_id) -> int:
+        """Кількість файлів в альбомі (= найбільша позиція, один пошук по індексу)"""
+        index = self._album_index(album_id)
+        if index is not None:
+            return len(index)
+        cur = self.cursor
+        return cur.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM files WHERE album_id = ?",
+            (album_id,)
+        ).fetchone()[0]
+
+    def get_files_range(self, album_id, start: int, end: int):
+        """Файли з номерами start..end включно (нумерація з 1)"""
+        if start < 1 or end < start:
+            return []
+        index = self._album_index(album_id)
+        if index is not None:
+            return index.rows(start, end)
+        cur = self.cursor
+        return cur.execute('''
+            SELECT *, position AS ordinal FROM files
+            WHERE album_id = ? AND position BETWEEN ? AND ?
+            ORDER BY position
+        ''', (album_id, start, end)).fetchall()
+
+    def get_first_files(self, album_id, count: int):
+        """Перші `count` файлів альбому"""
+        return self.get_files_range(album_id, 1, count)
+
+    def get_last_files(self, album_id, count: int):
+        """Останні `count` файлів альбому (у хронологічному порядку)"""
+        if count <= 0:
+            return []
+        total = self.count_album_files(album_id)
+        return self.get_files_range(album_id, max(1, total - count + 1), total)
+
+    def get_file_by_position(self, album_id, position: int):
+        """Файл №position в альбомі (або None)"""
+        index = self._album_index(album_id)
+        if index is not None:
+            return index.row(position - 1) if 1 <= position <= len(index) else None
+        cur = self.cursor
+        return cur.execute(
+            "SELECT *, position AS ordinal FROM files WHERE album_id = ? AND position = ?",
+            (album_id, position)
+        ).fetchone()
     
-    def get_files_by_date(self, album_id, date):
-        """Отримати файли за конкретну дату"""
-        return self.cursor.execute('''
-            SELECT * FROM files 
-            WHERE album_id = ? AND DATE(added_at) = DATE(?)
-            ORDER BY added_at DESC
-        ''', (album_id, date)).fetchall()
+    def get_files_by_date(self, album_id, date_from, date_to=None):
+        """Файли за день (або за проміжок днів включно) з колонкою ordinal — номером в альбомі"""
+        index = self._album_index(album_id)
+        if index is not None:
+            day_from = datetime.strptime(date_from, "%Y-%m-%d").toordinal()
+            day_to = datetime.strptime(date_to or date_from, "%Y-%m-%d").toordinal()
+            return index.rows_by_days(day_from, day_to)
+        start, end = _day_bounds(date_from, date_to)
+        cur = self.cursor
+        return cur.execute('''
+            SELECT *, position AS ordinal FROM files 
+            WHERE album_id = ? AND added_at >= ? AND added_at < ?
+            ORDER BY position
+        ''', (album_id, start, end)).fetchall()
+
+    def _compact_positions(self, cur, album_id, from_position: int):
+        """Перенумерувати файли альбому, починаючи з from_position, щоб прибрати пропуски після видалень"""
+        cur.execute('''
+            UPDATE files
+            SET position = renumbered.new_position
+            FROM (
+                SELECT file_id, ? - 1 + ROW_NUMBER() OVER (ORDER BY position, file_id) AS new_position
+                FROM files
+                WHERE album_id = ? AND position >= ?
+            ) AS renumbered
+            WHERE files.file_id = renumbered.file_id
+              AND files.position != renumbered.new_position
+        ''', (from_position, album_id, from_position))
     
+    def delete_files(self, file_ids) -> int:
+        """
+        Видалити кілька файлів однією транзакцією.
+        Позиції кожного альбому ущільнюються один раз (лічильник веде тригер). Повертає кількість видалених.
+        """
+        file_ids = [int(f) for f in file_ids]
+        if not file_ids:
+            return 0
+        cur = self.cursor
+        placeholders = ",".join("?" * len(file_ids))
+        albums = []
+        try:
+            with self._atomic():
+                albums = cur.execute(
+                    f"SELECT album_id, MIN(position) AS min_position, COUNT(*) AS cnt "
+                    f"FROM files WHERE file_id IN ({placeholders}) GROUP BY album_id",
+                    file_ids,
+                ).fetchall()
+                if not albums:
+                    return 0
+
+                cur.execute(f"DELETE FROM files WHERE file_id IN ({placeholders})", file_ids)
+                for row in albums:
+                    # Ущільнюємо нумерацію після найменшої видаленої позиції
+                    self._compact_positions(cur, row['album_id'], row['min_position'] or 1)
+
+                self.commit()
+                return sum(row['cnt'] for row in albums)
+        except Exception as e:
+            print(f"❌ Помилка видалення файлів {file_ids}: {e}")
+            return 0
+        finally:
+            for row in albums:
+                _evict_album(row['album_id'])
+                _evict_album_files(row['album_id'])
+    
+    def clear_file_origins(self, file_ids):
+        """Забути оригінальні повідомлення, яких уже немає (copy_messages їх пропустив)"""
+        file_ids = [int(f) for f in file_ids]
+        if not file_ids:
+            return
+        cur = self.cursor
+        placeholders = ",".join("?" * len(file_ids))
+        albums = cur.execute(
+            f"SELECT DISTINCT album_id FROM files WHERE file_id IN ({placeholders})", file_ids
+        ).fetchall()
+        cur.execute(
+            f"UPDATE files SET origin_chat_id = NULL, origin_message_id = NULL WHERE file_id IN ({placeholders})",
+            file_ids,
+        )
+        self.commit()
+        for row in albums:
+            _evict_album_files(row['album_id'])
+
     def delete_file(self, file_id):
         """Видалити файл"""
-        # Спочатку отримуємо album_id
-        file = self.cursor.execute(
-            "SELECT album_id FROM files WHERE file_id = ?", 
-            (file_id,)
-        ).fetchone()
-        
-        if file:
-            # Видаляємо файл
-            self.cursor.execute(
-                "DELETE FROM files WHERE file_id = ?", 
-                (file_id,)
-            )
-            # Оновлюємо лічильник
-            self.cursor.execute('''
-                UPDATE albums 
-                SET files_count = files_count - 1 
-                WHERE album_id = ?
-            ''', (file['album_id'],))
-            
-            self.conn.commit()
-            return True
-        return False
+        return self.delete_files([file_id]) > 0
+    
+    # ========== ФОНОВІ НАДСИЛАННЯ (send_jobs) ==========
+    # Рядок живе, поки надсилання не завершене. file_ids — файли надсилання в порядку
+    # відправки (JSON), sent_count — скільки з них уже доставлено: після перезапуску
+    # надсилання продовжується з file_ids[sent_count:], навіть якщо частину файлів видалили.
+
+    def create_send_job(self, user_id, chat_id, album_id, file_ids, sender='album',
+                        title=None, done_text=None, start_index=None):
+        cur = self.cursor
+        cur.execute('''
+            INSERT INTO send_jobs (user_id, chat_id, album_id, sender, title, done_text, file_ids, start_index)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, chat_id, album_id, sender, title, done_text,
+              json.dumps([int(f) for f in file_ids]), start_index))
+        self.commit()
+        return cur.lastrowid
+
+    def checkpoint_send_job(self, job_id, sent_count, progress_message_id=None):
+        """Зберегти контрольну точку надсилання (скільки файлів зі списку доставлено)"""
+        self.cursor.execute('''
+            UPDATE send_jobs
+            SET sent_count = ?, progress_message_id = COALESCE(?, progress_message_id),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = ?
+        ''', (sent_count, progress_message_id, job_id))
+        self.commit()
+
+    def finish_send_job(self, job_id):
+        """Надсилання завершене або скасоване — відновлювати нічого"""
+        self.cursor.execute("DELETE FROM send_jobs WHERE job_id = ?", (job_id,))
+        self.commit()
+
+    def get_unfinished_send_jobs(self):
+        return self.cursor.execute("SELECT * FROM send_jobs ORDER BY job_id").fetchall()
+
+    def get_files_by_ids(self, file_ids):
+        """Файли за file_id у порядку списку (видалених просто немає); ordinal — поточний номер"""
+        file_ids = [int(f) for f in file_ids]
+        rows = {}
+        # Порціями, щоб не впертися в ліміт параметрів SQLite
+        for i in range(0, len(file_ids), 500):
+            chunk = file_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.cursor.execute(
+                f"SELECT *, position AS ordinal FROM files WHERE file_id IN ({placeholders})", chunk
+            ):
+                rows[row['file_id']] = row
+        return [rows[f] for f in file_ids if f in rows]
+
+    # ========== ЗВІРКА ЛІЧИЛЬНИКІВ ==========
+
+    def reconcile_counters(self, after_album_id=0, after_folder_id=0, limit=RECONCILE_BATCH):
+        """
+        Перевірити й виправити files_count / entries_count для наступної порції
+        (до limit) альбомів і папок після заданих id. COUNT(*) іде по індексах.
+        Повертає (наступний after_album_id, наступний after_folder_id, скільки виправлено);
+        після останньої порції курсор повертається на 0.
+        """
+        cur = self.cursor
+        repaired = 0
+        try:
+            with self._atomic():
+                albums = cur.execute('''
+                    SELECT album_id, files_count,
+                           (SELECT COUNT(*) FROM files WHERE files.album_id = albums.album_id) AS actual
+                    FROM albums
+                    WHERE album_id > ?
+                    ORDER BY album_id
+                    LIMIT ?
+                ''', (after_album_id, limit)).fetchall()
+                for row in albums:
+                    if row['files_count'] != row['actual']:
+                        cur.execute("UPDATE albums SET files_count = ? WHERE album_id = ?", (row['actual'], row['album_id']))
+                        _evict_album(row['album_id'])
+                        repaired += 1
+
+                folders = cur.execute('''
+                    SELECT folder_id, entries_count,
+                           (SELECT COUNT(*) FROM note_entries WHERE note_entries.folder_id = note_folders.folder_id) AS actual
+                    FROM note_folders
+                    WHERE folder_id > ?
+                    ORDER BY folder_id
+                    LIMIT ?
+                ''', (after_folder_id, limit)).fetchall()
+                for row in folders:
+                    if row['entries_count'] != row['actual']:
+                        cur.execute("UPDATE note_folders SET entries_count = ? WHERE folder_id = ?", (row['actual'], row['folder_id']))
+                        repaired += 1
+
+                self.commit()
+        except Exception as e:
+            print(f"❌ Помилка звірки лічильників: {e}")
+            return after_album_id, after_folder_id, 0
+
+        next_album = albums[-1]['album_id'] if len(albums) == limit else 0
+        next_folder = folders[-1]['folder_id'] if len(folders) == limit else 0
+        return next_album, next_folder, repaired
+
+    # ========== МЕТОДИ ДЛЯ НОТАТОК ==========
+
+    def get_note_entries_by_date(self, folder_id, date_from, date_to=None):
+        """
+        Записи папки за день (або проміжок днів включно).
+        Колонка ordinal — номер запису в папці (порядок created_at, entry_id).
+        """
+        start, end = _day_bounds(date_from, date_to)
+        cur = self.cursor
+        return cur.execute('''
+            SELECT *,
+                (SELECT COUNT(*) FROM note_entries WHERE folder_id = ? AND created_at < ?)
+                + ROW_NUMBER() OVER (ORDER BY created_at, entry_id) AS ordinal
+            FROM note_entries
+            WHERE folder_id = ? AND created_at >= ? AND created_at < ?
+            ORDER BY created_at, entry_id
+        ''', (folder_id, start, folder_id, start, end)).fetchall()
     
     # ========== МЕТОДИ ДЛЯ ПРЕМІУМ ==========
     
@@ -554,7 +1686,8 @@ class Database:
         Встановити преміум статус.
         Якщо `subscription_type` задано — також створюємо запис в `premium_subscriptions` та лог `premium_events`.
         """
-        self.cursor.execute(
+        cur = self.cursor
+        cur.execute(
             '''
             UPDATE users
             SET is_premium = 1, premium_until = ?
@@ -565,11 +1698,11 @@ class Database:
 
         if subscription_type:
             # вимикаємо попередні активні преміуми
-            self.cursor.execute(
+            cur.execute(
                 "UPDATE premium_subscriptions SET is_active = 0 WHERE user_id = ? AND is_active = 1",
                 (user_id,),
             )
-            self.cursor.execute(
+            cur.execute(
                 '''
                 INSERT INTO premium_subscriptions (user_id, subscription_type, channel_id, granted_at, expires_at, is_active)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?, 1)
@@ -585,7 +1718,7 @@ class Database:
             else:
                 event_type = "grant_manual"
 
-            self.cursor.execute(
+            cur.execute(
                 '''
                 INSERT INTO premium_events (user_id, event_type, subscription_type, channel_id, event_at)
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
@@ -593,11 +1726,13 @@ class Database:
                 (user_id, event_type, subscription_type, channel_id),
             )
 
-        self.conn.commit()
+        self.commit()
+        _premium_index.set(user_id, expires_at)
     
     def remove_premium(self, user_id):
         """Забрати преміум статус (і залогувати подію)."""
-        active_sub = self.cursor.execute(
+        cur = self.cursor
+        active_sub = cur.execute(
             "SELECT subscription_type, channel_id FROM premium_subscriptions WHERE user_id = ? AND is_active = 1 ORDER BY granted_at DESC LIMIT 1",
             (user_id,),
         ).fetchone()
@@ -605,7 +1740,7 @@ class Database:
         sub_type = active_sub["subscription_type"] if active_sub else None
         ch_id = active_sub["channel_id"] if active_sub else None
 
-        self.cursor.execute(
+        cur.execute(
             '''
             UPDATE users
             SET is_premium = 0, premium_until = NULL
@@ -614,36 +1749,215 @@ class Database:
             (user_id,),
         )
 
-        self.cursor.execute(
+        cur.execute(
             "UPDATE premium_subscriptions SET is_active = 0 WHERE user_id = ? AND is_active = 1",
             (user_id,),
         )
 
-        self.cursor.execute(
+        cur.execute(
             '''
             INSERT INTO premium_events (user_id, event_type, subscription_type, channel_id, event_at)
             VALUES (?, 'remove', ?, ?, CURRENT_TIMESTAMP)
             ''',
             (user_id, sub_type, ch_id),
         )
-        self.conn.commit()
+        self.commit()
+        _premium_index.discard(user_id)
     
     def check_premium(self, user_id):
-        """Перевірити чи активний преміум"""
-        user = self.get_user(user_id)
-        if not user or not user['is_premium']:
-            return False
-        
-        # Перевіряємо термін дії
-        if user['premium_until']:
-            from datetime import datetime
+        """
+        Перевірити чи активний преміум — пошук в PremiumIndex без запиту до БД.
+        Прострочені Premium знімає expire_premiums (фонова задача).
+        """
+        _premium_index.ensure_loaded(self.conn)
+        return _premium_index.is_active(user_id)
+
+    def expire_premiums(self):
+        """Зняти Premium усім, у кого минув термін (за купою індексу). Повертає кількість"""
+        _premium_index.ensure_loaded(self.conn)
+        expired = _premium_index.pop_expired()
+        for user_id in expired:
+            self.remove_premium(user_id)
+        return len(expired)
+
+
+class _ReaderDatabase(Database):
+    """Database, прив'язана до підключення поточного потоку-читача (тільки читання)"""
+
+    def __init__(self, manager: ConnectionManager):
+        # Таблиці вже створені основним екземпляром — create_tables() не викликаємо
+        self.manager = manager
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.manager.open_connection()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+        return conn
+
+
+class AsyncDatabase:
+    """
+    Неблокуючий фасад над Database для async-обробників.
+    Записи, винесені з event loop (пакети прийому, фонові задачі), виконуються
+    в одному потоці-письменнику, читання — в невеликому пулі потоків (WAL).
+    Кожен потік працює через власне підключення; синхронні виклики Database
+    з обробників апдейтів пишуть у транзакцію свого unit of work (див.
+    Database.unit_of_work), яка фіксується перед кожним викликом read/write —
+    event loop не блокується, а потік не чекає на чужу відкриту транзакцію.
+    Чергу записів між підключеннями тримає блокування SQLite (busy_timeout).
+
+    Використання:
+        album = await adb.read(Database.get_album, album_id)
+        await adb.write(Database.add_file, album_id, file_id, "photo")
+        rows = await adb.fetchall("SELECT ...", (user_id,))
+    """
+
+    def __init__(self, db: Database, readers: int = READER_THREADS):
+        self.db = db
+        self._reader_db = _ReaderDatabase(db.manager)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+
+    async def _run(self, executor, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def read(self, fn, *args, **kwargs):
+        """
+        Виконати fn(db, ...) у потоці-читачі (без записів!).
+        Незафіксовані записи unit of work задачі спершу фіксуються: читач має їх
+        бачити, а транзакція не повинна бути відкритою, поки задача чекає.
+        """
+        flush_unit_of_work()
+        return await self._run(self._readers, fn, self._reader_db, *args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        """
+        Виконати fn(db, ...) у потоці-письменнику (своє підключення і свій commit).
+        Незафіксовані записи unit of work задачі фіксуються перед цим — як і перед
+        запитом до Telegram.
+        """
+        flush_unit_of_work()
+        return await self._run(self._writer, fn, self.db, *args, **kwargs)
+
+    async def fetchone(self, sql: str, params: tuple = ()):
+        return await self.read(lambda d: d.cursor.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: tuple = ()):
+        return await self.read(lambda d: d.cursor.execute(sql, params).fetchall())
+
+    async def fetchval(self, sql: str, params: tuple = ()):
+        """Перша колонка першого рядка (або None)"""
+        row = await self.fetchone(sql, params)
+        return row[0] if row else None
+
+    async def execute(self, sql: str, params: tuple = ()):
+        """Виконати один запит на запис з commit; повертає курсор (lastrowid/rowcount)"""
+        def _execute(d):
             try:
-                expires = datetime.strptime(user['premium_until'], '%Y-%m-%d %H:%M:%S')
-                if expires < datetime.now():
-                    self.remove_premium(user_id)
-                    return False
+                cur = d.cursor.execute(sql, params)
+                d.commit()
+                return cur
             except Exception:
-                # якщо дата пошкоджена, вважаємо преміум неактивним
-                return False
+                d.conn.rollback()
+                raise
+        return await self.write(_execute)
+
+    def close(self):
+        """Зупинити потоки (дочекавшись незавершених записів)"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+
+class FileIngestQueue:
+    """
+    Групує вхідні файли (медіагрупи, масові пересилання) в пакети:
+    записи накопичуються INGEST_FLUSH_MS мс або до INGEST_BATCH_LIMIT штук
+    і пишуться однією транзакцією через Database.add_files.
+
+    Використання:
+        file_db_id = await ingest.add(album_id, file_id, "photo", added_by=user_id)
+        if file_db_id is None: ...  # не збережено
+    """
+
+    def __init__(self, adb: AsyncDatabase, flush_ms: int = INGEST_FLUSH_MS, batch_limit: int = INGEST_BATCH_LIMIT):
+        self.adb = adb
+        self.flush_delay = flush_ms / 1000
+        self.batch_limit = batch_limit
+        self._pending = []  # [(record, future)]
+        self._timer = None
+        self._tasks = set()
+
+    async def add(self, album_id, telegram_file_id, file_type, file_name=None, file_size=None, added_by=None,
+                  origin_chat_id=None, origin_message_id=None):
+        """Поставити файл у чергу; повертає file_id після запису пакета (або None при помилці)"""
+        # Пакет пише потік-письменник своєю транзакцією — записи апдейта фіксуємо до очікування
+        flush_unit_of_work()
+        future = asyncio.get_running_loop().create_future()
+        record = (album_id, telegram_file_id, file_type, file_name, file_size, added_by, origin_chat_id, origin_message_id)
+        self._pending.append((record, future))
+
+        if len(self._pending) >= self.batch_limit:
+            self._spawn(self.flush())
+        elif self._timer is None:
+            self._timer = self._spawn(self._flush_later())
+        return await future
+
+    def _spawn(self, coro):
+        """
+        Запис пакета — окрема задача в чистому контексті: записи інших користувачів
+        не повинні потрапити в unit of work апдейта, що заповнив пакет.
+        """
+        task = contextvars.Context().run(asyncio.create_task, coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Записати все, що накопичилось"""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            results = await self.adb.write(Database.add_files, [record for record, _ in batch])
+        except Exception as e:
+            print(f"Помилка запису пакета файлів: {e}")
+            results = [None] * len(batch)
+
+        for (_, future), file_db_id in zip(batch, results):
+            if not future.done():
+                future.set_result(file_db_id)
+
+
+async def run_counter_reconciliation(adb: AsyncDatabase, interval: float = RECONCILE_INTERVAL_S, limit: int = RECONCILE_BATCH):
+    """Фонова звірка лічильників: щоінтервалу одна обмежена порція через потік-письменник"""
+    after_album, after_folder = 0, 0
+    while True:
+        await asyncio.sleep(interval)
+        after_album, after_folder, repaired = await adb.write(
+            Database.reconcile_counters, after_album, after_folder, limit
+        )
+        if repaired:
+            print(f"🔧 Виправлено лічильників: {repaired}")
+
 
-        return True
\ No newline at end of file
+async def run_premium_expiry(adb: AsyncDatabase, interval: float = PREMIUM_EXPIRY_INTERVAL_S):
+    """Фонове зняття прострочених Premium у потоці-письменнику"""
+    while True:
+        await asyncio.sleep(interval)
+        expired = await adb.write(Database.expire_premiums)
+        if expired:
+            print(f"⌛ Знято прострочених Premium: {expired}")
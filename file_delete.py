@@ -1,9 +1,9 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
-from db_models import Database
+from db_models import get_db
 import helpers
 
-db = Database()
+db = get_db()
 
 # ========== ОБРОБНИК КНОПОК МЕНЮ ВИДАЛЕННЯ ==========
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -156,21 +156,17 @@ async def delete_handle_recent_input(update: Update, context: ContextTypes.DEFAU
             return True
         
         album_id = context.user_data.get('current_album')
-        files = db.get_album_files(album_id)
+        selected_files = db.get_last_files(album_id, count)
         
-        if not files:
+        if not selected_files:
             await update.message.reply_text("📭 В альбомі немає файлів.")
             context.user_data.pop('delete_action', None)
             return True
         
-        total_files = len(files)
-        selected_files = files[-count:]
-        start_num = total_files - len(selected_files) + 1
-        
         await update.message.reply_text(f"📤 Надсилаю останні {len(selected_files)} файлів для видалення...")
         
-        for idx, file in enumerate(selected_files, start_num):
-            await delete_send_file_with_button(update, context, file, idx)
+        for file in selected_files:
+            await delete_send_file_with_button(update, context, file, file['ordinal'])
         
         context.user_data.pop('delete_action', None)
         return True
@@ -190,20 +186,18 @@ async def delete_handle_first_input(update: Update, context: ContextTypes.DEFAUL
             return True
         
         album_id = context.user_data.get('current_album')
-        files = db.get_album_files(album_id)
+        selected_files = db.get_first_files(album_id, count)
         
-        if not files:
+        if not selected_files:
             await update.message.reply_text("📭 В альбомі немає файлів.")
             context.user_data.pop('delete_action', None)
             context.user_data.pop('awaiting_delete_input', None)
             return True
         
-        selected_files = files[:count]
-        
         await update.message.reply_text(f"📤 Надсилаю перші {len(selected_files)} файлів для видалення...")
         
-        for idx, file in enumerate(selected_files, 1):
-            await delete_send_file_with_button(update, context, file, idx)
+        for file in selected_files:
+            await delete_send_file_with_button(update, context, file, file['ordinal'])
         
         context.user_data.pop('delete_action', None)
         context.user_data.pop('awaiting_delete_input', None)
@@ -229,8 +223,7 @@ async def delete_handle_range_input(update: Update, context: ContextTypes.DEFAUL
             return True
         
         album_id = context.user_data.get('current_album')
-        files = db.get_album_files(album_id)
-        total_files = len(files)
+        total_files = db.count_album_files(album_id)
         
         if start > total_files:
             await update.message.reply_text(f"❌ Початкове число більше {total_files}")
@@ -240,12 +233,12 @@ async def delete_handle_range_input(update: Update, context: ContextTypes.DEFAUL
             end = total_files
             await update.message.reply_text(f"⚠️ Кінцеве число скориговано до {total_files}")
         
-        selected_files = files[start-1:end]
+        selected_files = db.get_files_range(album_id, start, end)
         
         await update.message.reply_text(f"📤 Надсилаю файли з {start} по {end} (всього {len(selected_files)}) для видалення...")
         
-        for idx, file in enumerate(selected_files, start):
-            await delete_send_file_with_button(update, context, file, idx)
+        for file in selected_files:
+            await delete_send_file_with_button(update, context, file, file['ordinal'])
         
         context.user_data.pop('delete_action', None)
         context.user_data.pop('awaiting_delete_input', None)
@@ -258,22 +251,21 @@ async def delete_handle_range_input(update: Update, context: ContextTypes.DEFAUL
 async def delete_handle_date_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник введення дати для видалення"""
     
-    date_str = update.message.text
     album_id = context.user_data.get('current_album')
     
     try:
-        from datetime import datetime
-        datetime.strptime(date_str, '%Y-%m-%d')
+        date_from, date_to = helpers.parse_date_range(update.message.text)
+        date_str = helpers.date_range_label(date_from, date_to)
         
-        files = db.get_files_by_date(album_id, date_str)
+        files = db.get_files_by_date(album_id, date_from, date_to)
         
         if not files:
             await update.message.reply_text(f"📭 Немає файлів за {date_str}")
         else:
             await update.message.reply_text(f"📤 Надсилаю {len(files)} файлів за {date_str} для видалення...")
             
-            for idx, file in enumerate(files, 1):
-                await delete_send_file_with_button(update, context, file, idx)
+            for file in files:
+                await delete_send_file_with_button(update, context, file, file['ordinal'])
         
         context.user_data.pop('delete_action', None)
         context.user_data.pop('awaiting_delete_input', None)
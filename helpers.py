@@ -1,8 +1,11 @@
 from datetime import datetime
 import json
+import re
 from typing import Optional
 
 from config import FREE_LIMITS
+from cache import LRUCache
+from db_models import on_rollback
 
 def format_date(date_str):
     """Форматування дати для відображення"""
@@ -15,6 +18,31 @@ def format_date(date_str):
     except:
         return date_str
 
+_DATE_RANGE_RE = re.compile(
+    r"^\s*(\d{4}-\d{2}-\d{2})(?:\s*(?:\.\.|—|–|-)\s*(\d{4}-\d{2}-\d{2}))?\s*$"
+)
+
+def parse_date_range(text):
+    """
+    Розбір дати або проміжку дат від користувача:
+    'РРРР-ММ-ДД' або 'РРРР-ММ-ДД - РРРР-ММ-ДД' (також '..', '—').
+    Повертає (date_from, date_to) рядками; для одного дня вони однакові.
+    Кидає ValueError при невірному форматі.
+    """
+    match = _DATE_RANGE_RE.match(text or "")
+    if not match:
+        raise ValueError(f"Невірний формат дати: {text}")
+    date_from = match.group(1)
+    date_to = match.group(2) or date_from
+    # strptime перевіряє, що дата реальна (не 2024-02-31)
+    if datetime.strptime(date_to, '%Y-%m-%d') < datetime.strptime(date_from, '%Y-%m-%d'):
+        date_from, date_to = date_to, date_from
+    return date_from, date_to
+
+def date_range_label(date_from, date_to):
+    """Текст дати/проміжку для повідомлень"""
+    return date_from if date_from == date_to else f"{date_from} — {date_to}"
+
 def get_file_emoji(file_type):
     """Отримати емодзі для типу файлу"""
     emojis = {
@@ -38,31 +66,24 @@ def check_user_limit(db, user_id, limit_type):
     if db.check_premium(user_id):
         return True  # Для Premium лімітів немає
 
+    # Усі лічильники — один рядок user_usage (без COUNT(*))
+    usage = db.get_usage(user_id)
+
     if limit_type == 'albums':
         personal_limit = FREE_LIMITS.get("albums", 3)
-        personal = db.count_personal_albums(user_id)
-        return personal < personal_limit
+        return usage['albums'] < personal_limit
 
     if limit_type == 'shared_albums':
         shared_limit = FREE_LIMITS.get("shared_albums", 3)
-        owned_shared = db.count_owned_shared_albums(user_id)
-        return owned_shared < shared_limit
+        return usage['shared_albums'] < shared_limit
 
     if limit_type == 'notes':
         notes_limit = FREE_LIMITS.get("notes", 3)
-        rows = db.cursor.execute(
-            "SELECT COUNT(*) FROM note_folders WHERE user_id = ? AND is_archived = 0",
-            (user_id,),
-        ).fetchone()
-        return int(rows[0]) < notes_limit
+        return usage['note_folders'] < notes_limit
 
     if limit_type == 'shared_notes':
         shared_notes_limit = FREE_LIMITS.get("shared_notes", 3)
-        rows = db.cursor.execute(
-            "SELECT COUNT(*) FROM note_folders WHERE user_id = ? AND is_shared = 1 AND is_archived = 0",
-            (user_id,),
-        ).fetchone()
-        return int(rows[0]) < shared_notes_limit
+        return usage['shared_note_folders'] < shared_notes_limit
 
     # Для інших ресурсів поки що лімітів немає
     return True
@@ -80,9 +101,8 @@ def exceeded_album_limits_without_premium(db, user_id):
 
     personal_limit = FREE_LIMITS.get("albums", 3)
     shared_limit = FREE_LIMITS.get("shared_albums", 3)
-    personal = db.count_personal_albums(user_id)
-    owned_shared = db.count_owned_shared_albums(user_id)
-    return personal > personal_limit or owned_shared > shared_limit
+    usage = db.get_usage(user_id)
+    return usage['albums'] > personal_limit or usage['shared_albums'] > shared_limit
 
 def get_privacy_settings(db, user_id):
     """Отримати налаштування приватності"""
@@ -103,7 +123,8 @@ def save_privacy_settings(db, user_id, settings):
         "UPDATE users SET privacy_settings = ? WHERE user_id = ?",
         (json.dumps(settings), user_id)
     )
-    db.conn.commit()
+    db.commit()
+    invalidate_display_settings(user_id)
 
 
 # Додати в кінець helpers.py
@@ -142,24 +163,78 @@ def get_role_name(access_level):
     }
     return roles.get(access_level, 'Учасник')
 
+# Кеш налаштувань відображення: user_id -> dict.
+# Скидається в save_user_display_settings / save_privacy_settings і після rollback.
+DISPLAY_SETTINGS_CACHE_SIZE = 4096
+_display_settings_cache = LRUCache(DISPLAY_SETTINGS_CACHE_SIZE)
+
 def get_user_display_settings(db, user_id):
-    """Отримати налаштування відображення користувача"""
+    """Отримати налаштування відображення користувача (з кешу, якщо вже читали)"""
+    cached = _display_settings_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+
     result = db.cursor.execute(
         "SELECT display_settings FROM users WHERE user_id = ?",
         (user_id,)
     ).fetchone()
     
     if result and result['display_settings']:
-        import json
-        return json.loads(result['display_settings'])
+        settings = json.loads(result['display_settings'])
+    else:
+        settings = {'show_number': True, 'show_date': True}
     
-    return {'show_number': True, 'show_date': True}
+    _display_settings_cache.put(user_id, settings)
+    return dict(settings)
+
+def invalidate_display_settings(user_id=None):
+    """Скинути кеш налаштувань відображення (одного користувача або весь)"""
+    if user_id is None:
+        _display_settings_cache.clear()
+    else:
+        _display_settings_cache.pop(user_id)
+
+@on_rollback
+def _reset_display_settings():
+    """Після rollback у кеші могли лишитись відкочені налаштування"""
+    _display_settings_cache.clear()
+
+def display_settings_cache_stats():
+    """Статистика кешу налаштувань (hits / misses / hit_rate / size)"""
+    return _display_settings_cache.stats()
+
+# Кеш відрендерених екранів-списків: (user_id, екран, версія списків) -> (text, reply_markup, parse_mode).
+# Версію збільшує будь-яка зміна альбомів / папок користувача (db.list_version),
+# тож застарілі записи просто більше не запитуються і витісняються LRU.
+LIST_SCREEN_CACHE_SIZE = 4096
+_list_screen_cache = LRUCache(LIST_SCREEN_CACHE_SIZE)
+
+def list_screen_key(db, user_id, screen):
+    """Ключ кешу екрана для поточної версії списків користувача"""
+    return (user_id, screen, db.list_version(user_id))
+
+def get_list_screen(key):
+    """(text, reply_markup, parse_mode) або None"""
+    return _list_screen_cache.get(key)
+
+def put_list_screen(key, text, reply_markup, parse_mode=None):
+    screen = (text, reply_markup, parse_mode)
+    _list_screen_cache.put(key, screen)
+    return screen
+
+@on_rollback
+def invalidate_list_screens():
+    """Після rollback у кеші могли лишитись екрани з відкоченими змінами"""
+    _list_screen_cache.clear()
+
+def list_screen_cache_stats():
+    return _list_screen_cache.stats()
 
 def save_user_display_settings(db, user_id, settings):
     """Зберегти налаштування відображення користувача"""
-    import json
     db.cursor.execute(
         "UPDATE users SET display_settings = ? WHERE user_id = ?",
         (json.dumps(settings), user_id)
     )
-    db.conn.commit()
\ No newline at end of file
+    db.commit()
+    invalidate_display_settings(user_id)
\ No newline at end of file
@@ -0,0 +1,192 @@
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+
+# Реєстр клавіатур: статичні клавіатури будуються один раз при імпорті
+# і використовуються спільно (об'єкти telegram незмінні), параметризовані —
+# через невеликі мемоізовані будівники.
+
+LIST_KEYBOARD_CACHE_SIZE = 512
+
+
+def _reply(rows) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        [[KeyboardButton(text) for text in row] for row in rows],
+        resize_keyboard=True,
+    )
+
+
+# ========== АЛЬБОМИ ==========
+
+ALBUM_KEYBOARD = _reply([
+    ["📤 Надіслати весь альбом"],
+    ["⏳ Надіслати останні", "⏮ Надіслати перші"],
+    ["🔢 Надіслати проміжок", "📅 Надіслати за датою"],
+    ["⋯ Додаткові дії"],
+    ["◀️ Вийти з альбому"],
+])
+
+ALBUM_ADDITIONAL_KEYBOARD = _reply([
+    ["ℹ️ Інформація", "🗑 Видалити файли"],
+    ["🗂 Архівувати альбом", "🗑 Видалити альбом"],
+    ["👥 Зробити спільним"],
+    ["◀️ Назад до альбому"],
+])
+
+# Меню видалення (префікс "Надіслати:") — однакове для особистих і спільних альбомів
+ALBUM_DELETE_KEYBOARD = _reply([
+    ["Надіслати: Весь альбом"],
+    ["Надіслати: Останні", "Надіслати: Перші"],
+    ["Надіслати: Проміжок"],
+    ["Надіслати: За датою"],
+    ["◀️ Назад до альбому"],
+])
+
+SHARED_ALBUM_KEYBOARD = _reply([
+    ["📤 Надіслати весь альбом"],
+    ["⏳ Надіслати останні", "⏮ Надіслати перші"],
+    ["🔢 Надіслати проміжок", "📅 Надіслати за датою"],
+    ["⋯ Додаткові опції"],
+    ["◀️ Вийти з альбому"],
+])
+
+SHARED_BACK_TO_OPTIONS_KEYBOARD = _reply([["◀️ Назад до додаткових опцій"]])
+
+CONFIRM_DELETE_KEYBOARD = _reply([["✅ Так, видалити"], ["❌ Ні, скасувати"]])
+
+CONFIRM_ARCHIVE_KEYBOARD = _reply([["✅ Так, архівувати"], ["❌ Ні, скасувати"]])
+
+
+
+@lru_cache(maxsize=None)
+def shared_album_additional_keyboard(access_level: str) -> ReplyKeyboardMarkup:
+    """Додаткові опції спільного альбому залежно від ролі"""
+    rows = [["👥 Учасники", "ℹ️ Інформація"]]
+    if access_level in ['owner', 'admin']:
+        rows.append(["🗑 Видалити файл", "🗂 Архівувати альбом"])
+    elif access_level in ['editor', 'contributor']:
+        rows.append(["🗑 Видалити файл"])
+    if access_level == 'owner':
+        rows.append(["🗑 Видалити альбом", "📷 Перенести до моїх альбомів"])
+    rows.append(["◀️ Назад до альбому"])
+    return _reply(rows)
+
+
+@lru_cache(maxsize=None)
+def shared_album_members_keyboard(can_manage: bool) -> ReplyKeyboardMarkup:
+    """Меню учасників спільного альбому"""
+    rows = [["📋 Переглянути всіх учасників"]]
+    if can_manage:
+        rows += [["➕ Додати учасника"], ["⚙️ Змінити ролі"], ["🗑 Видалити учасника"]]
+    rows.append(["◀️ Назад до додаткових опцій"])
+    return _reply(rows)
+
+
+@lru_cache(maxsize=LIST_KEYBOARD_CACHE_SIZE)
+def albums_list_keyboard(albums: tuple) -> InlineKeyboardMarkup:
+    """Список особистих альбомів; albums — кортеж (album_id, name, files_count)"""
+    keyboard = [
+        [InlineKeyboardButton(f"{name} ({files_count} файлів)", callback_data=f"open_album_{album_id}")]
+        for album_id, name, files_count in albums
+    ]
+    keyboard.append([
+        InlineKeyboardButton("➕ Створити", callback_data="create_album"),
+        InlineKeyboardButton("🗂 Архів", callback_data="show_archived")
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+_ROLE_EMOJI = {
+    'owner': '👑', 'admin': '⚙️', 'editor': '✏️',
+    'contributor': '📤', 'viewer': '👁️'
+}
+
+
+@lru_cache(maxsize=LIST_KEYBOARD_CACHE_SIZE)
+def shared_albums_list_keyboard(albums: tuple) -> InlineKeyboardMarkup:
+    """Список спільних альбомів; albums — кортеж (album_id, name, files_count, access_level)"""
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{_ROLE_EMOJI.get(access_level, '👤')} {name} ({files_count} файлів)",
+            callback_data=f"shared_open_{album_id}"
+        )]
+        for album_id, name, files_count, access_level in albums
+    ]
+    keyboard.append([InlineKeyboardButton("➕ Створити новий спільний", callback_data="shared_create")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def list_keyboard_cache_stats() -> dict:
+    """Статистика мемоізованих будівників списків"""
+    return {
+        "albums": albums_list_keyboard.cache_info()._asdict(),
+        "shared_albums": shared_albums_list_keyboard.cache_info()._asdict(),
+    }
+
+
+# ========== НОТАТКИ ==========
+
+NOTES_FOLDER_KEYBOARD = _reply([
+    ["📤 Надіслати всю папку"],
+    ["⏳ Надіслати останні", "⏮ Надіслати перші"],
+    ["🔢 Надіслати проміжок", "📅 Надіслати за датою"],
+    ["⋯ Додаткові дії"],
+    ["◀️ Вийти з папки"],
+])
+
+NOTES_ADDITIONAL_KEYBOARD = _reply([
+    ["ℹ️ Інформація папки", "📦 Зробити спільною"],
+    ["🗑 Видалити запис", "🗂 Архівувати папку"],
+    ["🔥 Видалити папку"],
+    ["◀️ Назад до папки"],
+])
+
+NOTES_DELETE_MENU_KEYBOARD = _reply([
+    ["Надіслати: Весь альбом"],
+    ["Надіслати: Останні", "Надіслати: Перші"],
+    ["Надіслати: Проміжок", "Надіслати: За датою"],
+    ["◀️ Назад до папки"],
+])
+
+SHARED_NOTES_ADDITIONAL_KEYBOARD = _reply([
+    ["ℹ️ Інформація папки", "👥 Учасники"],
+    ["🗑 Видалити запис", "🗂 Архівувати папку"],
+    ["🔥 Видалити папку", "↩️ Перенести в Мої нотатки"],
+    ["◀️ Назад до папки"],
+])
+
+SHARED_NOTES_MEMBERS_KEYBOARD = _reply([
+    ["📋 Всі учасники"],
+    ["◀️ Назад до додаткових дій"],
+])
+
+SHARED_NOTES_MEMBERS_MANAGE_KEYBOARD = _reply([
+    ["📋 Всі учасники"],
+    ["➕ Додати учасника"],
+    ["✏️ Змінити роль"],
+    ["🗑 Видалити учасника"],
+    ["◀️ Назад до додаткових дій"],
+])
+
+SHARED_NOTES_CHANGE_ROLE_MENU_KEYBOARD = _reply([
+    ["📋 Надіслати всіх учасників для зміни ролі"],
+    ["✏️ Змінити роль за юзернеймом"],
+    ["◀️ Назад до учасників"],
+])
+
+SHARED_NOTES_DELETE_MEMBER_MENU_KEYBOARD = _reply([
+    ["📋 Надіслати всіх учасників для видалення"],
+    ["🗑 Видалити за юзернеймом"],
+    ["◀️ Назад до учасників"],
+])
+
+SHARED_NOTES_ROLES_KEYBOARD = _reply([
+    ["⚙️ Адмін", "✏️ Редактор"],
+    ["📤 Автор", "👁️ Спостерігач"],
+    ["◀️ Назад до учасників"],
+])
+
+SHARED_NOTES_MEMBER_DELETE_CONFIRM_KEYBOARD = _reply([
+    ["✅ Так", "❌ Ні"],
+    ["◀️ Назад до учасників"],
+])
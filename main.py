@@ -1,5 +1,6 @@
 import logging
 import asyncio
+import functools
 import traceback
 import urllib.parse
 import urllib.request
@@ -11,12 +12,19 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler,
     ChatMemberHandler,
+    TypeHandler,
     filters,
     ContextTypes
 )
 from config import BOT_TOKEN, ADMIN_IDS, FREE_LIMITS
-from db_models import Database
+from db_models import (
+    Database, get_db, get_async_db, get_ingest_queue, flush_unit_of_work,
+    run_counter_reconciliation, run_premium_expiry,
+)
 import helpers
+from keyboards import (
+    ALBUM_KEYBOARD, ALBUM_ADDITIONAL_KEYBOARD, ALBUM_DELETE_KEYBOARD, albums_list_keyboard,
+)
 from file_delete import (
     delete_this_file,
     confirm_file_delete,
@@ -34,7 +42,7 @@ from album_view import (
     send_recent_start, handle_recent_count,
     send_all_files, send_by_date_start,
     handle_date_input, album_info,
-    send_file_by_type,
+    send_jobs, handle_send_job_callback, resume_send_jobs,
     handle_first_count,          # ДОДАНО
     handle_range_input_normal    # ДОДАНО
 )
@@ -45,6 +53,7 @@ from album_manage import (
     handle_delete_confirmation
 )
 from premium import show_premium_menu, handle_premium_callback
+from rate_limiter import get_rate_limiter
 from admin import admin_start, handle_admin_text, handle_admin_broadcast_message
 from notes import (
     show_my_notes as notes_show_my_notes,
@@ -95,7 +104,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Глобальний об'єкт БД
-db = Database()
+db = get_db()
+adb = get_async_db()
+ingest = get_ingest_queue()
 
 # Головне меню (згідно ТЗ)
 MAIN_MENU = ReplyKeyboardMarkup([
@@ -155,38 +166,44 @@ async def show_archived_albums(update: Update, context: ContextTypes.DEFAULT_TYP
     
     user_id = query.from_user.id
     
-    # Отримуємо ТІЛЬКИ архівовані альбоми
-    archived_albums = db.cursor.execute(
-        "SELECT * FROM albums WHERE user_id = ? AND is_archived = 1 ORDER BY created_at DESC",
-        (user_id,)
-    ).fetchall()
-    
-    if not archived_albums:
-        await query.edit_message_text(
-            "🗂 У вас немає архівованих альбомів.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("◀️ Назад", callback_data="back_to_albums")
-            ]])
-        )
-        return
-    
-    text = "🗂 **Архівовані альбоми**\n\n"
-    keyboard = []
-    
-    for album in archived_albums:
-        album_text = f"{album['name']} ({album['files_count']} файлів)"
-        keyboard.append([InlineKeyboardButton(
-            album_text, 
-            callback_data=f"unarchive_album_{album['album_id']}"
-        )])
-    
-    # Додаємо кнопку "Назад" внизу
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_albums")])
+    key = helpers.list_screen_key(db, user_id, "archived_albums")
+    screen = helpers.get_list_screen(key)
+    if screen is None:
+        # Отримуємо ТІЛЬКИ архівовані альбоми
+        archived_albums = db.cursor.execute(
+            "SELECT * FROM albums WHERE user_id = ? AND is_archived = 1 ORDER BY created_at DESC",
+            (user_id,)
+        ).fetchall()
+        
+        if not archived_albums:
+            screen = helpers.put_list_screen(
+                key,
+                "🗂 У вас немає архівованих альбомів.",
+                InlineKeyboardMarkup([[
+                    InlineKeyboardButton("◀️ Назад", callback_data="back_to_albums")
+                ]])
+            )
+        else:
+            keyboard = []
+            
+            for album in archived_albums:
+                album_text = f"{album['name']} ({album['files_count']} файлів)"
+                keyboard.append([InlineKeyboardButton(
+                    album_text, 
+                    callback_data=f"unarchive_album_{album['album_id']}"
+                )])
+            
+            # Додаємо кнопку "Назад" внизу
+            keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_albums")])
+            screen = helpers.put_list_screen(
+                key, "🗂 **Архівовані альбоми**\n\n", InlineKeyboardMarkup(keyboard), 'Markdown'
+            )
     
+    text, reply_markup, parse_mode = screen
     await query.edit_message_text(
         text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
+        reply_markup=reply_markup,
+        parse_mode=parse_mode
     )
 
 
@@ -312,10 +329,13 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ========== РОЗДІЛ "МОЇ АЛЬБОМИ" ==========
 
-async def show_my_albums(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показати список особистих альбомів"""
-    user_id = update.effective_user.id
-    
+def _my_albums_screen(user_id):
+    """Екран «Мої альбоми»: (text, reply_markup, parse_mode), з кешу, поки не змінились списки користувача"""
+    key = helpers.list_screen_key(db, user_id, "my_albums")
+    screen = helpers.get_list_screen(key)
+    if screen is not None:
+        return screen
+
     # Отримуємо альбоми з БД
     albums = db.get_user_albums(user_id, include_archived=False)
     
@@ -325,39 +345,31 @@ async def show_my_albums(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("➕ Створити альбом", callback_data="create_album")],
             [InlineKeyboardButton("🗂 Архівовані", callback_data="show_archived")]
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
+        return helpers.put_list_screen(
+            key,
             "📷 У вас ще немає альбомів.\n\n"
             "Створіть перший альбом, щоб почати зберігати файли!",
-            reply_markup=reply_markup
+            InlineKeyboardMarkup(keyboard),
         )
-        return
     
     # Формуємо список альбомів
-    text = "📷 **Мої альбоми**\n\n"
-    keyboard = []
-    
-    for album in albums:
-        # Формат: 🌊 Море 2018 (24 файли)
-        album_text = f"{album['name']} ({album['files_count']} файлів)"
-        keyboard.append([InlineKeyboardButton(
-            album_text, 
-            callback_data=f"open_album_{album['album_id']}"
-        )])
-    
-    # Додаємо кнопки керування
-    keyboard.append([
-        InlineKeyboardButton("➕ Створити", callback_data="create_album"),
-        InlineKeyboardButton("🗂 Архів", callback_data="show_archived")
-    ])
+    # Клавіатура списку мемоізована за вмістом (id, назва, кількість файлів)
+    reply_markup = albums_list_keyboard(
+        tuple((album['album_id'], album['name'], album['files_count']) for album in albums)
+    )
+    return helpers.put_list_screen(key, "📷 **Мої альбоми**\n\n", reply_markup, 'Markdown')
+
+
+async def show_my_albums(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показати список особистих альбомів"""
+    user_id = update.effective_user.id
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup, parse_mode = _my_albums_screen(user_id)
     
     await update.message.reply_text(
         text,
         reply_markup=reply_markup,
-        parse_mode='Markdown'
+        parse_mode=parse_mode
     )
 
 async def create_album_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -461,13 +473,7 @@ async def handle_album_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # РЕПЛАЙ КЛАВІАТУРА для альбому
-    album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові дії")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+    album_keyboard = ALBUM_KEYBOARD
     
     # Відправляємо повідомлення з клавіатурою альбому
     await update.message.reply_text(
@@ -513,6 +519,9 @@ async def open_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Альбом не знайдено.")
         return
     
+    # Індекс файлів для наступних дій (останні / перші / проміжок / за датою / видалення)
+    await adb.read(Database.open_album_index, album_id)
+    
     # Інформація про альбом
     text = (
         f"📁 **{album['name']}**\n"
@@ -520,13 +529,7 @@ async def open_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # РЕПЛАЙ КЛАВІАТУРА (всі кнопки)
-    album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові дії")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+    album_keyboard = ALBUM_KEYBOARD
     
     # Спочатку редагуємо повідомлення (без зміни клавіатури)
     await query.edit_message_text(
@@ -546,8 +549,7 @@ async def open_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def start_delete_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, album_id):
     """Запуск меню видалення файлів з префіксом 'Надіслати:'"""
-    files = db.get_album_files(album_id)
-    total_files = len(files)
+    total_files = db.count_album_files(album_id)
     
     text = (
         f"🗑 **Меню видалення файлів**\n\n"
@@ -556,13 +558,7 @@ async def start_delete_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
     )
     
     # Використовуємо префікс "Надіслати:", щоб відрізнити від звичайного меню
-    delete_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("Надіслати: Весь альбом")],
-        [KeyboardButton("Надіслати: Останні"), KeyboardButton("Надіслати: Перші")],
-        [KeyboardButton("Надіслати: Проміжок")],
-        [KeyboardButton("Надіслати: За датою")],
-        [KeyboardButton("◀️ Назад до альбому")]
-    ], resize_keyboard=True)
+    delete_keyboard = ALBUM_DELETE_KEYBOARD
     
     context.user_data['in_delete_menu'] = True
     context.user_data['delete_menu_album'] = album_id
@@ -643,12 +639,12 @@ async def handle_album_buttons(update: Update, context: ContextTypes.DEFAULT_TYP
             return True
         
         album = db.get_album(album_id)
-        await update.message.reply_text(f"📤 Надсилаю всі {len(files)} файлів з альбому '{album['name']}'...")
-        
-        for idx, file in enumerate(files, 1):
-            await send_file_by_type(update, context, file, index=idx)
-        
-        await update.message.reply_text("✅ Готово!")
+        # Надсилання йде у фоні: прогрес, кнопка скасування, черга на користувача
+        await send_jobs.submit(
+            update, context, files,
+            f"📤 Надсилаю всі {len(files)} файлів з альбому '{album['name']}'...",
+            start_index=1
+        )
         return True
     
 
@@ -697,12 +693,7 @@ async def handle_album_buttons(update: Update, context: ContextTypes.DEFAULT_TYP
     elif text == "⋯ Додаткові дії":
         context.user_data['in_additional_menu'] = True
         
-        additional_keyboard = ReplyKeyboardMarkup([
-            [KeyboardButton("ℹ️ Інформація"), KeyboardButton("🗑 Видалити файли")],
-            [KeyboardButton("🗂 Архівувати альбом"), KeyboardButton("🗑 Видалити альбом")],
-            [KeyboardButton("👥 Зробити спільним")],
-            [KeyboardButton("◀️ Назад до альбому")]
-        ], resize_keyboard=True)
+        additional_keyboard = ALBUM_ADDITIONAL_KEYBOARD
         
         await update.message.reply_text(
             "📋 **Додаткові дії**\n\nОберіть потрібну дію:",
@@ -802,13 +793,7 @@ async def handle_album_buttons(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def return_to_album_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE, album_id):
     """Повернення до основної клавіатури альбому"""
-    album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові дії")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+    album_keyboard = ALBUM_KEYBOARD
     
     await update.message.reply_text(
         "🔙 Повернення до альбому",
@@ -912,7 +897,7 @@ async def handle_delete_confirmation(update: Update, context: ContextTypes.DEFAU
             return True
         
         # Перевіряємо, чи успішно видалила база даних!
-        success = db.delete_album(album_id)
+        success = await adb.write(Database.delete_album, album_id)
         
         if success:
             # Очищаємо всі дані тільки якщо видалення пройшло успішно
@@ -970,11 +955,6 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Якщо немає активного альбому, ігноруємо
         return
     
-    # Отримуємо дані альбому
-    album = db.get_album(current_album)
-    if not album:
-        return
-    
     # Визначаємо тип файлу і отримуємо file_id
     file_id = None
     file_type = None
@@ -1012,15 +992,20 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         return
     
-    # Зберігаємо файл в БД (це відбувається для КОЖНОГО файлу)
-    db.add_file(
-        album_id=current_album,
-        telegram_file_id=file_id,
-        file_type=file_type,
+    # Зберігаємо файл через чергу прийому: файли медіагрупи пишуться одним пакетом
+    saved = await ingest.add(
+        current_album,
+        file_id,
+        file_type,
         file_name=file_name,
         file_size=file_size,
-        added_by=user_id
+        added_by=user_id,
+        origin_chat_id=update.effective_chat.id,
+        origin_message_id=update.message.message_id
     )
+    if saved is None:
+        await update.message.reply_text("❌ Не вдалося зберегти файл. Спробуйте ще раз.")
+        return
     
     # УГРУПОВАННЯ ПІДТВЕРДЖЕНЬ
     media_group_id = update.message.media_group_id
@@ -1030,8 +1015,10 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         notified_key = f"notified_{media_group_id}"
         
         # Перевіряємо, чи ми вже відправляли підтвердження для цієї групи
+        # (альбом читаємо лише для підтвердження, а не для кожного файлу)
         if not context.user_data.get(notified_key):
             context.user_data[notified_key] = True
+            album = await adb.read(Database.get_album, current_album)
             await update.message.reply_text(
                 f"✅ Групу файлів успішно збережено в альбом '{album['name']}'!"
             )
@@ -1044,6 +1031,7 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             asyncio.create_task(clear_media_cache())
     else:
         # Якщо файл надіслано один (не групою)
+        album = await adb.read(Database.get_album, current_album)
         emoji = helpers.get_file_emoji(file_type)
         await update.message.reply_text(
             f"{emoji} Файл збережено в альбом '{album['name']}'"
@@ -1133,47 +1121,12 @@ async def back_to_albums(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.pop('current_album', None)
     context.user_data.pop('in_additional_menu', None)
     
-    # Отримуємо альбоми з БД
-    albums = db.get_user_albums(user_id, include_archived=False)
-    
-    if not albums:
-        # Якщо альбомів немає
-        keyboard = [
-            [InlineKeyboardButton("➕ Створити альбом", callback_data="create_album")],
-            [InlineKeyboardButton("🗂 Архівовані", callback_data="show_archived")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            "📷 У вас ще немає альбомів.\n\n"
-            "Створіть перший альбом, щоб почати зберігати файли!",
-            reply_markup=reply_markup
-        )
-        return
-    
-    # Формуємо список альбомів
-    text = "📷 **Мої альбоми**\n\n"
-    keyboard = []
-    
-    for album in albums:
-        album_text = f"{album['name']} ({album['files_count']} файлів)"
-        keyboard.append([InlineKeyboardButton(
-            album_text, 
-            callback_data=f"open_album_{album['album_id']}"
-        )])
-    
-    # Додаємо кнопки керування
-    keyboard.append([
-        InlineKeyboardButton("➕ Створити", callback_data="create_album"),
-        InlineKeyboardButton("🗂 Архів", callback_data="show_archived")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup, parse_mode = _my_albums_screen(user_id)
     
     await query.edit_message_text(
         text,
         reply_markup=reply_markup,
-        parse_mode='Markdown'
+        parse_mode=parse_mode
     )
 
 
@@ -1188,10 +1141,12 @@ async def show_display_settings(update: Update, context: ContextTypes.DEFAULT_TY
     
     num_btn = "✅ Відображати номер запису/файлу" if settings.get('show_number', True) else "❌ Відображати номер"
     date_btn = "✅ Відображати дату запису/додавання" if settings.get('show_date', True) else "❌ Відображати дату"
+    group_btn = "✅ Надсилати файли альбомами (до 10)" if settings.get('group_media', True) else "❌ Надсилати файли альбомами"
     
     keyboard = [
         [InlineKeyboardButton(num_btn, callback_data="toggle_show_number")],
         [InlineKeyboardButton(date_btn, callback_data="toggle_show_date")],
+        [InlineKeyboardButton(group_btn, callback_data="toggle_group_media")],
         [InlineKeyboardButton("◀️ Назад до налаштувань", callback_data="back_to_settings")]
     ]
     
@@ -1225,6 +1180,8 @@ async def toggle_display_setting(update: Update, context: ContextTypes.DEFAULT_T
         settings['show_number'] = not settings.get('show_number', True)
     elif action == "toggle_show_date":
         settings['show_date'] = not settings.get('show_date', True)
+    elif action == "toggle_group_media":
+        settings['group_media'] = not settings.get('group_media', True)
         
     helpers.save_user_display_settings(db, user_id, settings)
     
@@ -1542,7 +1499,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "display_settings":
         await show_display_settings(update, context)
         
-    elif data in ["toggle_show_number", "toggle_show_date"]:
+    elif data in ["toggle_show_number", "toggle_show_date", "toggle_group_media"]:
         await toggle_display_setting(update, context)
         
     elif data == "back_to_settings":
@@ -1568,22 +1525,8 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data.startswith("do_del_"):
         f_id = int(data.split('_')[2])
-        album_row = None
-        try:
-            album_row = db.cursor.execute("SELECT album_id FROM files WHERE id = ?", (f_id,)).fetchone()
-            db.cursor.execute("DELETE FROM files WHERE id = ?", (f_id,))
-        except Exception:
-            album_row = db.cursor.execute("SELECT album_id FROM files WHERE file_id = ?", (f_id,)).fetchone()
-            db.cursor.execute("DELETE FROM files WHERE file_id = ?", (f_id,))
-
-        if album_row is not None:
-            album_id = album_row['album_id']
-            db.cursor.execute(
-                "UPDATE albums SET files_count = (SELECT COUNT(*) FROM files WHERE album_id = ?) WHERE album_id = ?",
-                (album_id, album_id)
-            )
-
-        db.conn.commit()
+        # delete_file сам оновлює лічильник і нумерацію файлів альбому
+        db.delete_file(f_id)
         await query.message.delete()
         return
 
@@ -1739,20 +1682,13 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data.startswith("confirm_full_del_alb_"):
         album_id = int(data.split('_')[4])
         
-        try:
-            # Видаляємо всі файли альбому
-            db.cursor.execute("DELETE FROM files WHERE album_id = ?", (album_id,))
-            # Видаляємо сам альбом
-            db.cursor.execute("DELETE FROM albums WHERE id = ?", (album_id,))
-            
-            db.conn.commit()
-            
+        # Файли, альбом і зв'язки — однією транзакцією, з очищенням кешів альбому
+        if await adb.write(Database.delete_album, album_id):
             await query.answer("✅ Альбом та всі файли видалено", show_alert=True)
             # Повертаємо користувача до списку всіх альбомів
             await back_to_albums(update, context) 
-            
-        except Exception as e:
-            await query.answer(f"❌ Помилка при видаленні: {e}", show_alert=True)
+        else:
+            await query.answer("❌ Помилка при видаленні альбому", show_alert=True)
 
     # 3. ЕТАП: Скасування (натиснули "НІ" — повертаємось в меню альбому)
     # Цей етап зазвичай обробляється через data.startswith("open_album_"), 
@@ -1957,13 +1893,7 @@ async def return_to_album_callback(update: Update, context: ContextTypes.DEFAULT
     
     album = db.get_album(album_id)
     if album:
-        album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові дії")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+        album_keyboard = ALBUM_KEYBOARD
         
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
@@ -1991,8 +1921,8 @@ async def admin_stats_show_period(update: Update, context: ContextTypes.DEFAULT_
         start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
     end_str = end_dt.strftime("%Y-%m-%d %H:%M:%S") if end_dt else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    def _count(sql: str, params: tuple):
-        return db.cursor.execute(sql, params).fetchone()[0]
+    async def _count(sql: str, params: tuple = ()):
+        return await adb.fetchval(sql, params)
 
     active_users_filter = (
         "user_id IN ("
@@ -2020,88 +1950,88 @@ async def admin_stats_show_period(update: Update, context: ContextTypes.DEFAULT_
     where_subs += " AND granted_at <= ?"
     params_subs = (*params_subs, end_str)
 
-    giv_paid = _count(
+    giv_paid = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         f"WHERE subscription_type='paid' AND COALESCE(channel_id,'')='admin' AND {where_subs}",
         params_subs,
     )
-    bought = _count(
+    bought = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         f"WHERE (subscription_type='manual' OR (subscription_type='paid' AND COALESCE(channel_id,'')!='admin')) "
         f"AND {where_subs}",
         params_subs,
     )
-    subs = _count(
+    subs = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         f"WHERE subscription_type='channel' AND {where_subs}",
         params_subs,
     )
-    removed = _count(
+    removed = await _count(
         f"SELECT COUNT(*) FROM premium_events WHERE event_type='remove' AND {where_events}",
         params_events,
     )
 
     # Учасники = нові активні користувачі за період
     if start_str:
-        participants = db.cursor.execute(
+        participants = await _count(
             "SELECT COUNT(*) FROM users u "
             "LEFT JOIN bot_chats bc ON bc.chat_id = u.user_id AND bc.chat_type = 'private' "
             "WHERE (bc.chat_id IS NULL OR bc.is_active = 1) "
             "AND u.registered_at >= ? AND u.registered_at <= ?",
             (start_str, end_str),
-        ).fetchone()[0]
+        )
     else:
-        participants = db.cursor.execute(
+        participants = await _count(
             "SELECT COUNT(*) FROM users u "
             "LEFT JOIN bot_chats bc ON bc.chat_id = u.user_id AND bc.chat_type = 'private' "
             "WHERE (bc.chat_id IS NULL OR bc.is_active = 1) "
             "AND u.registered_at <= ?",
             (end_str,),
-        ).fetchone()[0]
+        )
 
-    groups_added = db.cursor.execute(
+    groups_added = await _count(
         f"SELECT COUNT(*) FROM bot_chat_events WHERE event_type='added' "
         f"AND chat_type IN ('group','supergroup','channel') AND {where_events}",
         params_events,
-    ).fetchone()[0]
-    bot_unsubscribed = db.cursor.execute(
+    )
+    bot_unsubscribed = await _count(
         f"SELECT COUNT(*) FROM bot_chat_events WHERE event_type='removed' "
         f"AND chat_type = 'private' AND {where_events}",
         params_events,
-    ).fetchone()[0]
+    )
     # Поточний синхронізований стан Premium (не історія подій).
-    active_paid_now = db.cursor.execute(
+    active_paid_now = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         f"WHERE is_active = 1 AND subscription_type = 'paid' "
         f"AND expires_at IS NOT NULL AND expires_at >= CURRENT_TIMESTAMP "
         f"AND {active_users_filter}"
-    ).fetchone()[0]
-    active_giv_now = db.cursor.execute(
+    )
+    active_giv_now = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         "WHERE is_active = 1 AND subscription_type = 'paid' "
         "AND COALESCE(channel_id,'')='admin' "
         f"AND expires_at IS NOT NULL AND expires_at >= CURRENT_TIMESTAMP "
         f"AND {active_users_filter}"
-    ).fetchone()[0]
-    active_buy_now = db.cursor.execute(
+    )
+    active_buy_now = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         "WHERE is_active = 1 AND (subscription_type='manual' "
         "OR (subscription_type='paid' AND COALESCE(channel_id,'')!='admin')) "
         f"AND expires_at IS NOT NULL AND expires_at >= CURRENT_TIMESTAMP "
         f"AND {active_users_filter}"
-    ).fetchone()[0]
-    active_sub_now = db.cursor.execute(
+    )
+    active_sub_now = await _count(
         f"SELECT COUNT(DISTINCT user_id) FROM premium_subscriptions "
         "WHERE is_active = 1 AND subscription_type = 'channel' "
         f"AND expires_at IS NOT NULL AND expires_at >= CURRENT_TIMESTAMP "
         f"AND {active_users_filter}"
-    ).fetchone()[0]
+    )
     active_premium_now = active_paid_now + active_sub_now
-    total_users_now = db.cursor.execute(
+    total_users_now = await _count(
         "SELECT COUNT(*) FROM users u "
         "LEFT JOIN bot_chats bc ON bc.chat_id = u.user_id AND bc.chat_type = 'private' "
         "WHERE bc.chat_id IS NULL OR bc.is_active = 1"
-    ).fetchone()[0]
+    )
     no_premium_now = max(total_users_now - active_premium_now, 0)
 
     text = (
@@ -2251,17 +2181,17 @@ async def admin_users_send_all(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # Беремо тільки активних підписників бота (private chat is_active = 1),
     # щоб у списку не було тих, хто заблокував/видалив бота.
-    users = db.cursor.execute(
+    users = await adb.fetchall(
         "SELECT u.user_id, u.username, u.first_name, u.is_premium, u.premium_until "
         "FROM users u "
         "LEFT JOIN bot_chats bc ON bc.chat_id = u.user_id AND bc.chat_type = 'private' "
         "WHERE bc.chat_id IS NULL OR bc.is_active = 1 "
         "ORDER BY u.registered_at DESC"
-    ).fetchall()
+    )
     total_users = len(users)
-    total_groups_channels = db.cursor.execute(
+    total_groups_channels = await adb.fetchval(
         "SELECT COUNT(*) FROM bot_chats WHERE chat_type IN ('group','supergroup','channel')"
-    ).fetchone()[0]
+    )
 
     lines: list[str] = []
     chunk_size = 25
@@ -2275,12 +2205,12 @@ async def admin_users_send_all(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return
 
-    def user_status(urow):
+    def user_status(d, urow):
         uid = urow["user_id"]
         # перевіряємо активність Premium (щоб не показувати прострочений)
-        if not urow["is_premium"] or not db.check_premium(uid):
+        if not urow["is_premium"] or not d.check_premium(uid):
             return "free"
-        sub = db.cursor.execute(
+        sub = d.cursor.execute(
             "SELECT subscription_type FROM premium_subscriptions WHERE user_id = ? AND is_active = 1 ORDER BY granted_at DESC LIMIT 1",
             (uid,),
         ).fetchone()
@@ -2291,7 +2221,7 @@ async def admin_users_send_all(update: Update, context: ContextTypes.DEFAULT_TYP
             return "sub"
 
         # Legacy-дані: інферимо з premium_events
-        ev = db.cursor.execute(
+        ev = d.cursor.execute(
             "SELECT event_type FROM premium_events "
             "WHERE user_id = ? AND event_type IN ('grant_paid','grant_channel') "
             "ORDER BY event_at DESC LIMIT 1",
@@ -2306,9 +2236,12 @@ async def admin_users_send_all(update: Update, context: ContextTypes.DEFAULT_TYP
             return "sub"
         return "sub"
 
+    # check_premium — лише пошук в індексі Premium, тож статуси рахуємо в потоці-читачі
+    statuses = await adb.read(lambda d: [user_status(d, u) for u in users])
+
     messages_sent = 0
     for i, u in enumerate(users):
-        st = user_status(u)
+        st = statuses[i]
         name = (u["first_name"] or "").strip()
         user_ref = _fmt_user_ref(u)
         premium_until_raw = (u["premium_until"] or "").strip() if u["premium_until"] else ""
@@ -2646,12 +2579,9 @@ async def handle_all_text_inputs(update: Update, context: ContextTypes.DEFAULT_T
         ud['shared_album_active'] = True
         if not ud.get('shared_access_level'):
             try:
-                row = db.cursor.execute(
-                    "SELECT access_level FROM shared_albums WHERE album_id = ? AND user_id = ?",
-                    (ud.get('current_shared_album'), update.effective_user.id)
-                ).fetchone()
-                if row and row.get('access_level'):
-                    ud['shared_access_level'] = row['access_level']
+                access_level = db.get_album_access(ud.get('current_shared_album'), update.effective_user.id)
+                if access_level:
+                    ud['shared_access_level'] = access_level
             except Exception:
                 pass
     
@@ -2875,33 +2805,93 @@ def _send_fatal_crash_alert_sync(exc: Exception):
                 # Тут вже нічого не робимо: процес і так завершується.
                 pass
 
+async def track_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Оновлює довідник username з effective_user кожного апдейту (у БД пише лише зміни)"""
+    user = update.effective_user
+    if user and not user.is_bot:
+        db.refresh_user(user.id, user.username, user.first_name, user.last_name)
+
+
+def with_unit_of_work(callback):
+    """
+    Обгортка обробника: виняток відкочує незафіксовані записи апдейта
+    (Application сам перехоплює винятки обробників, тож UnitOfWorkApplication їх не бачить).
+    Для block=False обробника, що працює у власній задачі, відкриває окремий unit of work.
+    """
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with db.unit_of_work():
+            return await callback(update, context)
+    return wrapper
+
+
+class UnitOfWorkApplication(Application):
+    """
+    Кожен апдейт (усі групи обробників) — в одному unit of work на власному підключенні.
+    Записи фіксуються перед кожним запитом до Telegram (rate_limiter.before_request)
+    і в кінці апдейта, тож транзакція не висить під час мережевих очікувань.
+    """
+
+    async def process_update(self, update):
+        with db.unit_of_work():
+            await super().process_update(update)
+
+
+async def post_init(application: Application):
+    """Фонові задачі, що живуть разом з ботом"""
+    asyncio.create_task(run_counter_reconciliation(adb))
+    asyncio.create_task(run_premium_expiry(adb))
+    # Незавершені пакетні надсилання (перезапуск посеред «надіслати все») — з контрольних точок
+    await resume_send_jobs(application)
+
+
 def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Усі вихідні запити бота (надсилання, видалення, розсилки, сповіщення адмінам)
+    # проходять через спільний планувальник з лімітами Telegram та обробкою RetryAfter
+    rate_limiter = get_rate_limiter()
+    rate_limiter.before_request = flush_unit_of_work
+    application = (
+        Application.builder()
+        .application_class(UnitOfWorkApplication)
+        .token(BOT_TOKEN)
+        .rate_limiter(rate_limiter)
+        .post_init(post_init)
+        .build()
+    )
+
+    # Group -1: довідник користувачів (username/ім'я з кожного апдейту)
+    application.add_handler(TypeHandler(Update, with_unit_of_work(track_user)), group=-1)
 
     # Group 0: ФАЙЛИ
+    # block=False: файли медіагрупи обробляються паралельно й потрапляють в один пакет черги прийому
     application.add_handler(MessageHandler(
         filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.AUDIO | filters.VOICE | filters.VIDEO_NOTE,
-        handle_all_files_dispatcher
+        with_unit_of_work(handle_all_files_dispatcher),
+        block=False
     ), group=0)
 
     # Group 1: ГЛОБАЛЬНІ ТЕКСТОВІ КОМАНДИ (Видалення за номером)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_delete_text), group=1)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, with_unit_of_work(handle_delete_text)), group=1)
         
     # Group 2: УНІВЕРСАЛЬНИЙ ДИСПЕТЧЕР (Обробляє стани та кнопки альбомів)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_all_text_inputs), group=2)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, with_unit_of_work(handle_all_text_inputs)), group=2)
 
     # Group 5: ГОЛОВНЕ МЕНЮ (Фолбек)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_menu), group=5)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, with_unit_of_work(handle_menu)), group=5)
 
     # Команди та колбеки
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("admin", admin_start))
-    application.add_handler(ChatMemberHandler(handle_my_chat_member_update, ChatMemberHandler.MY_CHAT_MEMBER))
-    application.add_handler(CallbackQueryHandler(handle_premium_callback, pattern="^premium_"))
-    application.add_handler(CallbackQueryHandler(callback_handler))
+    # (апдейт — в unit of work UnitOfWorkApplication; обгортка відкочує його при винятку обробника)
+    application.add_handler(CommandHandler("start", with_unit_of_work(start)))
+    application.add_handler(CommandHandler("admin", with_unit_of_work(admin_start)))
+    application.add_handler(ChatMemberHandler(with_unit_of_work(handle_my_chat_member_update), ChatMemberHandler.MY_CHAT_MEMBER))
+    application.add_handler(CallbackQueryHandler(with_unit_of_work(handle_premium_callback), pattern="^premium_"))
+    application.add_handler(CallbackQueryHandler(with_unit_of_work(handle_send_job_callback), pattern="^sendjob_"))
+    application.add_handler(CallbackQueryHandler(with_unit_of_work(callback_handler)))
     application.add_error_handler(error_handler)
 
     application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Дочікуємося незавершених записів у потоці БД
+    adb.close()
 if __name__ == '__main__':
     try:
         main()
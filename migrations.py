@@ -0,0 +1,515 @@
+"""
+Версійні міграції схеми БД.
+Кожен крок виконується один раз і фіксується в таблиці `schema_version`,
+тож на актуальній базі старт зводиться до одного читання версії.
+"""
+import sqlite3
+
+
+def _column_names(cur, table: str) -> list[str]:
+    cur.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cur.fetchall()]
+
+
+# ========== КАТАЛОГ ІНДЕКСІВ ==========
+# (назва, таблиця, колонки, версія міграції, з якої індекс існує).
+# Нові індекси додаються сюди + окремий крок міграції, який викликає
+# _create_indexes(cur, <його версія>) (CREATE INDEX IF NOT EXISTS — ідемпотентно).
+INDEXES = [
+    ("idx_users_premium", "users", "is_premium", 3),
+    ("idx_albums_user", "albums", "user_id", 3),
+    ("idx_albums_archived", "albums", "is_archived", 3),
+    ("idx_files_album_added", "files", "album_id, added_at", 3),
+    ("idx_files_date", "files", "added_at", 3),
+    ("idx_shared_album_user", "shared_albums", "user_id", 3),
+    ("idx_notes_user", "notes", "user_id", 3),
+    ("idx_note_entries_folder_created", "note_entries", "folder_id, created_at", 3),
+    ("idx_note_entry_photos_entry", "note_entry_photos", "entry_id", 3),
+    ("idx_premium_subs_user_active", "premium_subscriptions", "user_id, is_active, granted_at", 3),
+    ("idx_premium_events_type_at", "premium_events", "event_type, event_at", 3),
+    ("idx_bot_chats_type_active", "bot_chats", "chat_type, is_active", 3),
+    ("idx_broadcast_deliveries_broadcast", "broadcast_deliveries", "broadcast_id", 3),
+    ("idx_broadcasts_admin_content", "broadcasts", "admin_id, content_key", 3),
+    ("idx_files_album_position", "files", "album_id, position", 4),
+    ("idx_users_username_lower", "users", "username_lower", 6),
+]
+
+# Індекси, які перекриваються ширшими з каталогу
+DROPPED_INDEXES = [
+    "idx_files_album",  # покривається idx_files_album_added
+    "idx_users_username",  # пошук тепер регістронезалежний — idx_users_username_lower
+]
+
+
+def _create_indexes(cur, upto_version: int):
+    """Створити індекси каталогу, що з'явились не пізніше upto_version"""
+    for name, table, columns, since in INDEXES:
+        if since <= upto_version:
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+    for name in DROPPED_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+# ========== КРОКИ МІГРАЦІЙ ==========
+
+def _m001_base_tables(cur):
+    """Базові таблиці бота (раніше Database.create_tables)"""
+    # 1. Створюємо основну таблицю користувачів (повна структура)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_premium BOOLEAN DEFAULT 0,
+            premium_until TIMESTAMP,
+            privacy_settings TEXT DEFAULT '{"allow_invites": "all", "allow_add_to_shared": true, "allow_add_to_shared_notes": true}',
+            display_settings TEXT DEFAULT '{"show_number": true, "show_date": true}',
+            is_blocked BOOLEAN DEFAULT 0
+        )
+    ''')
+
+    # ПЕРЕВІРКА: чи є колонка display_settings (якщо база стара)
+    if 'display_settings' not in _column_names(cur, "users"):
+        cur.execute('ALTER TABLE users ADD COLUMN display_settings TEXT DEFAULT \'{"show_number": true, "show_date": true}\'')
+
+    # 2. Таблиця альбомів
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS albums (
+            album_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_archived BOOLEAN DEFAULT 0,
+            is_shared BOOLEAN DEFAULT 0,
+            files_count INTEGER DEFAULT 0,
+            last_file_added TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+    ''')
+
+    # 3. Таблиця файлів
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            file_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            album_id INTEGER NOT NULL,
+            telegram_file_id TEXT NOT NULL,
+            file_type TEXT CHECK(file_type IN ('photo', 'video', 'document', 'audio', 'voice', 'circle')),
+            file_name TEXT,
+            file_size INTEGER,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            added_by INTEGER,
+            FOREIGN KEY (album_id) REFERENCES albums (album_id) ON DELETE CASCADE,
+            FOREIGN KEY (added_by) REFERENCES users (user_id)
+        )
+    ''')
+
+    # 4. Таблиця спільних альбомів
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS shared_albums (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            album_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            access_level TEXT CHECK(access_level IN ('owner', 'admin', 'editor', 'contributor', 'viewer')),
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (album_id) REFERENCES albums (album_id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+            UNIQUE(album_id, user_id)
+        )
+    ''')
+
+    # 5. Таблиця каналів для Premium
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS premium_channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            link TEXT NOT NULL,
+            title TEXT
+        )
+    ''')
+    if "telegram_chat_id" not in _column_names(cur, "premium_channels"):
+        cur.execute(
+            "ALTER TABLE premium_channels ADD COLUMN telegram_chat_id INTEGER"
+        )
+    
+    # 6. Решта таблиць (нотатки, преміум, логи)
+    cur.execute('CREATE TABLE IF NOT EXISTS notes (note_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, title TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_shared BOOLEAN DEFAULT 0, FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE)')
+    cur.execute('CREATE TABLE IF NOT EXISTS shared_notes (id INTEGER PRIMARY KEY AUTOINCREMENT, note_id INTEGER NOT NULL, user_id INTEGER NOT NULL, access_level TEXT CHECK(access_level IN ("view", "edit")) DEFAULT "view", added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (note_id) REFERENCES notes (note_id) ON DELETE CASCADE, FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE, UNIQUE(note_id, user_id))')
+    cur.execute('CREATE TABLE IF NOT EXISTS premium_subscriptions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, subscription_type TEXT CHECK(subscription_type IN ("channel", "paid", "manual")), channel_id TEXT, granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, expires_at TIMESTAMP, is_active BOOLEAN DEFAULT 1, FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS premium_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            event_type TEXT CHECK(event_type IN ("grant_paid", "grant_channel", "grant_manual", "remove")) NOT NULL,
+            subscription_type TEXT,
+            channel_id TEXT,
+            event_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS premium_channel_clicks (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            clicked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, channel_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS bot_chat_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            chat_type TEXT NOT NULL,
+            event_type TEXT CHECK(event_type IN ("added", "removed")) NOT NULL,
+            event_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS bot_chats (
+            chat_id INTEGER PRIMARY KEY,
+            chat_type TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            target_mode TEXT NOT NULL,
+            source_chat_id INTEGER NOT NULL,
+            source_message_id INTEGER NOT NULL,
+            content_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            broadcast_id INTEGER NOT NULL,
+            target_chat_id INTEGER NOT NULL,
+            target_message_id INTEGER NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('CREATE TABLE IF NOT EXISTS archive_log (id INTEGER PRIMARY KEY AUTOINCREMENT, album_id INTEGER, user_id INTEGER, action TEXT CHECK(action IN ("archive", "unarchive")), action_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (album_id) REFERENCES albums (album_id), FOREIGN KEY (user_id) REFERENCES users (user_id))')
+
+
+def _m002_notes_tables(cur):
+    """Таблиці нотаток (раніше notes.ensure_notes_tables)"""
+    cur.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS note_folders (
+            folder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_archived BOOLEAN DEFAULT 0,
+            is_shared BOOLEAN DEFAULT 0,
+            entries_count INTEGER DEFAULT 0,
+            last_entry_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+            UNIQUE(user_id, name)
+        )
+        '''
+    )
+    cur.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS note_entries (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            title TEXT,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (folder_id) REFERENCES note_folders (folder_id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+        )
+        '''
+    )
+    cur.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS shared_note_folders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            access_level TEXT CHECK(access_level IN ('owner', 'admin', 'editor', 'contributor', 'viewer')),
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (folder_id) REFERENCES note_folders (folder_id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+            UNIQUE(folder_id, user_id)
+        )
+        '''
+    )
+    cur.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS note_entry_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id INTEGER NOT NULL,
+            telegram_file_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (entry_id) REFERENCES note_entries (entry_id) ON DELETE CASCADE
+        )
+        '''
+    )
+
+
+def _m003_indexes(cur):
+    """Каталог індексів для гарячих запитів (раніше частково в setup_db.py)"""
+    _create_indexes(cur, 3)
+
+
+def _m004_files_position(cur):
+    """Постійний порядковий номер файлу в альбомі (files.position, з 1, без пропусків)"""
+    if "position" not in _column_names(cur, "files"):
+        cur.execute("ALTER TABLE files ADD COLUMN position INTEGER")
+    # Нумеруємо наявні файли в тому ж порядку, що й раніше показувались (added_at, file_id)
+    cur.execute('''
+        UPDATE files
+        SET position = numbered.rn
+        FROM (
+            SELECT file_id, ROW_NUMBER() OVER (PARTITION BY album_id ORDER BY added_at, file_id) AS rn
+            FROM files
+        ) AS numbered
+        WHERE files.file_id = numbered.file_id
+    ''')
+    _create_indexes(cur, 4)
+
+
+def _m005_counter_triggers(cur):
+    """
+    Лічильники albums.files_count та note_folders.entries_count ведуть тригери,
+    а не код застосунку. Наявні значення один раз перераховуємо.
+    """
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_count_insert AFTER INSERT ON files
+        BEGIN
+            UPDATE albums
+            SET files_count = files_count + 1,
+                last_file_added = CURRENT_TIMESTAMP
+            WHERE album_id = NEW.album_id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_count_delete AFTER DELETE ON files
+        BEGIN
+            UPDATE albums SET files_count = MAX(files_count - 1, 0) WHERE album_id = OLD.album_id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_count_move AFTER UPDATE OF album_id ON files
+        WHEN NEW.album_id != OLD.album_id
+        BEGIN
+            UPDATE albums SET files_count = MAX(files_count - 1, 0) WHERE album_id = OLD.album_id;
+            UPDATE albums SET files_count = files_count + 1 WHERE album_id = NEW.album_id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_note_entries_count_insert AFTER INSERT ON note_entries
+        BEGIN
+            UPDATE note_folders
+            SET entries_count = entries_count + 1,
+                last_entry_at = CURRENT_TIMESTAMP
+            WHERE folder_id = NEW.folder_id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_note_entries_count_delete AFTER DELETE ON note_entries
+        BEGIN
+            UPDATE note_folders SET entries_count = MAX(entries_count - 1, 0) WHERE folder_id = OLD.folder_id;
+        END
+    ''')
+
+    cur.execute('''
+        UPDATE albums
+        SET files_count = (SELECT COUNT(*) FROM files WHERE files.album_id = albums.album_id)
+    ''')
+    cur.execute('''
+        UPDATE note_folders
+        SET entries_count = (SELECT COUNT(*) FROM note_entries WHERE note_entries.folder_id = note_folders.folder_id)
+    ''')
+
+
+def _m006_username_lower(cur):
+    """Нормалізований (нижній регістр) username для регістронезалежного пошуку по індексу"""
+    if "username_lower" not in _column_names(cur, "users"):
+        cur.execute("ALTER TABLE users ADD COLUMN username_lower TEXT")
+    cur.execute("UPDATE users SET username_lower = LOWER(username) WHERE username IS NOT NULL")
+    _create_indexes(cur, 6)
+
+
+def _usage_triggers(cur, table, counters):
+    """
+    Тригери user_usage для таблиці альбомів/папок.
+    counters — {колонка user_usage: умова, де {row} — NEW або OLD}.
+    """
+    def delta(prefix, sign):
+        return ", ".join(
+            f"{column} = {column} {sign} ({condition.format(row=prefix)})"
+            for column, condition in counters.items()
+        )
+
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_usage_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT OR IGNORE INTO user_usage (user_id) VALUES (NEW.user_id);
+            UPDATE user_usage SET {delta("NEW", "+")} WHERE user_id = NEW.user_id;
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_usage_delete AFTER DELETE ON {table}
+        BEGIN
+            UPDATE user_usage SET {delta("OLD", "-")} WHERE user_id = OLD.user_id;
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_usage_update AFTER UPDATE OF user_id, is_shared, is_archived ON {table}
+        BEGIN
+            UPDATE user_usage SET {delta("OLD", "-")} WHERE user_id = OLD.user_id;
+            INSERT OR IGNORE INTO user_usage (user_id) VALUES (NEW.user_id);
+            UPDATE user_usage SET {delta("NEW", "+")} WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+
+# Що рахується в user_usage: тільки не архівовані (так само, як у безкоштовних лімітах)
+ALBUM_USAGE = {
+    "albums": "COALESCE({row}.is_shared, 0) = 0 AND COALESCE({row}.is_archived, 0) = 0",
+    "shared_albums": "COALESCE({row}.is_shared, 0) = 1 AND COALESCE({row}.is_archived, 0) = 0",
+}
+NOTE_FOLDER_USAGE = {
+    "note_folders": "COALESCE({row}.is_archived, 0) = 0",
+    "shared_note_folders": "COALESCE({row}.is_shared, 0) = 1 AND COALESCE({row}.is_archived, 0) = 0",
+}
+
+# Повний перерахунок user_usage (усіх користувачів або одного — з фільтром по u.user_id)
+RECOUNT_USAGE_SQL = '''
+    INSERT INTO user_usage (user_id, albums, shared_albums, note_folders, shared_note_folders)
+    SELECT u.user_id,
+        (SELECT COUNT(*) FROM albums a WHERE a.user_id = u.user_id AND COALESCE(a.is_shared, 0) = 0 AND COALESCE(a.is_archived, 0) = 0),
+        (SELECT COUNT(*) FROM albums a WHERE a.user_id = u.user_id AND COALESCE(a.is_shared, 0) = 1 AND COALESCE(a.is_archived, 0) = 0),
+        (SELECT COUNT(*) FROM note_folders nf WHERE nf.user_id = u.user_id AND COALESCE(nf.is_archived, 0) = 0),
+        (SELECT COUNT(*) FROM note_folders nf WHERE nf.user_id = u.user_id AND COALESCE(nf.is_shared, 0) = 1 AND COALESCE(nf.is_archived, 0) = 0)
+    FROM users u
+    WHERE {where}
+    ON CONFLICT(user_id) DO UPDATE SET
+        albums = excluded.albums,
+        shared_albums = excluded.shared_albums,
+        note_folders = excluded.note_folders,
+        shared_note_folders = excluded.shared_note_folders
+'''
+
+
+def _m007_user_usage(cur):
+    """Лічильники використання для безкоштовних лімітів (user_usage), які ведуть тригери"""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS user_usage (
+            user_id INTEGER PRIMARY KEY,
+            albums INTEGER NOT NULL DEFAULT 0,
+            shared_albums INTEGER NOT NULL DEFAULT 0,
+            note_folders INTEGER NOT NULL DEFAULT 0,
+            shared_note_folders INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    _usage_triggers(cur, "albums", ALBUM_USAGE)
+    _usage_triggers(cur, "note_folders", NOTE_FOLDER_USAGE)
+    cur.execute(RECOUNT_USAGE_SQL.format(where="1"))
+
+
+def _m008_file_origin(cur):
+    """Чат і повідомлення, з якого прийшов файл — для пакетного copy_messages"""
+    columns = _column_names(cur, "files")
+    if "origin_chat_id" not in columns:
+        cur.execute("ALTER TABLE files ADD COLUMN origin_chat_id INTEGER")
+    if "origin_message_id" not in columns:
+        cur.execute("ALTER TABLE files ADD COLUMN origin_message_id INTEGER")
+
+
+def _m009_send_jobs(cur):
+    """
+    Незавершені пакетні надсилання з контрольною точкою — для відновлення після перезапуску.
+    file_ids — файли в порядку надсилання (JSON), sent_count — скільки з них доставлено:
+    після видалень позиції ущільнюються, тож відновлювати за номерами не можна.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS send_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            album_id INTEGER NOT NULL,
+            sender TEXT NOT NULL DEFAULT 'album',
+            title TEXT,
+            done_text TEXT,
+            file_ids TEXT NOT NULL,
+            start_index INTEGER,
+            sent_count INTEGER NOT NULL DEFAULT 0,
+            progress_message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# (версія, назва, функція) — тільки додавати в кінець, існуючі кроки не змінювати
+MIGRATIONS = [
+    (1, "base_tables", _m001_base_tables),
+    (2, "notes_tables", _m002_notes_tables),
+    (3, "indexes", _m003_indexes),
+    (4, "files_position", _m004_files_position),
+    (5, "counter_triggers", _m005_counter_triggers),
+    (6, "username_lower", _m006_username_lower),
+    (7, "user_usage", _m007_user_usage),
+    (8, "file_origin", _m008_file_origin),
+    (9, "send_jobs", _m009_send_jobs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Поточна версія схеми (0 — якщо міграції ще не запускались)"""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Застосувати всі нові міграції. Повертає версію схеми після запуску."""
+    version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.commit()
+
+    for step_version, name, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN")
+            step(cur)
+            cur.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (step_version, name),
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Помилка міграції {step_version} ({name}): {e}")
+            raise
+        version = step_version
+
+    return version
@@ -1,74 +1,13 @@
 from datetime import datetime
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
 
 import helpers
-from db_models import Database
+from db_models import get_db
+from keyboards import NOTES_FOLDER_KEYBOARD, NOTES_ADDITIONAL_KEYBOARD, NOTES_DELETE_MENU_KEYBOARD
 
-db = Database()
-
-
-def ensure_notes_tables() -> None:
-    db.cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS note_folders (
-            folder_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_archived BOOLEAN DEFAULT 0,
-            is_shared BOOLEAN DEFAULT 0,
-            entries_count INTEGER DEFAULT 0,
-            last_entry_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
-            UNIQUE(user_id, name)
-        )
-        '''
-    )
-    db.cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS note_entries (
-            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            title TEXT,
-            content TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (folder_id) REFERENCES note_folders (folder_id) ON DELETE CASCADE,
-            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-        )
-        '''
-    )
-    db.cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS shared_note_folders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            folder_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            access_level TEXT CHECK(access_level IN ('owner', 'admin', 'editor', 'contributor', 'viewer')),
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (folder_id) REFERENCES note_folders (folder_id) ON DELETE CASCADE,
-            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
-            UNIQUE(folder_id, user_id)
-        )
-        '''
-    )
-    db.cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS note_entry_photos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            entry_id INTEGER NOT NULL,
-            telegram_file_id TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (entry_id) REFERENCES note_entries (entry_id) ON DELETE CASCADE
-        )
-        '''
-    )
-    db.conn.commit()
-
-
-ensure_notes_tables()
+db = get_db()
 
 NOTES_MAIN_BUTTONS = {
     "📷 Мої альбоми", "👥 Спільні альбоми", "📝 Мої нотатки", "🤝 Спільні нотатки", "⚙️ Налаштування",
@@ -84,40 +23,15 @@ NOTES_FOLDER_BUTTONS = {
 
 
 def notes_folder_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("📤 Надіслати всю папку")],
-            [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-            [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-            [KeyboardButton("⋯ Додаткові дії")],
-            [KeyboardButton("◀️ Вийти з папки")],
-        ],
-        resize_keyboard=True,
-    )
+    return NOTES_FOLDER_KEYBOARD
 
 
 def notes_additional_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("ℹ️ Інформація папки"), KeyboardButton("📦 Зробити спільною")],
-            [KeyboardButton("🗑 Видалити запис"), KeyboardButton("🗂 Архівувати папку")],
-            [KeyboardButton("🔥 Видалити папку")],
-            [KeyboardButton("◀️ Назад до папки")],
-        ],
-        resize_keyboard=True,
-    )
+    return NOTES_ADDITIONAL_KEYBOARD
 
 
 def notes_delete_menu_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("Надіслати: Весь альбом")],
-            [KeyboardButton("Надіслати: Останні"), KeyboardButton("Надіслати: Перші")],
-            [KeyboardButton("Надіслати: Проміжок"), KeyboardButton("Надіслати: За датою")],
-            [KeyboardButton("◀️ Назад до папки")],
-        ],
-        resize_keyboard=True,
-    )
+    return NOTES_DELETE_MENU_KEYBOARD
 
 
 def _is_manual_note_text(text: str) -> bool:
@@ -143,41 +57,41 @@ def _format_entry_line(idx: int, row, show_number: bool, show_date: bool) -> str
     return " ".join(parts)
 
 
-async def show_my_notes(update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    ensure_notes_tables()
-
-    folders = db.cursor.execute(
+def _my_notes_folders(user_id):
+    return db.cursor.execute(
         "SELECT * FROM note_folders WHERE user_id = ? AND is_archived = 0 ORDER BY created_at DESC",
         (user_id,),
     ).fetchall()
 
-    if not folders:
-        kb = InlineKeyboardMarkup([
-            [InlineKeyboardButton("➕ Створити папку", callback_data="notes_create")],
-            [InlineKeyboardButton("🗂 Архів папок", callback_data="notes_archived")],
-        ])
-        await update.message.reply_text(
-            "📝 У вас ще немає папок з нотатками.",
-            reply_markup=kb,
-        )
-        return
 
-    lines = ["📝 **Мої нотатки**"]
-    kb_rows = []
-    for f in folders:
-        kb_rows.append([InlineKeyboardButton(f"{f['name']} ({f['entries_count']})", callback_data=f"notes_open_{f['folder_id']}")])
+async def show_my_notes(update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
 
-    kb_rows.append([
-        InlineKeyboardButton("➕ Створити", callback_data="notes_create"),
-        InlineKeyboardButton("🗂 Архів", callback_data="notes_archived"),
-    ])
+    key = helpers.list_screen_key(db, user_id, "my_notes")
+    screen = helpers.get_list_screen(key)
+    if screen is None:
+        folders = _my_notes_folders(user_id)
+
+        if not folders:
+            kb = InlineKeyboardMarkup([
+                [InlineKeyboardButton("➕ Створити папку", callback_data="notes_create")],
+                [InlineKeyboardButton("🗂 Архів папок", callback_data="notes_archived")],
+            ])
+            screen = helpers.put_list_screen(key, "📝 У вас ще немає папок з нотатками.", kb)
+        else:
+            lines = ["📝 **Мої нотатки**"]
+            kb_rows = []
+            for f in folders:
+                kb_rows.append([InlineKeyboardButton(f"{f['name']} ({f['entries_count']})", callback_data=f"notes_open_{f['folder_id']}")])
 
-    await update.message.reply_text(
-        "\n".join(lines),
-        reply_markup=InlineKeyboardMarkup(kb_rows),
-        parse_mode="Markdown",
-    )
+            kb_rows.append([
+                InlineKeyboardButton("➕ Створити", callback_data="notes_create"),
+                InlineKeyboardButton("🗂 Архів", callback_data="notes_archived"),
+            ])
+            screen = helpers.put_list_screen(key, "\n".join(lines), InlineKeyboardMarkup(kb_rows), "Markdown")
+
+    text, reply_markup, parse_mode = screen
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
 
 
 async def notes_create_start(update, context: ContextTypes.DEFAULT_TYPE):
@@ -217,13 +131,15 @@ async def notes_back_to_list(update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     user_id = q.from_user.id
-    folders = db.cursor.execute(
-        "SELECT * FROM note_folders WHERE user_id = ? AND is_archived = 0 ORDER BY created_at DESC",
-        (user_id,),
-    ).fetchall()
-    kb = [[InlineKeyboardButton(f["name"], callback_data=f"notes_open_{f['folder_id']}")] for f in folders]
-    kb.append([InlineKeyboardButton("➕ Створити", callback_data="notes_create"), InlineKeyboardButton("🗂 Архів", callback_data="notes_archived")])
-    await q.edit_message_text("📝 **Мої нотатки**", reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
+    key = helpers.list_screen_key(db, user_id, "notes_list")
+    screen = helpers.get_list_screen(key)
+    if screen is None:
+        folders = _my_notes_folders(user_id)
+        kb = [[InlineKeyboardButton(f["name"], callback_data=f"notes_open_{f['folder_id']}")] for f in folders]
+        kb.append([InlineKeyboardButton("➕ Створити", callback_data="notes_create"), InlineKeyboardButton("🗂 Архів", callback_data="notes_archived")])
+        screen = helpers.put_list_screen(key, "📝 **Мої нотатки**", InlineKeyboardMarkup(kb), "Markdown")
+    text, reply_markup, parse_mode = screen
+    await q.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
 
 
 async def notes_open_folder(update, context: ContextTypes.DEFAULT_TYPE):
@@ -273,12 +189,12 @@ async def handle_note_folder_name(update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("❌ Папка з такою назвою вже існує.")
         return True
 
-    db.cursor.execute(
+    cur = db.cursor.execute(
         "INSERT INTO note_folders (user_id, name, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
         (user_id, name),
     )
-    folder_id = db.cursor.lastrowid
-    db.conn.commit()
+    folder_id = cur.lastrowid
+    db.commit()
 
     context.user_data["awaiting_note_folder_name"] = False
     context.user_data["current_note_folder"] = folder_id
@@ -299,58 +215,38 @@ async def handle_note_folder_name(update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def _save_note_entry(folder_id: int, user_id: int, text: str) -> int:
     title = text.strip().split("\n", 1)[0][:60] or "Новий запис"
-    db.cursor.execute(
+    cur = db.cursor.execute(
         "INSERT INTO note_entries (folder_id, user_id, title, content, created_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
         (folder_id, user_id, title, text),
     )
-    entry_id = db.cursor.lastrowid
-    db.cursor.execute(
-        "UPDATE note_folders SET entries_count = entries_count + 1, last_entry_at = CURRENT_TIMESTAMP WHERE folder_id = ?",
-        (folder_id,),
-    )
-    db.conn.commit()
+    entry_id = cur.lastrowid
+    db.commit()
     return entry_id
 
 
 async def _save_note_entry_with_photo(folder_id: int, user_id: int, text: str, photo_file_id: str) -> int:
     title = text.strip().split("\n", 1)[0][:60] or "Новий запис"
-    db.cursor.execute(
+    cur = db.cursor.execute(
         "INSERT INTO note_entries (folder_id, user_id, title, content, created_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
         (folder_id, user_id, title, text),
     )
-    entry_id = db.cursor.lastrowid
-    db.cursor.execute(
-        "UPDATE note_folders SET entries_count = entries_count + 1, last_entry_at = CURRENT_TIMESTAMP WHERE folder_id = ?",
-        (folder_id,),
-    )
-    db.cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS note_entry_photos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            entry_id INTEGER NOT NULL,
-            telegram_file_id TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (entry_id) REFERENCES note_entries (entry_id) ON DELETE CASCADE
-        )
-        '''
-    )
+    entry_id = cur.lastrowid
     db.cursor.execute(
         "INSERT INTO note_entry_photos (entry_id, telegram_file_id) VALUES (?, ?)",
         (entry_id, photo_file_id),
     )
-    db.conn.commit()
+    db.commit()
     return entry_id
 
 
 def _entries_for_folder(folder_id: int):
     return db.cursor.execute(
-        "SELECT * FROM note_entries WHERE folder_id = ? ORDER BY created_at ASC",
+        "SELECT * FROM note_entries WHERE folder_id = ? ORDER BY created_at ASC, entry_id ASC",
         (folder_id,),
     ).fetchall()
 
 
 async def _send_entries(update, context, folder_id: int, entries, title: str):
-    ensure_notes_tables()
     settings = helpers.get_user_display_settings(db, update.effective_user.id)
     show_number = settings.get("show_number", True)
     show_date = settings.get("show_date", True)
@@ -360,6 +256,9 @@ async def _send_entries(update, context, folder_id: int, entries, title: str):
         return True
 
     for i, e in enumerate(entries, start=1):
+        # Вибірки за датою несуть глобальний номер запису в папці
+        if "ordinal" in e.keys():
+            i = e["ordinal"]
         footer_parts = []
         if show_number:
             footer_parts.append(f"📄 Запис #{i}")
@@ -462,7 +361,8 @@ async def handle_note_folder_buttons(update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("❌ Назва не співпадає. Видалення скасовано.")
             return True
         db.cursor.execute("DELETE FROM note_folders WHERE folder_id = ? AND user_id = ?", (deleting_id, user_id))
-        db.conn.commit()
+        db.commit()
+        db.invalidate_note_acl(deleting_id)
         context.user_data["note_folder_active"] = False
         context.user_data.pop("current_note_folder", None)
         context.user_data.pop("note_additional", None)
@@ -527,12 +427,13 @@ async def handle_note_folder_buttons(update, context: ContextTypes.DEFAULT_TYPE)
 
     if context.user_data.get("awaiting_note_date"):
         context.user_data["awaiting_note_date"] = False
-        d = text.strip()
-        rows = db.cursor.execute(
-            "SELECT * FROM note_entries WHERE folder_id = ? AND date(created_at) = date(?) ORDER BY created_at ASC",
-            (folder_id, d),
-        ).fetchall()
-        return await _send_entries(update, context, folder_id, rows, f"Записи за {d}")
+        try:
+            date_from, date_to = helpers.parse_date_range(text)
+        except ValueError:
+            await update.message.reply_text("❌ Формат дати: YYYY-MM-DD (або YYYY-MM-DD - YYYY-MM-DD)")
+            return True
+        rows = db.get_note_entries_by_date(folder_id, date_from, date_to)
+        return await _send_entries(update, context, folder_id, rows, f"Записи за {helpers.date_range_label(date_from, date_to)}")
 
     # Меню видалення записів (як у видаленні файлів в альбомах)
     if context.user_data.get("note_in_delete_menu"):
@@ -603,14 +504,15 @@ async def handle_note_folder_buttons(update, context: ContextTypes.DEFAULT_TYPE)
 
         if context.user_data.get("note_del_await_date"):
             context.user_data["note_del_await_date"] = False
-            d = text.strip()
-            chosen = db.cursor.execute(
-                "SELECT * FROM note_entries WHERE folder_id = ? AND date(created_at) = date(?) ORDER BY created_at ASC",
-                (folder_id, d),
-            ).fetchall()
-            await update.message.reply_text(f"📤 Надсилаю {len(chosen)} записів за {d} для видалення...")
-            for idx, e in enumerate(chosen, 1):
-                await _send_entry_for_deletion(update, e, idx)
+            try:
+                date_from, date_to = helpers.parse_date_range(text)
+            except ValueError:
+                await update.message.reply_text("❌ Формат дати: YYYY-MM-DD (або YYYY-MM-DD - YYYY-MM-DD)")
+                return True
+            chosen = db.get_note_entries_by_date(folder_id, date_from, date_to)
+            await update.message.reply_text(f"📤 Надсилаю {len(chosen)} записів за {helpers.date_range_label(date_from, date_to)} для видалення...")
+            for e in chosen:
+                await _send_entry_for_deletion(update, e, e["ordinal"])
             return True
 
     if text == "⋯ Додаткові дії":
@@ -643,7 +545,8 @@ async def handle_note_folder_buttons(update, context: ContextTypes.DEFAULT_TYPE)
                 "INSERT OR IGNORE INTO shared_note_folders (folder_id, user_id, access_level) VALUES (?, ?, 'owner')",
                 (folder_id, user_id),
             )
-            db.conn.commit()
+            db.commit()
+            db.invalidate_note_acl(folder_id)
             await update.message.reply_text("✅ Папку зроблено спільною. Відкрийте «🤝 Спільні нотатки».")
             return True
 
@@ -658,7 +561,7 @@ async def handle_note_folder_buttons(update, context: ContextTypes.DEFAULT_TYPE)
 
         if text == "🗂 Архівувати папку":
             db.cursor.execute("UPDATE note_folders SET is_archived = 1 WHERE folder_id = ?", (folder_id,))
-            db.conn.commit()
+            db.commit()
             context.user_data["note_folder_active"] = False
             context.user_data.pop("current_note_folder", None)
             await update.message.reply_text("✅ Папку архівовано.")
@@ -704,7 +607,7 @@ async def notes_unarchive(update, context: ContextTypes.DEFAULT_TYPE):
     await q.answer()
     folder_id = int(q.data.split("_")[-1])
     db.cursor.execute("UPDATE note_folders SET is_archived = 0 WHERE folder_id = ?", (folder_id,))
-    db.conn.commit()
+    db.commit()
     await notes_show_archived(update, context)
 
 
@@ -727,14 +630,9 @@ async def handle_note_delete_callback(update, context: ContextTypes.DEFAULT_TYPE
 
     if data.startswith("note_confirmdel_"):
         entry_id = int(data.split("_")[-1])
-        row = db.cursor.execute("SELECT folder_id FROM note_entries WHERE entry_id = ?", (entry_id,)).fetchone()
-        if row:
-            db.cursor.execute("DELETE FROM note_entries WHERE entry_id = ?", (entry_id,))
-            db.cursor.execute(
-                "UPDATE note_folders SET entries_count = CASE WHEN entries_count > 0 THEN entries_count - 1 ELSE 0 END WHERE folder_id = ?",
-                (row["folder_id"],),
-            )
-            db.conn.commit()
+        # entries_count зменшує тригер trg_note_entries_count_delete
+        db.cursor.execute("DELETE FROM note_entries WHERE entry_id = ?", (entry_id,))
+        db.commit()
         try:
             await q.edit_message_caption("✅ Запис видалено.", reply_markup=None)
         except Exception:
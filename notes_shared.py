@@ -1,94 +1,47 @@
 ﻿from datetime import datetime
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
 
 import helpers
-from db_models import Database
-from notes import ensure_notes_tables, _is_manual_note_text, notes_folder_keyboard
+from db_models import get_db
+from notes import _is_manual_note_text, notes_folder_keyboard
+from keyboards import (
+    NOTES_FOLDER_KEYBOARD, NOTES_DELETE_MENU_KEYBOARD, SHARED_NOTES_ADDITIONAL_KEYBOARD,
+    SHARED_NOTES_MEMBERS_KEYBOARD, SHARED_NOTES_MEMBERS_MANAGE_KEYBOARD,
+    SHARED_NOTES_CHANGE_ROLE_MENU_KEYBOARD, SHARED_NOTES_DELETE_MEMBER_MENU_KEYBOARD,
+    SHARED_NOTES_ROLES_KEYBOARD, SHARED_NOTES_MEMBER_DELETE_CONFIRM_KEYBOARD,
+)
 
-db = Database()
-ensure_notes_tables()
+db = get_db()
 
 
 def shared_notes_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("📤 Надіслати всю папку")],
-            [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-            [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-            [KeyboardButton("⋯ Додаткові дії")],
-            [KeyboardButton("◀️ Вийти з папки")],
-        ],
-        resize_keyboard=True,
-    )
+    return NOTES_FOLDER_KEYBOARD
 
 
 def shared_notes_additional_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("ℹ️ Інформація папки"), KeyboardButton("👥 Учасники")],
-            [KeyboardButton("🗑 Видалити запис"), KeyboardButton("🗂 Архівувати папку")],
-            [KeyboardButton("🔥 Видалити папку"), KeyboardButton("↩️ Перенести в Мої нотатки")],
-            [KeyboardButton("◀️ Назад до папки")],
-        ],
-        resize_keyboard=True,
-    )
+    return SHARED_NOTES_ADDITIONAL_KEYBOARD
 
 
 def shared_notes_delete_menu_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("Надіслати: Весь альбом")],
-            [KeyboardButton("Надіслати: Останні"), KeyboardButton("Надіслати: Перші")],
-            [KeyboardButton("Надіслати: Проміжок"), KeyboardButton("Надіслати: За датою")],
-            [KeyboardButton("◀️ Назад до папки")],
-        ],
-        resize_keyboard=True,
-    )
+    return NOTES_DELETE_MENU_KEYBOARD
 
 
 def shared_notes_members_keyboard(can_manage: bool) -> ReplyKeyboardMarkup:
-    rows = [[KeyboardButton("📋 Всі учасники")]]
-    if can_manage:
-        rows.append([KeyboardButton("➕ Додати учасника")])
-        rows.append([KeyboardButton("✏️ Змінити роль")])
-        rows.append([KeyboardButton("🗑 Видалити учасника")])
-    rows.append([KeyboardButton("◀️ Назад до додаткових дій")])
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True)
+    return SHARED_NOTES_MEMBERS_MANAGE_KEYBOARD if can_manage else SHARED_NOTES_MEMBERS_KEYBOARD
 
 
 def shared_notes_change_role_menu_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("📋 Надіслати всіх учасників для зміни ролі")],
-            [KeyboardButton("✏️ Змінити роль за юзернеймом")],
-            [KeyboardButton("◀️ Назад до учасників")],
-        ],
-        resize_keyboard=True,
-    )
+    return SHARED_NOTES_CHANGE_ROLE_MENU_KEYBOARD
 
 
 def shared_notes_delete_member_menu_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("📋 Надіслати всіх учасників для видалення")],
-            [KeyboardButton("🗑 Видалити за юзернеймом")],
-            [KeyboardButton("◀️ Назад до учасників")],
-        ],
-        resize_keyboard=True,
-    )
+    return SHARED_NOTES_DELETE_MEMBER_MENU_KEYBOARD
 
 
 def shared_notes_roles_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("⚙️ Адмін"), KeyboardButton("✏️ Редактор")],
-            [KeyboardButton("📤 Автор"), KeyboardButton("👁️ Спостерігач")],
-            [KeyboardButton("◀️ Назад до учасників")],
-        ],
-        resize_keyboard=True,
-    )
+    return SHARED_NOTES_ROLES_KEYBOARD
 
 def _member_name_row(member) -> str:
     uname = f"@{member['username']}" if member["username"] else str(member["user_id"])
@@ -145,41 +98,44 @@ async def _prompt_delete_confirm(update, uid: int):
     display = f"@{user['username']}" if user and user["username"] else (user["first_name"] if user and user["first_name"] else str(uid))
     await update.message.reply_text(
         f"Видалити учасника {display}?",
-        reply_markup=ReplyKeyboardMarkup(
-            [[KeyboardButton("✅ Так"), KeyboardButton("❌ Ні")], [KeyboardButton("◀️ Назад до учасників")]],
-            resize_keyboard=True,
-        ),
+        reply_markup=SHARED_NOTES_MEMBER_DELETE_CONFIRM_KEYBOARD,
     )
 
 
 async def show_shared_notes(update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    rows = db.cursor.execute(
-        '''
-        SELECT nf.folder_id, nf.name, nf.entries_count, snf.access_level
-        FROM shared_note_folders snf
-        JOIN note_folders nf ON nf.folder_id = snf.folder_id
-        WHERE snf.user_id = ? AND nf.is_archived = 0
-        ORDER BY nf.created_at DESC
-        ''',
-        (user_id,),
-    ).fetchall()
+    key = helpers.list_screen_key(db, user_id, "shared_notes")
+    screen = helpers.get_list_screen(key)
+    if screen is None:
+        rows = db.cursor.execute(
+            '''
+            SELECT nf.folder_id, nf.name, nf.entries_count, snf.access_level
+            FROM shared_note_folders snf
+            JOIN note_folders nf ON nf.folder_id = snf.folder_id
+            WHERE snf.user_id = ? AND nf.is_archived = 0
+            ORDER BY nf.created_at DESC
+            ''',
+            (user_id,),
+        ).fetchall()
 
-    if not rows:
-        await update.message.reply_text(
-            "🤝 У вас поки немає спільних папок нотаток.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("➕ Створити спільну папку", callback_data="snotes_create")]]),
-        )
-        return
+        if not rows:
+            screen = helpers.put_list_screen(
+                key,
+                "🤝 У вас поки немає спільних папок нотаток.",
+                InlineKeyboardMarkup([[InlineKeyboardButton("➕ Створити спільну папку", callback_data="snotes_create")]]),
+            )
+        else:
+            kb = []
+            lines = ["🤝 **Спільні нотатки**"]
+            for r in rows:
+                role = helpers.get_role_name(r["access_level"])
+                kb.append([InlineKeyboardButton(f"{r['name']} ({r['entries_count']}) • {role}", callback_data=f"snotes_open_{r['folder_id']}")])
 
-    kb = []
-    lines = ["🤝 **Спільні нотатки**"]
-    for r in rows:
-        role = helpers.get_role_name(r["access_level"])
-        kb.append([InlineKeyboardButton(f"{r['name']} ({r['entries_count']}) • {role}", callback_data=f"snotes_open_{r['folder_id']}")])
+            kb.append([InlineKeyboardButton("➕ Створити спільну папку", callback_data="snotes_create")])
+            screen = helpers.put_list_screen(key, "\n".join(lines), InlineKeyboardMarkup(kb), "Markdown")
 
-    kb.append([InlineKeyboardButton("➕ Створити спільну папку", callback_data="snotes_create")])
-    await update.message.reply_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
+    text, reply_markup, parse_mode = screen
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
 
 
 async def shared_notes_create_start(update, context: ContextTypes.DEFAULT_TYPE):
@@ -209,16 +165,17 @@ async def handle_shared_note_folder_name(update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("❌ Папка з такою назвою вже існує.")
         return True
 
-    db.cursor.execute(
+    cur = db.cursor.execute(
         "INSERT INTO note_folders (user_id, name, is_shared, created_at) VALUES (?, ?, 1, CURRENT_TIMESTAMP)",
         (user_id, name),
     )
-    folder_id = db.cursor.lastrowid
+    folder_id = cur.lastrowid
     db.cursor.execute(
         "INSERT OR IGNORE INTO shared_note_folders (folder_id, user_id, access_level, added_at) VALUES (?, ?, 'owner', CURRENT_TIMESTAMP)",
         (folder_id, user_id),
     )
-    db.conn.commit()
+    db.commit()
+    db.invalidate_note_acl(folder_id)
     context.user_data["awaiting_shared_note_folder_name"] = False
     context.user_data["current_shared_note_folder"] = folder_id
     context.user_data["shared_note_active"] = True
@@ -243,27 +200,21 @@ async def open_shared_note_folder(update, context: ContextTypes.DEFAULT_TYPE):
     folder_id = int(q.data.split("_")[-1])
     user_id = q.from_user.id
 
-    row = db.cursor.execute(
-        '''
-        SELECT nf.*, snf.access_level
-        FROM shared_note_folders snf
-        JOIN note_folders nf ON nf.folder_id = snf.folder_id
-        WHERE nf.folder_id = ? AND snf.user_id = ?
-        ''',
-        (folder_id, user_id),
-    ).fetchone()
+    # Роль — з кешу прав доступу; сама папка — пошук за первинним ключем
+    access_level = db.get_note_folder_access(folder_id, user_id)
+    row = db.cursor.execute("SELECT * FROM note_folders WHERE folder_id = ?", (folder_id,)).fetchone() if access_level else None
     if not row:
         await q.edit_message_text("❌ Немає доступу до цієї папки.")
         return
 
     context.user_data["current_shared_note_folder"] = folder_id
     context.user_data["shared_note_active"] = True
-    context.user_data["shared_note_access"] = row["access_level"]
+    context.user_data["shared_note_access"] = access_level
 
     await q.message.reply_text(
         f"🤝 **{row['name']}**\n"
         f"└ Записів: {row['entries_count']}\n"
-        f"└ Ваша роль: {helpers.get_role_name(row['access_level'])}",
+        f"└ Ваша роль: {helpers.get_role_name(access_level)}",
         parse_mode="Markdown",
     )
     await q.message.reply_text(
@@ -274,7 +225,7 @@ async def open_shared_note_folder(update, context: ContextTypes.DEFAULT_TYPE):
 
 def _shared_entries(folder_id: int):
     return db.cursor.execute(
-        "SELECT * FROM note_entries WHERE folder_id = ? ORDER BY created_at ASC",
+        "SELECT * FROM note_entries WHERE folder_id = ? ORDER BY created_at ASC, entry_id ASC",
         (folder_id,),
     ).fetchall()
 
@@ -297,6 +248,9 @@ async def _send_shared_entries(update, folder_id: int, entries, title: str):
         return True
 
     for i, e in enumerate(entries, start=1):
+        # Вибірки за датою несуть глобальний номер запису в папці
+        if "ordinal" in e.keys():
+            i = e["ordinal"]
         footer = []
         if show_number:
             footer.append(f"📄 Запис #{i}")
@@ -380,7 +334,8 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("❌ Назва не співпадає. Видалення скасовано.")
             return True
         db.cursor.execute("DELETE FROM note_folders WHERE folder_id = ?", (deleting_id,))
-        db.conn.commit()
+        db.commit()
+        db.invalidate_note_acl(deleting_id)
         context.user_data["shared_note_active"] = False
         context.user_data.pop("current_shared_note_folder", None)
         context.user_data.pop("shared_note_access", None)
@@ -447,12 +402,13 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
 
     if context.user_data.get("shared_note_await_date"):
         context.user_data["shared_note_await_date"] = False
-        d = text.strip()
-        rows = db.cursor.execute(
-            "SELECT * FROM note_entries WHERE folder_id = ? AND date(created_at) = date(?) ORDER BY created_at ASC",
-            (folder_id, d),
-        ).fetchall()
-        return await _send_shared_entries(update, folder_id, rows, f"Записи за {d}")
+        try:
+            date_from, date_to = helpers.parse_date_range(text)
+        except ValueError:
+            await update.message.reply_text("❌ Формат дати: YYYY-MM-DD (або YYYY-MM-DD - YYYY-MM-DD)")
+            return True
+        rows = db.get_note_entries_by_date(folder_id, date_from, date_to)
+        return await _send_shared_entries(update, folder_id, rows, f"Записи за {helpers.date_range_label(date_from, date_to)}")
 
     if context.user_data.get("shared_note_in_delete_menu"):
         all_e = _shared_entries(folder_id)
@@ -519,13 +475,14 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
 
         if context.user_data.get("shared_note_del_await_date"):
             context.user_data["shared_note_del_await_date"] = False
-            d = text.strip()
-            chosen = db.cursor.execute(
-                "SELECT * FROM note_entries WHERE folder_id = ? AND date(created_at)=date(?) ORDER BY created_at ASC",
-                (folder_id, d),
-            ).fetchall()
-            for idx, e in enumerate(chosen, 1):
-                await _send_shared_entry_for_deletion(update, e, idx)
+            try:
+                date_from, date_to = helpers.parse_date_range(text)
+            except ValueError:
+                await update.message.reply_text("❌ Формат дати: YYYY-MM-DD (або YYYY-MM-DD - YYYY-MM-DD)")
+                return True
+            chosen = db.get_note_entries_by_date(folder_id, date_from, date_to)
+            for e in chosen:
+                await _send_shared_entry_for_deletion(update, e, e["ordinal"])
             return True
 
     if text == "⋯ Додаткові дії":
@@ -569,7 +526,7 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
 
         if text == "🗂 Архівувати папку" and access in {"owner", "admin"}:
             db.cursor.execute("UPDATE note_folders SET is_archived = 1 WHERE folder_id = ?", (folder_id,))
-            db.conn.commit()
+            db.commit()
             await update.message.reply_text("✅ Папку архівовано.")
             return True
 
@@ -583,7 +540,8 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
         if text == "↩️ Перенести в Мої нотатки" and access == "owner":
             db.cursor.execute("UPDATE note_folders SET is_shared = 0 WHERE folder_id = ?", (folder_id,))
             db.cursor.execute("DELETE FROM shared_note_folders WHERE folder_id = ? AND user_id != ?", (folder_id, user_id))
-            db.conn.commit()
+            db.commit()
+            db.invalidate_note_acl(folder_id)
             await update.message.reply_text("✅ Папку повернено в «Мої нотатки».", reply_markup=notes_folder_keyboard())
             return True
 
@@ -670,7 +628,8 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
                     "INSERT OR REPLACE INTO shared_note_folders (folder_id, user_id, access_level, added_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
                     (folder_id, uid, "viewer"),
                 )
-                db.conn.commit()
+                db.commit()
+                db.invalidate_note_acl(folder_id)
                 await update.message.reply_text("✅ Учасника додано (Спостерігач).")
                 return True
             else:
@@ -686,7 +645,8 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
                         "DELETE FROM shared_note_folders WHERE folder_id = ? AND user_id = ? AND access_level != 'owner'",
                         (folder_id, uid),
                     )
-                    db.conn.commit()
+                    db.commit()
+                    db.invalidate_note_acl(folder_id)
                     await update.message.reply_text("✅ Учасника видалено.")
                 await update.message.reply_text("👥 Меню учасників:", reply_markup=shared_notes_members_keyboard(can_manage))
                 return True
@@ -721,7 +681,8 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
                         "UPDATE shared_note_folders SET access_level = ? WHERE folder_id = ? AND user_id = ? AND access_level != 'owner'",
                         (role, folder_id, uid),
                     )
-                    db.conn.commit()
+                    db.commit()
+                    db.invalidate_note_acl(folder_id)
                     await update.message.reply_text("✅ Роль оновлено.")
                     await update.message.reply_text("👥 Меню учасників:", reply_markup=shared_notes_members_keyboard(can_manage))
                     return True
@@ -746,8 +707,7 @@ async def handle_shared_note_buttons(update, context: ContextTypes.DEFAULT_TYPE)
             "INSERT INTO note_entries (folder_id, user_id, title, content, created_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
             (folder_id, user_id, title, text),
         )
-        db.cursor.execute("UPDATE note_folders SET entries_count = entries_count + 1, last_entry_at = CURRENT_TIMESTAMP WHERE folder_id = ?", (folder_id,))
-        db.conn.commit()
+        db.commit()
         await update.message.reply_text("✅ Запис додано у спільну папку.")
         return True
 
@@ -769,28 +729,16 @@ async def handle_shared_note_media(update, context: ContextTypes.DEFAULT_TYPE) -
         await msg.reply_text("⚠️ У спільних нотатках фото зберігається тільки разом із текстом у підписі.")
         return True
     title = caption.split("\n", 1)[0][:60] or "Новий запис"
-    db.cursor.execute(
+    cur = db.cursor.execute(
         "INSERT INTO note_entries (folder_id, user_id, title, content, created_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
         (folder_id, update.effective_user.id, title, caption),
     )
-    entry_id = db.cursor.lastrowid
-    db.cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS note_entry_photos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            entry_id INTEGER NOT NULL,
-            telegram_file_id TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (entry_id) REFERENCES note_entries (entry_id) ON DELETE CASCADE
-        )
-        '''
-    )
+    entry_id = cur.lastrowid
     db.cursor.execute(
         "INSERT INTO note_entry_photos (entry_id, telegram_file_id) VALUES (?, ?)",
         (entry_id, msg.photo[-1].file_id),
     )
-    db.cursor.execute("UPDATE note_folders SET entries_count = entries_count + 1, last_entry_at = CURRENT_TIMESTAMP WHERE folder_id = ?", (folder_id,))
-    db.conn.commit()
+    db.commit()
     await msg.reply_text("✅ Фото з підписом збережено у спільну папку.")
     return True
 
@@ -812,14 +760,9 @@ async def handle_shared_note_delete_callback(update, context: ContextTypes.DEFAU
         return True
     if data.startswith("snote_confirmdel_"):
         entry_id = int(data.split("_")[-1])
-        row = db.cursor.execute("SELECT folder_id FROM note_entries WHERE entry_id = ?", (entry_id,)).fetchone()
-        if row:
-            db.cursor.execute("DELETE FROM note_entries WHERE entry_id = ?", (entry_id,))
-            db.cursor.execute(
-                "UPDATE note_folders SET entries_count = CASE WHEN entries_count > 0 THEN entries_count - 1 ELSE 0 END WHERE folder_id = ?",
-                (row["folder_id"],),
-            )
-            db.conn.commit()
+        # entries_count зменшує тригер trg_note_entries_count_delete
+        db.cursor.execute("DELETE FROM note_entries WHERE entry_id = ?", (entry_id,))
+        db.commit()
         try:
             await q.edit_message_caption("✅ Запис видалено.", reply_markup=None)
         except Exception:
@@ -849,7 +792,8 @@ async def handle_shared_note_delete_callback(update, context: ContextTypes.DEFAU
                 "UPDATE shared_note_folders SET access_level = ? WHERE folder_id = ? AND user_id = ? AND access_level != 'owner'",
                 (role, folder_id, uid),
             )
-            db.conn.commit()
+            db.commit()
+            db.invalidate_note_acl(folder_id)
             await q.answer("Роль оновлено.")
             can_manage = context.user_data.get("shared_note_access") in {"owner", "admin"}
             await q.message.reply_text("✅ Роль учасника оновлено.", reply_markup=shared_notes_members_keyboard(can_manage))
@@ -872,7 +816,8 @@ async def handle_shared_note_delete_callback(update, context: ContextTypes.DEFAU
                 "DELETE FROM shared_note_folders WHERE folder_id = ? AND user_id = ? AND access_level != 'owner'",
                 (folder_id, uid),
             )
-            db.conn.commit()
+            db.commit()
+            db.invalidate_note_acl(folder_id)
         await q.answer("Учасника видалено.")
         return True
     if data == "snotes_member_del_cancel":
@@ -886,6 +831,6 @@ async def _resolve_user_token(token: str):
     if not t:
         return None
     if t.startswith("@"):
-        row = db.cursor.execute("SELECT user_id FROM users WHERE username = ?", (t[1:],)).fetchone()
-        return int(row["user_id"]) if row else None
+        found_id = db.find_user_id_by_username(t[1:])
+        return int(found_id) if found_id is not None else None
     return None
@@ -1,15 +1,16 @@
 from datetime import datetime, timedelta
 import re
-from typing import Any, Optional
+import threading
+from typing import Optional
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest
 
-from db_models import Database
+from db_models import get_db, on_rollback
 from config import PREMIUM_CHANNEL_SUBSCRIPTION_DAYS
 
-db = Database()
+db = get_db()
 
 
 PREMIUM_MENU = InlineKeyboardMarkup(
@@ -65,10 +66,84 @@ def _normalize_channel_url(link: Optional[str]) -> Optional[str]:
     return raw
 
 
-def _get_premium_channels_rows() -> list[Any]:
-    return db.cursor.execute(
-        "SELECT id, link, title FROM premium_channels ORDER BY id ASC"
-    ).fetchall()
+class PremiumChannelCatalogue:
+    """
+    Каталог Premium-каналів у пам'яті: записи {'id', 'title', 'link', 'url'}
+    з уже нормалізованим url та готова клавіатура підписки.
+    Версіонований: перебудовується з БД лише після invalidate() (зміни каналів в адмінці).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._built_version = -1
+        self._channels = ()
+        self._by_id = {}
+        self._subscribe_markup = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def _ensure_built(self):
+        if self._built_version == self.version:
+            return
+        with self._lock:
+            version = self.version
+            if self._built_version == version:
+                return
+            rows = db.cursor.execute(
+                "SELECT id, link, title FROM premium_channels ORDER BY id ASC"
+            ).fetchall()
+            channels = []
+            for row in rows:
+                ch_id = int(row["id"])
+                title = (row["title"] or "").strip() or f"Канал {ch_id}"
+                channels.append({
+                    "id": ch_id,
+                    "title": title,
+                    "link": row["link"],
+                    "url": _normalize_channel_url(row["link"]),
+                })
+
+            keyboard = [
+                [InlineKeyboardButton(ch["title"], callback_data=f"premium_click_{ch['id']}")]
+                for ch in channels
+            ]
+            keyboard.append(
+                [InlineKeyboardButton("✅ Перевірити підписку", callback_data="premium_check")]
+            )
+            keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="premium_info")])
+
+            self._channels = tuple(channels)
+            self._by_id = {ch["id"]: ch for ch in channels}
+            self._subscribe_markup = InlineKeyboardMarkup(keyboard)
+            self._built_version = version
+
+    def channels(self) -> tuple:
+        self._ensure_built()
+        return self._channels
+
+    def get(self, ch_id: int) -> Optional[dict]:
+        self._ensure_built()
+        return self._by_id.get(ch_id)
+
+    def subscribe_markup(self) -> InlineKeyboardMarkup:
+        self._ensure_built()
+        return self._subscribe_markup
+
+
+_channel_catalogue = PremiumChannelCatalogue()
+
+
+@on_rollback
+def invalidate_premium_channels():
+    """Викликати після будь-якої зміни premium_channels"""
+    _channel_catalogue.invalidate()
+
+
+def _get_premium_channels_rows() -> tuple:
+    return _channel_catalogue.channels()
 
 
 async def show_premium_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -156,18 +231,6 @@ async def handle_premium_callback(update: Update, context: ContextTypes.DEFAULT_
             )
             return
 
-        keyboard: list[list[InlineKeyboardButton]] = []
-        for ch in channels:
-            ch_id = int(ch["id"])
-            title = (ch["title"] or "").strip() if ch["title"] is not None else ""
-            title = title or f"Канал {ch_id}"
-            keyboard.append([InlineKeyboardButton(title, callback_data=f"premium_click_{ch_id}")])
-
-        keyboard.append(
-            [InlineKeyboardButton("✅ Перевірити підписку", callback_data="premium_check")]
-        )
-        keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="premium_info")])
-
         try:
             await query.edit_message_text(
                 "🔗 **Premium-канали**\n\n"
@@ -175,7 +238,7 @@ async def handle_premium_callback(update: Update, context: ContextTypes.DEFAULT_
                 "Після того, як ви це зробите, натисніть **«✅ Перевірити підписку»**.\n"
                 "Якщо бот виявить, що ви підписані — вам буде видано Premium.\n"
                 "У разі відписки від каналу Premium буде анульовано.",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                reply_markup=_channel_catalogue.subscribe_markup(),
                 parse_mode="Markdown",
             )
         except BadRequest as e:
@@ -193,16 +256,11 @@ async def handle_premium_callback(update: Update, context: ContextTypes.DEFAULT_
             "INSERT OR IGNORE INTO premium_channel_clicks (user_id, channel_id) VALUES (?, ?)",
             (query.from_user.id, ch_id),
         )
-        db.conn.commit()
+        db.commit()
 
-        row = db.cursor.execute(
-            "SELECT title, link FROM premium_channels WHERE id = ?",
-            (ch_id,),
-        ).fetchone()
-        title = (row["title"] or "").strip() if row and row["title"] is not None else ""
-        title = title or f"Канал {ch_id}"
-        link = row["link"] if row and row["link"] is not None else None
-        url = _normalize_channel_url(link)
+        channel = _channel_catalogue.get(ch_id)
+        title = channel["title"] if channel else f"Канал {ch_id}"
+        url = channel["url"] if channel else None
 
         await query.answer("Зафіксовано. Відкрийте канал нижче.")
 
@@ -276,7 +334,7 @@ async def handle_premium_callback(update: Update, context: ContextTypes.DEFAULT_
             "DELETE FROM premium_channel_clicks WHERE user_id = ?",
             (query.from_user.id,),
         )
-        db.conn.commit()
+        db.commit()
 
         await show_premium_menu(update, context)
         return
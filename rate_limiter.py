@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Ліміти Telegram Bot API (з запасом):
+# ~30 повідомлень/с загалом, 1/с в особистий чат, 20/хв у групу чи канал
+GLOBAL_RATE = 30
+PRIVATE_CHAT_RATE = 1
+PRIVATE_CHAT_BURST = 3
+GROUP_CHAT_RATE = 20 / 60
+GROUP_CHAT_BURST = 3
+MAX_RETRIES = 3
+# Скільки бакетів чатів тримати, перш ніж прибрати неактивні
+CHAT_BUCKETS_PRUNE_AT = 10_000
+
+
+class TokenBucket:
+    """
+    Бакет токенів із резервуванням: кожен запит забирає токени одразу (баланс може
+    стати від'ємним) і чекає, поки борг відновиться — черга без зайвих пробуджень.
+    paused_until — пауза після RetryAfter від Telegram.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self, weight: float = 1) -> float:
+        """Зарезервувати weight токенів; повертає, скільки секунд чекати"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= weight
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return self.paused_until <= now and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+def _is_group_chat(chat_id: Union[int, str]) -> bool:
+    # Групи й канали мають від'ємний id або @username
+    return isinstance(chat_id, str) or chat_id < 0
+
+
+class OutgoingRateLimiter(BaseRateLimiter):
+    """
+    Єдиний планувальник вихідних запитів бота (Application.builder().rate_limiter(...)):
+    глобальний бакет + бакет на кожен чат (окремі ліміти для особистих чатів і груп).
+    RetryAfter ставить на паузу чат (або весь бот, якщо запит без чату) і повторює запит.
+    """
+
+    def __init__(self, max_retries: int = MAX_RETRIES):
+        self.max_retries = max_retries
+        # Викликається в задачі відправника перед кожним запитом (main: фіксація unit of work)
+        self.before_request: Optional[Callable[[], None]] = None
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        # Метрики черги
+        self.waiting = 0
+        self.waiting_by_chat: Dict[Union[int, str], int] = {}
+        self.sent = 0
+        self.retry_after_count = 0
+        self.failed = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_PRUNE_AT:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle()}
+            if _is_group_chat(chat_id):
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id):
+        # Один токен на виклик API: альбом (sendMediaGroup) і copyMessages — теж один запит,
+        # інакше пакет із 100 повідомлень зупиняв би чат на ~100 с, а глобальний бакет — усіх
+        if chat_id is not None:
+            wait = self._chat_bucket(chat_id).reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        wait = self._global.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], list]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ):
+        if self.before_request is not None:
+            self.before_request()
+        chat_id = data.get("chat_id")
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+
+        self.waiting += 1
+        if chat_id is not None:
+            self.waiting_by_chat[chat_id] = self.waiting_by_chat.get(chat_id, 0) + 1
+        try:
+            for attempt in range(max_retries + 1):
+                await self._acquire(chat_id)
+                try:
+                    result = await callback(*args, **kwargs)
+                    self.sent += 1
+                    return result
+                except RetryAfter as e:
+                    self.retry_after_count += 1
+                    delay = e.retry_after
+                    if hasattr(delay, "total_seconds"):
+                        delay = delay.total_seconds()
+                    # Пауза для цього чату; запит без чату — пауза для всього бота
+                    bucket = self._chat_bucket(chat_id) if chat_id is not None else self._global
+                    bucket.pause(float(delay) + 0.1)
+                    if attempt >= max_retries:
+                        self.failed += 1
+                        raise
+                    logger.warning("RetryAfter %ss для %s (chat %s), спроба %s", delay, endpoint, chat_id, attempt + 1)
+        finally:
+            self.waiting -= 1
+            if chat_id is not None:
+                left = self.waiting_by_chat.get(chat_id, 1) - 1
+                if left:
+                    self.waiting_by_chat[chat_id] = left
+                else:
+                    self.waiting_by_chat.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        """Глибина черги та лічильники вихідних запитів"""
+        now = time.monotonic()
+        return {
+            "waiting": self.waiting,
+            "waiting_chats": len(self.waiting_by_chat),
+            "max_chat_queue": max(self.waiting_by_chat.values(), default=0),
+            "paused_chats": sum(1 for b in self._chats.values() if b.paused_until > now),
+            "sent": self.sent,
+            "retry_after": self.retry_after_count,
+            "failed": self.failed,
+        }
+
+
+# Глобальний планувальник — підключається в main() через ApplicationBuilder.rate_limiter
+_rate_limiter = OutgoingRateLimiter()
+
+
+def get_rate_limiter() -> OutgoingRateLimiter:
+    return _rate_limiter
+
+
+def outgoing_stats() -> dict:
+    return _rate_limiter.stats()
@@ -1,28 +1,94 @@
-from db_models import Database
+import sys
+
+import migrations
+from db_models import get_db
+
+# Гарячі запити бота: кожен має йти через індекс, а не через повний прохід таблиці.
+# (назва, SQL, параметри)
+HOT_QUERIES = [
+    ("users by username", "SELECT user_id FROM users WHERE username_lower = ?", ("name",)),
+    ("album files window", "SELECT * FROM files WHERE album_id = ? AND position BETWEEN ? AND ? ORDER BY position", (1, 5, 10)),
+    (
+        "album files for days",
+        "SELECT *, position AS ordinal FROM files WHERE album_id = ? AND added_at >= ? AND added_at < ? ORDER BY position",
+        (1, "2024-01-01 00:00:00", "2024-01-02 00:00:00"),
+    ),
+    ("folder entries", "SELECT * FROM note_entries WHERE folder_id = ? ORDER BY created_at ASC", (1,)),
+    (
+        "folder entries for days",
+        "SELECT * FROM note_entries WHERE folder_id = ? AND created_at >= ? AND created_at < ? ORDER BY created_at, entry_id",
+        (1, "2024-01-01 00:00:00", "2024-01-02 00:00:00"),
+    ),
+    ("entry photo", "SELECT telegram_file_id FROM note_entry_photos WHERE entry_id = ? ORDER BY id DESC LIMIT 1", (1,)),
+    (
+        "active subscription",
+        "SELECT subscription_type, channel_id FROM premium_subscriptions "
+        "WHERE user_id = ? AND is_active = 1 ORDER BY granted_at DESC LIMIT 1",
+        (1,),
+    ),
+    (
+        "premium removals for period",
+        "SELECT COUNT(*) FROM premium_events WHERE event_type='remove' AND event_at >= ? AND event_at <= ?",
+        ("2024-01-01 00:00:00", "2024-12-31 23:59:59"),
+    ),
+    (
+        "active groups",
+        "SELECT chat_id FROM bot_chats WHERE chat_type IN ('group','supergroup','channel') AND is_active = 1",
+        (),
+    ),
+    ("broadcast deliveries", "SELECT target_chat_id, target_message_id FROM broadcast_deliveries WHERE broadcast_id = ?", (1,)),
+    (
+        "last broadcast by content",
+        "SELECT id FROM broadcasts WHERE admin_id = ? AND content_key = ? ORDER BY id DESC LIMIT 1",
+        (1, "key"),
+    ),
+]
+
+
+def explain_hot_queries(conn):
+    """
+    EXPLAIN QUERY PLAN для кожного гарячого запиту.
+    Повертає список (назва, план, ok); ok=False, якщо є будь-який SCAN: усі гарячі
+    запити — пошуки за ключем, тож прохід усього індексу (SCAN ... USING COVERING INDEX)
+    для них такий самий провал, як і прохід таблиці.
+    """
+    report = []
+    for name, sql, params in HOT_QUERIES:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        full_scan = any(detail.startswith("SCAN") for detail in plan)
+        report.append((name, plan, not full_scan))
+    return report
+
 
 def setup_indexes():
-    """Створення індексів для прискорення запитів"""
-    db = Database()
-    
-    # Індекси для швидкого пошуку
-    indexes = [
-        "CREATE INDEX IF NOT EXISTS idx_users_premium ON users(is_premium)",
-        "CREATE INDEX IF NOT EXISTS idx_albums_user ON albums(user_id)",
-        "CREATE INDEX IF NOT EXISTS idx_albums_archived ON albums(is_archived)",
-        "CREATE INDEX IF NOT EXISTS idx_files_album ON files(album_id)",
-        "CREATE INDEX IF NOT EXISTS idx_files_date ON files(added_at)",
-        "CREATE INDEX IF NOT EXISTS idx_shared_album_user ON shared_albums(user_id)",
-        "CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id)",
-    ]
-    
-    for index in indexes:
-        try:
-            db.cursor.execute(index)
-        except:
-            pass
-    
-    db.conn.commit()
+    """Застосувати міграції (включно з каталогом індексів) та перевірити плани запитів"""
+    db = get_db()
+    version = migrations.migrate(db.conn)
+    print(f"Версія схеми: {version}")
+
+    failed = 0
+    for name, plan, ok in explain_hot_queries(db.conn):
+        mark = "✅" if ok else "❌"
+        print(f"{mark} {name}: {' | '.join(plan)}")
+        if not ok:
+            failed += 1
+
     db.close()
+    return failed == 0
+
+
+def reconcile_usage():
+    """Перерахувати лічильники безкоштовних лімітів (user_usage) для всіх користувачів"""
+    db = get_db()
+    updated = db.reconcile_usage()
+    print(f"user_usage перераховано: {updated} користувачів")
+    db.close()
+    return True
+
 
 if __name__ == "__main__":
-    setup_indexes()
\ No newline at end of file
+    # python setup_db.py               — міграції + перевірка планів запитів
+    # python setup_db.py --reconcile   — ремонт лічильників user_usage
+    if "--reconcile" in sys.argv[1:]:
+        sys.exit(0 if reconcile_usage() else 1)
+    sys.exit(0 if setup_indexes() else 1)
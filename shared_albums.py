@@ -1,70 +1,61 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from db_models import Database
+from db_models import Database, get_db, get_async_db, get_ingest_queue, CAN_UPLOAD
+from keyboards import (
+    SHARED_ALBUM_KEYBOARD, ALBUM_DELETE_KEYBOARD, SHARED_BACK_TO_OPTIONS_KEYBOARD,
+    CONFIRM_DELETE_KEYBOARD, CONFIRM_ARCHIVE_KEYBOARD, shared_albums_list_keyboard,
+    shared_album_additional_keyboard, shared_album_members_keyboard,
+)
 import helpers
+from album_view import send_jobs, SENDERS
 from telegram import ReplyKeyboardRemove
 
-db = Database()
+db = get_db()
+adb = get_async_db()
+ingest = get_ingest_queue()
 
 # ========== ГОЛОВНЕ МЕНЮ СПІЛЬНИХ АЛЬБОМІВ ==========
 
 
-def _shared_additional_buttons(access_level: str):
-    rows = [[KeyboardButton("👥 Учасники"), KeyboardButton("ℹ️ Інформація")]]
-    if access_level in ['owner', 'admin', 'editor', 'contributor']:
-        if access_level in ['owner', 'admin']:
-            rows.append([KeyboardButton("🗑 Видалити файл"), KeyboardButton("🗂 Архівувати альбом")])
-        else:
-            rows.append([KeyboardButton("🗑 Видалити файл")])
-    elif access_level in ['owner', 'admin']:
-        rows.append([KeyboardButton("🗂 Архівувати альбом")])
-    if access_level == 'owner':
-        rows.append([KeyboardButton("🗑 Видалити альбом"), KeyboardButton("📷 Перенести до моїх альбомів")])
-    rows.append([KeyboardButton("◀️ Назад до альбому")])
-    return rows
-
 async def shared_albums_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Головне меню спільних альбомів — ТІЛЬКИ СПІЛЬНІ"""
     user_id = update.effective_user.id
     
-    # Отримуємо ТІЛЬКИ ті альбоми, які позначені як спільні (is_shared = 1)
-    shared_albums = db.cursor.execute("""
-        SELECT a.*, sa.access_level, u.username as owner_name 
-        FROM albums a 
-        JOIN shared_albums sa ON a.album_id = sa.album_id 
-        JOIN users u ON a.user_id = u.user_id
-        WHERE sa.user_id = ? 
-        AND a.is_shared = 1  -- ФІЛЬТР: Тільки спільні
-        AND a.is_archived = 0
-        ORDER BY a.created_at DESC
-    """, (user_id,)).fetchall()
-    
-    text = "👥 **Спільні альбоми**\n\n"
-    keyboard = []
-    
-    if shared_albums:
-        text += "Альбоми, де ви учасник:\n"
-        for album in shared_albums:
-            role_emoji = {
-                'owner': '👑', 'admin': '⚙️', 'editor': '✏️', 
-                'contributor': '📤', 'viewer': '👁️'
-            }.get(album['access_level'], '👤')
-            
-            album_text = f"{role_emoji} {album['name']} ({album['files_count']} файлів)"
-            keyboard.append([InlineKeyboardButton(
-                album_text, 
-                callback_data=f"shared_open_{album['album_id']}"
-            )])
-    else:
-        text += "У вас немає спільних альбомів.\n"
+    key = helpers.list_screen_key(db, user_id, "shared_albums")
+    screen = helpers.get_list_screen(key)
+    if screen is None:
+        # Отримуємо ТІЛЬКИ ті альбоми, які позначені як спільні (is_shared = 1)
+        shared_albums = await adb.fetchall("""
+            SELECT a.*, sa.access_level, u.username as owner_name 
+            FROM albums a 
+            JOIN shared_albums sa ON a.album_id = sa.album_id 
+            JOIN users u ON a.user_id = u.user_id
+            WHERE sa.user_id = ? 
+            AND a.is_shared = 1  -- ФІЛЬТР: Тільки спільні
+            AND a.is_archived = 0
+            ORDER BY a.created_at DESC
+        """, (user_id,))
+        
+        text = "👥 **Спільні альбоми**\n\n"
+        
+        if shared_albums:
+            text += "Альбоми, де ви учасник:\n"
+        else:
+            text += "У вас немає спільних альбомів.\n"
+        
+        reply_markup = shared_albums_list_keyboard(tuple(
+            (album['album_id'], album['name'], album['files_count'], album['access_level'])
+            for album in shared_albums
+        ))
+        screen = helpers.put_list_screen(key, text, reply_markup, 'Markdown')
     
-    keyboard.append([InlineKeyboardButton("➕ Створити новий спільний", callback_data="shared_create")])
+    text, reply_markup, _ = screen
     
     # Видаляємо старі повідомлення для чистоти інтерфейсу
     if update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
-        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
 # ========== СТВОРЕННЯ СПІЛЬНОГО АЛЬБОМУ ==========
 
@@ -121,7 +112,8 @@ async def shared_handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
         VALUES (?, ?, 'owner', CURRENT_TIMESTAMP)
     ''', (album_id, user_id))
     
-    db.conn.commit()
+    db.commit()
+    db.invalidate_album_acl(album_id)
     
     # Очищаємо стани
     context.user_data['shared_awaiting_name'] = False
@@ -139,13 +131,7 @@ async def shared_handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
     album = db.get_album(album_id)
     
     # Клавіатура для спільного альбому
-    album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові опції")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+    album_keyboard = SHARED_ALBUM_KEYBOARD
     
     # Відправляємо повідомлення
     await update.message.reply_text(
@@ -175,12 +161,9 @@ async def shared_open_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     album_id = int(query.data.split('_')[2])
     user_id = query.from_user.id
     
-    access = db.cursor.execute(
-        "SELECT access_level FROM shared_albums WHERE album_id = ? AND user_id = ?",
-        (album_id, user_id)
-    ).fetchone()
+    access_level = db.get_album_access(album_id, user_id)
     
-    if not access:
+    if not access_level:
         await query.edit_message_text("❌ У вас немає доступу до цього альбому.")
         return
 
@@ -201,22 +184,18 @@ async def shared_open_album(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data['current_shared_album'] = album_id
     context.user_data['shared_album_active'] = True
-    context.user_data['shared_access_level'] = access['access_level']
+    # Індекс файлів для наступних дій (останні / перші / проміжок / за датою / видалення)
+    await adb.read(Database.open_album_index, album_id)
+    context.user_data['shared_access_level'] = access_level
     
     text = (
         f"👥 **{album['name']}**\n"
         f"└ Файлів: {album['files_count']}\n"
-        f"└ Ваша роль: {helpers.get_role_name(access['access_level'])}\n\n"
+        f"└ Ваша роль: {helpers.get_role_name(access_level)}\n\n"
         f"Надсилайте файли в цей чат, вони автоматично збережуться в альбом."
     )
     
-    album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові опції")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+    album_keyboard = SHARED_ALBUM_KEYBOARD
     
     await query.edit_message_text(text, parse_mode='Markdown')
     await context.bot.send_message(
@@ -241,11 +220,10 @@ async def shared_additional_menu(update: Update, context: ContextTypes.DEFAULT_T
         context.user_data['shared_in_additional'] = True
         
         # Створюємо клавіатуру (це те саме меню, що й було)
-        additional_buttons = _shared_additional_buttons(access_level)
         
         await update.message.reply_text(
             f"📋 **Додаткові опції**\n\nОберіть потрібну дію:",
-            reply_markup=ReplyKeyboardMarkup(additional_buttons, resize_keyboard=True),
+            reply_markup=shared_album_additional_keyboard(access_level),
             parse_mode='Markdown'
         )
         return True
@@ -359,15 +337,11 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
     if not album_id: 
         return False
         
-    all_files = db.get_album_files(album_id)
-    # Перетворюємо в список словників
-    all_files = [dict(f) for f in all_files]
-
     try:
         # 1. Останні
         if ud.get('shared_del_awaiting_recent'):
             count = int(text)
-            selected = list(enumerate(all_files, 1))[-count:]
+            selected = [(f['ordinal'], f) for f in db.get_last_files(album_id, count)]
             await update.message.reply_text(f"📤 Надсилаю останні {len(selected)} файлів...")
             for idx, f in selected: 
                 await send_shared_file_for_deletion(update, context, f, idx)
@@ -377,7 +351,7 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
         # 2. Перші
         if ud.get('shared_del_awaiting_first'):
             count = int(text)
-            selected = list(enumerate(all_files, 1))[:count]
+            selected = [(f['ordinal'], f) for f in db.get_first_files(album_id, count)]
             await update.message.reply_text(f"📤 Надсилаю перші {len(selected)} файлів...")
             for idx, f in selected: 
                 await send_shared_file_for_deletion(update, context, f, idx)
@@ -387,10 +361,10 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
         # 3. Проміжок
         if ud.get('shared_del_awaiting_range'):
             start, end = map(int, text.split('-'))
-            selected = all_files[start-1:end]
+            selected = db.get_files_range(album_id, start, end)
             await update.message.reply_text(f"📤 Надсилаю файли з {start} по {end}...")
-            for i, f in enumerate(selected): 
-                await send_shared_file_for_deletion(update, context, f, start+i)
+            for f in selected: 
+                await send_shared_file_for_deletion(update, context, f, f['ordinal'])
             ud['shared_del_awaiting_range'] = False
             return True
             
@@ -408,14 +382,12 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
     
     if not album_id: 
         return False
-        
-    all_files = db.get_album_files(album_id)
 
     try:
         # 1. Останні
         if ud.get('shared_del_awaiting_recent'):
             count = int(text)
-            selected = list(enumerate(all_files, 1))[-count:]
+            selected = [(f['ordinal'], f) for f in db.get_last_files(album_id, count)]
             await update.message.reply_text(f"📤 Надсилаю останні {len(selected)} файлів...")
             for idx, f in selected: 
                 await send_shared_file_for_deletion(update, context, f, idx)
@@ -425,7 +397,7 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
         # 2. Перші
         if ud.get('shared_del_awaiting_first'):
             count = int(text)
-            selected = list(enumerate(all_files, 1))[:count]
+            selected = [(f['ordinal'], f) for f in db.get_first_files(album_id, count)]
             await update.message.reply_text(f"📤 Надсилаю перші {len(selected)} файлів...")
             for idx, f in selected: 
                 await send_shared_file_for_deletion(update, context, f, idx)
@@ -435,10 +407,10 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
         # 3. Проміжок
         if ud.get('shared_del_awaiting_range'):
             start, end = map(int, text.split('-'))
-            selected = all_files[start-1:end]
+            selected = db.get_files_range(album_id, start, end)
             await update.message.reply_text(f"📤 Надсилаю файли з {start} по {end}...")
-            for i, f in enumerate(selected): 
-                await send_shared_file_for_deletion(update, context, f, start+i)
+            for f in selected: 
+                await send_shared_file_for_deletion(update, context, f, f['ordinal'])
             ud['shared_del_awaiting_range'] = False
             return True
             
@@ -453,13 +425,7 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
 
 async def shared_return_to_album(update: Update, context: ContextTypes.DEFAULT_TYPE, album_id):
     """Повернення до основної клавіатури альбому"""
-    album_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("📤 Надіслати весь альбом")],
-        [KeyboardButton("⏳ Надіслати останні"), KeyboardButton("⏮ Надіслати перші")],
-        [KeyboardButton("🔢 Надіслати проміжок"), KeyboardButton("📅 Надіслати за датою")],
-        [KeyboardButton("⋯ Додаткові опції")],
-        [KeyboardButton("◀️ Вийти з альбому")]
-    ], resize_keyboard=True)
+    album_keyboard = SHARED_ALBUM_KEYBOARD
     
     await update.message.reply_text(
         "🔙 Повернення до альбому",
@@ -492,11 +458,9 @@ async def shared_album_info(update: Update, context: ContextTypes.DEFAULT_TYPE,
         last_file = album['last_file_added'][:10]
         text += f"**Останній файл:** {last_file}"
     
-    keyboard = [[KeyboardButton("◀️ Назад до додаткових опцій")]]
-    
     await update.message.reply_text(
         text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        reply_markup=SHARED_BACK_TO_OPTIONS_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -508,20 +472,9 @@ async def shared_members_main(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     text = "👥 **Керування учасниками**\n\nОберіть дію:"
     
-    keyboard = [
-        [KeyboardButton("📋 Переглянути всіх учасників")]
-    ]
-    
-    if access_level in ['owner', 'admin']:
-        keyboard.append([KeyboardButton("➕ Додати учасника")])
-        keyboard.append([KeyboardButton("⚙️ Змінити ролі")])
-        keyboard.append([KeyboardButton("🗑 Видалити учасника")])
-    
-    keyboard.append([KeyboardButton("◀️ Назад до додаткових опцій")])
-    
     await update.message.reply_text(
         text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        reply_markup=shared_album_members_keyboard(access_level in ['owner', 'admin']),
         parse_mode='Markdown'
     )
 
@@ -572,9 +525,7 @@ async def shared_add_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(
         "👤 Введіть username користувача (наприклад: @username)",
-        reply_markup=ReplyKeyboardMarkup([
-            [KeyboardButton("◀️ Назад до додаткових опцій")]
-        ], resize_keyboard=True)
+        reply_markup=SHARED_BACK_TO_OPTIONS_KEYBOARD
     )
 
 
@@ -618,10 +569,7 @@ async def shared_handle_member_input(update: Update, context: ContextTypes.DEFAU
         return False
 
 
-    user = db.cursor.execute(
-        "SELECT * FROM users WHERE username = ?", 
-        (username,)
-    ).fetchone()
+    user = db.get_user_by_username(username)
 
     if not user:
         await update.message.reply_text(
@@ -650,7 +598,8 @@ async def shared_handle_member_input(update: Update, context: ContextTypes.DEFAU
         ''',
         (album_id, user['user_id'])
     )
-    db.conn.commit()
+    db.commit()
+    db.invalidate_album_acl(album_id)
 
     ud['shared_awaiting_member'] = False
 
@@ -734,8 +683,8 @@ async def shared_handle_role_text_input(update: Update, context: ContextTypes.DE
         SELECT u.user_id, u.username, u.first_name
         FROM users u
         JOIN shared_albums sa ON u.user_id = sa.user_id
-        WHERE sa.album_id = ? AND (u.username = ? OR u.first_name = ?)
-    """, (album_id, username, username)).fetchone()
+        WHERE sa.album_id = ? AND (u.username_lower = ? OR u.first_name = ?)
+    """, (album_id, username.lower(), username)).fetchone()
     
     if not user:
         await update.message.reply_text("❌ Учасника не знайдено. Спробуйте ще раз або натисніть «Назад».")
@@ -818,7 +767,8 @@ async def shared_set_role(update: Update, context: ContextTypes.DEFAULT_TYPE):
         SET access_level = ? 
         WHERE album_id = ? AND user_id = ?
     ''', (new_role, album_id, target_user_id))
-    db.conn.commit()
+    db.commit()
+    db.invalidate_album_acl(album_id)
     
     user = db.cursor.execute(
         "SELECT first_name, username FROM users WHERE user_id = ?",
@@ -891,8 +841,8 @@ async def shared_handle_remove_selection(update: Update, context: ContextTypes.D
             SELECT u.user_id
             FROM users u
             JOIN shared_albums sa ON u.user_id = sa.user_id
-            WHERE sa.album_id = ? AND (u.first_name = ? OR u.username = ?)
-        """, (album_id, name_part, name_part)).fetchone()
+            WHERE sa.album_id = ? AND (u.first_name = ? OR u.username_lower = ?)
+        """, (album_id, name_part, name_part.lower())).fetchone()
         
         if user:
             await shared_confirm_remove_member(update, context, user['user_id'])
@@ -928,7 +878,8 @@ async def handle_shared_member_delete_callback(update: Update, context: ContextT
                 "DELETE FROM shared_albums WHERE album_id = ? AND user_id = ? AND access_level != 'owner'",
                 (album_id, target_user_id),
             )
-            db.conn.commit()
+            db.commit()
+            db.invalidate_album_acl(album_id)
         await query.message.reply_text("✅ Учасника видалено з альбому!")
         access_level = context.user_data.get('shared_access_level')
         if album_id and access_level:
@@ -954,10 +905,7 @@ async def shared_confirm_remove_member(update: Update, context: ContextTypes.DEF
     
     await update.message.reply_text(
         f"🗑 Видалити учасника **{name}** з альбому?",
-        reply_markup=ReplyKeyboardMarkup([
-            [KeyboardButton("✅ Так, видалити")],
-            [KeyboardButton("❌ Ні, скасувати")]
-        ], resize_keyboard=True),
+        reply_markup=CONFIRM_DELETE_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -975,7 +923,8 @@ async def shared_handle_remove_confirmation(update: Update, context: ContextType
             "DELETE FROM shared_albums WHERE album_id = ? AND user_id = ?",
             (album_id, target_user_id)
         )
-        db.conn.commit()
+        db.commit()
+        db.invalidate_album_acl(album_id)
         
         await update.message.reply_text("✅ Учасника видалено з альбому!")
         
@@ -1026,11 +975,10 @@ async def shared_handle_members_navigation(update: Update, context: ContextTypes
         context.user_data['shared_in_members_main'] = False
         context.user_data['shared_in_additional'] = True
         
-        additional_buttons = _shared_additional_buttons(access_level)
         
         await update.message.reply_text(
             f"📋 **Додаткові опції**\n\nОберіть потрібну дію:",
-            reply_markup=ReplyKeyboardMarkup(additional_buttons, resize_keyboard=True),
+            reply_markup=shared_album_additional_keyboard(access_level),
             parse_mode='Markdown'
         )
         return True
@@ -1066,11 +1014,10 @@ async def shared_handle_all_buttons(update: Update, context: ContextTypes.DEFAUL
         ud['shared_in_additional'] = True
         # Показуємо додаткове меню
         access_level = ud.get('shared_access_level')
-        additional_buttons = _shared_additional_buttons(access_level)
         
         await update.message.reply_text(
             f"📋 **Додаткові опції**\n\nОберіть потрібну дію:",
-            reply_markup=ReplyKeyboardMarkup(additional_buttons, resize_keyboard=True),
+            reply_markup=shared_album_additional_keyboard(access_level),
             parse_mode='Markdown'
         )
         return True
@@ -1164,8 +1111,7 @@ async def shared_handle_all_buttons(update: Update, context: ContextTypes.DEFAUL
 
 async def shared_start_delete_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, album_id):
     """Запуск меню видалення файлів для спільного альбому з префіксом 'Видалити:'"""
-    files = db.get_album_files(album_id)
-    total_files = len(files)
+    total_files = db.count_album_files(album_id)
     
     text = (
         f"🗑 **Меню видалення файлів (Спільний альбом)**\n\n"
@@ -1174,13 +1120,7 @@ async def shared_start_delete_menu(update: Update, context: ContextTypes.DEFAULT
     )
     
     # Використовуємо префікс "Надіслати:", щоб відрізнити від звичайного меню
-    delete_keyboard = ReplyKeyboardMarkup([
-        [KeyboardButton("Надіслати: Весь альбом")],
-        [KeyboardButton("Надіслати: Останні"), KeyboardButton("Надіслати: Перші")],
-        [KeyboardButton("Надіслати: Проміжок")],
-        [KeyboardButton("Надіслати: За датою")],
-        [KeyboardButton("◀️ Назад до альбому")]
-    ], resize_keyboard=True)
+    delete_keyboard = ALBUM_DELETE_KEYBOARD
     
     context.user_data['shared_in_delete_menu'] = True
     context.user_data['shared_delete_album_id'] = album_id
@@ -1245,15 +1185,11 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
     if not album_id: 
         return False
         
-    all_files = db.get_album_files(album_id)
-    # Перетворюємо в список словників
-    all_files = [dict(f) for f in all_files]
-
     try:
         # 1. Останні
         if ud.get('shared_del_awaiting_recent'):
             count = int(text)
-            selected = list(enumerate(all_files, 1))[-count:]
+            selected = [(f['ordinal'], f) for f in db.get_last_files(album_id, count)]
             await update.message.reply_text(f"📤 Надсилаю останні {len(selected)} файлів...")
             for idx, f in selected: 
                 await send_shared_file_for_deletion(update, context, f, idx)
@@ -1263,7 +1199,7 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
         # 2. Перші
         if ud.get('shared_del_awaiting_first'):
             count = int(text)
-            selected = list(enumerate(all_files, 1))[:count]
+            selected = [(f['ordinal'], f) for f in db.get_first_files(album_id, count)]
             await update.message.reply_text(f"📤 Надсилаю перші {len(selected)} файлів...")
             for idx, f in selected: 
                 await send_shared_file_for_deletion(update, context, f, idx)
@@ -1273,13 +1209,14 @@ async def shared_handle_del_inputs(update: Update, context: ContextTypes.DEFAULT
         # 3. Проміжок
         if ud.get('shared_del_awaiting_range'):
             start, end = map(int, text.split('-'))
-            if start < 1 or end > len(all_files) or start > end:
-                await update.message.reply_text(f"❌ Невірний проміжок. Всього файлів: {len(all_files)}")
+            total_files = db.count_album_files(album_id)
+            if start < 1 or end > total_files or start > end:
+                await update.message.reply_text(f"❌ Невірний проміжок. Всього файлів: {total_files}")
                 return True
-            selected = all_files[start-1:end]
+            selected = db.get_files_range(album_id, start, end)
             await update.message.reply_text(f"📤 Надсилаю файли з {start} по {end}...")
-            for i, f in enumerate(selected): 
-                await send_shared_file_for_deletion(update, context, f, start+i)
+            for f in selected: 
+                await send_shared_file_for_deletion(update, context, f, f['ordinal'])
             ud['shared_del_awaiting_range'] = False
             return True
             
@@ -1357,16 +1294,8 @@ async def handle_shared_delete_callback(update: Update, context: ContextTypes.DE
     
     try:
         # Видаляємо файл з бази даних - використовуємо file_id як ключ
-        db.cursor.execute("DELETE FROM files WHERE file_id = ?", (file_id_db,))
-        db.conn.commit()
-        
-        # Оновлюємо лічильник файлів в альбомі
-        db.cursor.execute("""
-            UPDATE albums 
-            SET files_count = (SELECT COUNT(*) FROM files WHERE album_id = ?)
-            WHERE album_id = ?
-        """, (album_id, album_id))
-        db.conn.commit()
+        # (лічильник і нумерація файлів в альбомі оновлюються там же)
+        db.delete_file(file_id_db)
         
         # Повідомлення з файлом є медіа, тому редагуємо підпис, а не текст.
         # Reply-клавіатуру меню (Надіслати весь / останні / проміжок / за датою) НЕ змінюємо.
@@ -1384,10 +1313,7 @@ async def shared_archive_confirm(update: Update, context: ContextTypes.DEFAULT_T
     await update.message.reply_text(
         f"🗂 Архівувати альбом '{album['name']}'?\n\n"
         f"Архівовані альбоми не показуються в списку, але файли зберігаються.",
-        reply_markup=ReplyKeyboardMarkup([
-            [KeyboardButton("✅ Так, архівувати")],
-            [KeyboardButton("❌ Ні, скасувати")]
-        ], resize_keyboard=True)
+        reply_markup=CONFIRM_ARCHIVE_KEYBOARD
     )
     
     context.user_data['shared_awaiting_archive'] = album_id
@@ -1436,9 +1362,7 @@ async def shared_delete_confirm(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text(
         f"🗑 **Видалення альбому**\n\n"
         f"Для підтвердження введіть назву альбому:",
-        reply_markup=ReplyKeyboardMarkup([
-            [KeyboardButton("◀️ Назад до додаткових опцій")]
-        ], resize_keyboard=True),
+        reply_markup=SHARED_BACK_TO_OPTIONS_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -1463,7 +1387,7 @@ async def shared_handle_delete_confirmation(update: Update, context: ContextType
         return True
     
     if user_input == correct_name:
-        db.delete_album(album_id)
+        await adb.write(Database.delete_album, album_id)
         
         context.user_data.pop('shared_awaiting_delete_confirm', None)
         context.user_data.pop('shared_deleting_album', None)
@@ -1525,13 +1449,8 @@ async def shared_handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE)
     album_id = ud.get('current_shared_album')
     user_id = update.effective_user.id
     
-    # Перевірка прав
-    access = db.cursor.execute(
-        "SELECT access_level FROM shared_albums WHERE album_id = ? AND user_id = ?",
-        (album_id, user_id)
-    ).fetchone()
-    
-    if not access or access['access_level'] not in ['owner', 'admin', 'editor', 'contributor']:
+    # Перевірка прав (з кешу прав доступу, без запиту на кожен файл)
+    if not db.album_caps(album_id, user_id) & CAN_UPLOAD:
         await update.message.reply_text("❌ У вас немає прав на додавання файлів.")
         return True
     
@@ -1549,8 +1468,15 @@ async def shared_handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         return False # Пропускаємо текст
     
-    # Зберігаємо в базу
-    db.add_file(album_id, file_id, file_type, file_name, file_size, user_id)
+    # Зберігаємо в базу через чергу прийому (медіагрупа — одним пакетом)
+    saved = await ingest.add(
+        album_id, file_id, file_type, file_name, file_size, user_id,
+        origin_chat_id=update.effective_chat.id,
+        origin_message_id=update.message.message_id
+    )
+    if saved is None:
+        await update.message.reply_text("❌ Не вдалося зберегти файл. Спробуйте ще раз.")
+        return True
     
     # ГРУПУВАННЯ ПІДТВЕРДЖЕНЬ (щоб не спамити при завантаженні альбому)
     media_group_id = update.message.media_group_id
@@ -1588,20 +1514,16 @@ async def shared_send_all(update: Update, context: ContextTypes.DEFAULT_TYPE, al
     # Отримуємо налаштування для підписів
     settings = helpers.get_user_display_settings(db, user_id)
     
-    await update.message.reply_text(f"📤 Надсилаю всі {len(files)} файлів з альбому '{album['name']}'...")
-    
-    # ЦИКЛ З НОМЕРАЦІЄЮ
-    for idx, file in enumerate(files, 1):
-        # Тепер ця функція НЕ видасть помилку, бо ми її оновили вище
-        await send_file_by_type_shared(
-            update, 
-            context, 
-            file, 
-            index=idx, 
-            settings=settings
-        )
-    
-    await update.message.reply_text("✅ Готово!")
+    # Нумерація з 1; надсилання йде у фоні (прогрес, скасування, черга на користувача)
+    await send_jobs.submit(
+        update,
+        context,
+        files,
+        f"📤 Надсилаю всі {len(files)} файлів з альбому '{album['name']}'...",
+        settings=settings,
+        start_index=1,
+        sender='shared'
+    )
     return True
 
 async def shared_send_recent_start(update: Update, context: ContextTypes.DEFAULT_TYPE, album_id):
@@ -1646,23 +1568,17 @@ async def shared_handle_recent_count(update: Update, context: ContextTypes.DEFAU
         album_id = ud.get('shared_send_recent_album')
         user_id = update.effective_user.id # Для налаштувань
         
-        all_files = db.get_album_files(album_id)
-        album = db.get_album(album_id)
+        # Беремо файли з їхніми "глобальними" номерами в альбомі (колонка ordinal)
+        selected = db.get_last_files(album_id, count)
         settings = helpers.get_user_display_settings(db, user_id) # Отримуємо галочки
         
-        if not all_files:
+        if not selected:
             await update.message.reply_text("📭 В альбомі немає файлів.")
         else:
-            total = len(all_files)
-            start_idx = max(0, total - count)
-            # Беремо файли з їхніми "глобальними" номерами в альбомі
-            selected_with_idx = list(enumerate(all_files, 1))[start_idx:]
-            
-            await update.message.reply_text(f"📤 Надсилаю останні {len(selected_with_idx)} файлів...")
-            
-            for idx, file in selected_with_idx:
-                # Передаємо і індекс, і налаштування
-                await send_file_by_type_shared(update, context, file, index=idx, settings=settings)
+            await send_jobs.submit(
+                update, context, selected, f"📤 Надсилаю останні {len(selected)} файлів...",
+                settings=settings, sender='shared', done_text=None
+            )
         
         ud.pop('shared_awaiting_recent_count', None)
         ud.pop('shared_send_recent_album', None)
@@ -1706,16 +1622,16 @@ async def shared_handle_first_count(update: Update, context: ContextTypes.DEFAUL
         album_id = ud.get('shared_send_first_album')
         user_id = update.effective_user.id
         
-        all_files = db.get_album_files(album_id)
+        selected = db.get_first_files(album_id, count)
         settings = helpers.get_user_display_settings(db, user_id)
         
-        selected = all_files[:count]
         if not selected:
             await update.message.reply_text("📭 В альбомі немає файлів.")
         else:
-            await update.message.reply_text(f"📤 Надсилаю перші {len(selected)} файлів...")
-            for idx, file in enumerate(selected, 1):
-                await send_file_by_type_shared(update, context, file, index=idx, settings=settings)
+            await send_jobs.submit(
+                update, context, selected, f"📤 Надсилаю перші {len(selected)} файлів...",
+                settings=settings, sender='shared', done_text=None
+            )
         
         ud.pop('shared_awaiting_first_count', None)
         ud.pop('shared_send_first_album', None)
@@ -1761,21 +1677,20 @@ async def shared_handle_range_input(update: Update, context: ContextTypes.DEFAUL
         album_id = ud.get('shared_send_range_album')
         user_id = update.effective_user.id
         
-        all_files = db.get_album_files(album_id)
         settings = helpers.get_user_display_settings(db, user_id)
-        total = len(all_files)
+        total = db.count_album_files(album_id)
         
         if start > total:
             await update.message.reply_text(f"❌ В альбомі всього {total} файлів.")
             return True
         
         end = min(end, total)
-        selected = all_files[start-1:end]
+        selected = db.get_files_range(album_id, start, end)
         
-        await update.message.reply_text(f"📤 Надсилаю файли з {start} по {end}...")
-        for i, file in enumerate(selected):
-            # Реальний індекс = початок проміжку + номер у зрізі
-            await send_file_by_type_shared(update, context, file, index=start+i, settings=settings)
+        await send_jobs.submit(
+            update, context, selected, f"📤 Надсилаю файли з {start} по {end}...",
+            settings=settings, sender='shared', done_text=None
+        )
         
         ud.pop('shared_awaiting_range', None)
         ud.pop('shared_send_range_album', None)
@@ -1810,28 +1725,23 @@ async def shared_handle_date_input(update: Update, context: ContextTypes.DEFAULT
         return False
 
     try:
-        from datetime import datetime
-        datetime.strptime(text, '%Y-%m-%d')
+        date_from, date_to = helpers.parse_date_range(text)
+        date_str = helpers.date_range_label(date_from, date_to)
         
         album_id = ud.get('shared_send_date_album')
         user_id = update.effective_user.id
         
-        all_files = db.get_album_files(album_id)
+        # Файли за датою разом з їх "глобальним" номером в альбомі (ordinal)
+        to_send = db.get_files_by_date(album_id, date_from, date_to)
         settings = helpers.get_user_display_settings(db, user_id)
         
-        # Шукаємо файли за датою, зберігаючи їх "глобальний" номер idx
-        to_send = []
-        for idx, file in enumerate(all_files, 1):
-            file_date = str(file.get('added_at') or file.get('created_at'))
-            if file_date.startswith(text):
-                to_send.append((idx, file))
-        
         if not to_send:
-            await update.message.reply_text(f"📭 Немає файлів за {text}")
+            await update.message.reply_text(f"📭 Немає файлів за {date_str}")
         else:
-            await update.message.reply_text(f"📤 Надсилаю {len(to_send)} файлів за {text}...")
-            for idx, file in to_send:
-                await send_file_by_type_shared(update, context, file, index=idx, settings=settings)
+            await send_jobs.submit(
+                update, context, to_send, f"📤 Надсилаю {len(to_send)} файлів за {date_str}...",
+                settings=settings, sender='shared', done_text=None
+            )
         
         ud.pop('shared_awaiting_date', None)
         ud.pop('shared_send_date_album', None)
@@ -1883,6 +1793,10 @@ async def send_file_by_type_shared(update: Update, context: ContextTypes.DEFAULT
         print(f"❌ Помилка: {e}")
 
 
+# Фонові надсилання зберігають назву функції надсилання — для відновлення після перезапуску
+SENDERS['shared'] = send_file_by_type_shared
+
+
 async def shared_handle_main_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник основних кнопок спільного альбому"""
 
@@ -0,0 +1,32 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from setup_db import HOT_QUERIES, explain_hot_queries
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_do_not_scan(conn):
+    plans = {name: (plan, ok) for name, plan, ok in explain_hot_queries(conn)}
+    assert set(plans) == {name for name, _, _ in HOT_QUERIES}
+    scans = {name: plan for name, (plan, ok) in plans.items() if not ok}
+    assert not scans, f"Гарячі запити з SCAN: {scans}"
+
+
+def test_covering_index_scan_is_reported(conn, monkeypatch):
+    # Без умови на ключ SQLite проходить увесь покривний індекс — це теж провал
+    monkeypatch.setattr(
+        "setup_db.HOT_QUERIES",
+        [("usernames", "SELECT username_lower FROM users ORDER BY username_lower", ())],
+    )
+    [(_, plan, ok)] = explain_hot_queries(conn)
+    assert any(detail.startswith("SCAN") and "COVERING INDEX" in detail for detail in plan)
+    assert not ok